@@ -0,0 +1,2 @@
+"""Benchmarks package provides a synthetic workload generator and a phase timing runner for the LTL
+contract checker tool"""
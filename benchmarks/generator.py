@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Generator module writes synthetic system specification files for benchmarking the LTL contract
+checker tool"""
+
+import random
+
+# generator attributes
+VARIABLE_PREFIX = 'v'
+CONTRACT_PREFIX = 'c'
+UNARY_OPS = ('X', 'F', 'G', '!')
+BINARY_OPS = ('&', '|', '->', 'U')
+
+class Generator(object):
+    """Generator class builds random contract systems with a controlled size and shape
+
+    Variables in the shared pool belong to every contract, the remaining variables of the alphabet
+    are dealt round robin as private variables of single contracts.
+
+    Attributes:
+        contracts: an integer number of contracts
+        alphabet: an integer number of variables in the system
+        guarantees: an integer number of guarantees per contract
+        depth: an integer nesting depth of temporal and boolean operators in every formula
+        sharing: a float fraction of the alphabet shared by every contract, between 0 and 1
+        seed: an integer seed of the random number generator
+    """
+    def __init__(self, contracts=4, alphabet=8, guarantees=2, depth=2, sharing=0.5, seed=0):
+        """Initialize a generator object"""
+        self.contracts = contracts
+        self.alphabet = alphabet
+        self.guarantees = guarantees
+        self.depth = depth
+        self.sharing = sharing
+        self.seed = seed
+
+    def variables(self):
+        """Get the variables of every contract
+
+        Returns:
+            A list containing a list of (variable, initial value) tuples per contract
+        """
+        rand = random.Random(self.seed)
+        names = [VARIABLE_PREFIX + str(num) for num in range(self.alphabet)]
+        inits = dict([(name, rand.choice(['TRUE', 'FALSE'])) for name in names])
+        shared = int(round(self.sharing * self.alphabet))
+        variables = [names[:shared] for _ in range(self.contracts)]
+        for num, name in enumerate(names[shared:]):
+            variables[num % self.contracts].append(name)
+        for num, contract in enumerate(variables):
+            if not contract: # fewer variables than contracts
+                contract.append(names[num % self.alphabet])
+        return [[(name, inits[name]) for name in contract] for contract in variables]
+
+    def formula(self, rand, names, depth):
+        """Returns a random LTL formula string of a given depth over some variables"""
+        if depth == 0:
+            return rand.choice(['', '!']) + rand.choice(names)
+        op = rand.choice(UNARY_OPS + BINARY_OPS)
+        if op in UNARY_OPS:
+            return op + '(' + self.formula(rand, names, depth - 1) + ')'
+        args = [self.formula(rand, names, depth - 1),
+                self.formula(rand, names, rand.randint(0, depth - 1))]
+        rand.shuffle(args)
+        return '(' + args[0] + ' ' + op + ' ' + args[1] + ')'
+
+    def checks(self):
+        """Get the checks of the system
+
+        Compositions and conjunctions grow over prefixes of the contract list, so the report shows
+        where their cost starts to blow up.
+
+        Returns:
+            A list of string check lines
+        """
+        names = [CONTRACT_PREFIX + str(num) for num in range(self.contracts)]
+        lines = []
+        for size in range(2, self.contracts + 1):
+            lines.append('COMPATIBILITY_COMP(' + ', '.join(names[:size]) + ')')
+            lines.append('CONSISTENCY_COMP(' + ', '.join(names[:size]) + ')')
+        if self.contracts > 1:
+            lines.append('CONSISTENCY_CONJ(' + ', '.join(names) + ')')
+            lines.append('REFINEMENT(' + names[0] + ', ' + names[1] + ')')
+        return lines
+
+    def text(self):
+        """Returns the system specification text in the format read by core.parse"""
+        rand = random.Random(self.seed + 1)
+        lines = ['## COMMENTS', '##   Synthetic system: ' + repr(self), '']
+        for num, variables in enumerate(self.variables()):
+            names = [name for name, _ in variables]
+            lines.extend(['CONTRACT:', '\tNAME:', '\t\t' + CONTRACT_PREFIX + str(num),
+                          '\tVARIABLES:'])
+            lines.extend(['\t\t' + name + ' := ' + init for name, init in variables])
+            lines.extend(['\tASSUMPTIONS:',
+                          '\t\tG(' + self.formula(rand, names, max(self.depth - 1, 0)) + ')',
+                          '\tGUARANTEES:'])
+            lines.extend(['\t\tG(' + self.formula(rand, names, self.depth) + ')'
+                          for _ in range(self.guarantees)])
+            lines.append('')
+        lines.append('CHECKS:')
+        lines.extend(['\t' + check for check in self.checks()])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, specfile):
+        """Writes the system specification to a file
+
+        Args:
+            specfile: a string output file name
+        """
+        with open(specfile, 'w') as ofile:
+            ofile.write(self.text())
+
+    def __repr__(self):
+        """Returns the parameters of the generator"""
+        return 'Generator(contracts=%d, alphabet=%d, guarantees=%d, depth=%d, sharing=%s, ' \
+               'seed=%d)' % (self.contracts, self.alphabet, self.guarantees, self.depth,
+                             self.sharing, self.seed)
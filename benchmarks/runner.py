@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""Runner module times the parse, generate and run phases of the LTL contract checker tool over a
+suite of synthetic systems and compares them against a stored baseline"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import tempfile
+from StringIO import StringIO
+from src import core, formula
+from benchmarks.generator import Generator
+
+# runner attributes
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TOLERANCE = 1.25
+MIN_DELTA = 0.01
+SIZE_TOLERANCE = 1.02
+PHASES = ('parse', 'generate', 'run')
+SIZES = ('contracts', 'checks', 'variables', 'formula_nodes', 'max_spec_length', 'smv_bytes')
+
+# benchmark suite, each sweep varies one generator parameter
+SUITE = [('contracts_' + str(num), Generator(contracts=num, alphabet=16))
+         for num in (2, 4, 8, 16)] + \
+        [('depth_' + str(num), Generator(contracts=4, alphabet=16, depth=num))
+         for num in (1, 2, 3, 4)] + \
+        [('sharing_' + str(num), Generator(contracts=4, alphabet=16, sharing=num / 4.0))
+         for num in (0, 2, 4)] + \
+        [('guarantees_' + str(num), Generator(contracts=4, alphabet=16, guarantees=num))
+         for num in (1, 4, 16)]
+
+def measure(generator, workdir, engine=core.NUSMV_ENGINE, checking=True, repeat=1):
+    """Times every phase of the tool on one synthetic system and records its sizes
+
+    Args:
+        generator: a generator object of the system
+        workdir: a string directory for the specification and NuSMV files
+        engine: a string model checking engine, one of core.ENGINES
+        checking: a boolean indicating if the run phase is timed
+        repeat: an integer number of repetitions, the fastest one is kept
+
+    Returns:
+        A dictionary from metric names to values
+    """
+    specfile = os.path.join(workdir, 'system.spec')
+    smvfile = os.path.join(workdir, 'nusmv.smv')
+    generator.write(specfile)
+    times = dict([(phase, None) for phase in PHASES])
+
+    def timed(phase, function, *args, **kwargs):
+        """Calls a function and keeps its fastest wall time"""
+        start = time.time()
+        value = function(*args, **kwargs)
+        elapsed = time.time() - start
+        times[phase] = elapsed if times[phase] is None else min(times[phase], elapsed)
+        return value
+
+    for _ in range(repeat):
+        contracts, checks = timed('parse', core.parse, specfile)
+        smvfiles = timed('generate', core.generate, contracts, checks, smvfile)
+        if checking:
+            stdout, sys.stdout = sys.stdout, StringIO() # drop the report
+            try:
+                results = timed('run', core.run, smvfiles, checks, engine=engine)[0]
+            finally:
+                sys.stdout = stdout
+
+    specs = [check.get_formula() for check in checks.checks]
+    metrics = {'parameters': repr(generator),
+               'contracts': len(contracts.get_contracts()),
+               'checks': len(checks.checks),
+               'variables': len(contracts.get_alphabet()),
+               'formula_nodes': len(formula.nodes(specs)),
+               'max_spec_length': max([len(formula.to_str(spec)) for spec in specs]),
+               'smv_bytes': sum([os.path.getsize(afile) for afile in smvfiles]),
+               'results': results if checking else None}
+    for phase in PHASES:
+        metrics[phase + '_seconds'] = times[phase]
+    return metrics
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Compares the metrics of a suite run against a baseline
+
+    Args:
+        current: a dictionary from case names to metrics dictionaries
+        baseline: a dictionary from case names to metrics dictionaries
+        tolerance: a float ratio of a phase time to its baseline above which it regressed
+
+    Returns:
+        A list of string regression messages, empty when nothing regressed
+    """
+    regressions = []
+    for name in sorted(set(current) & set(baseline)):
+        new, old = current[name], baseline[name]
+        for size in SIZES:
+            if new[size] > old[size] * SIZE_TOLERANCE:
+                regressions.append('%s: %s grew from %s to %s' % (name, size, old[size],
+                                                                 new[size]))
+        if new['results'] is not None and old['results'] is not None and \
+           new['results'] != old['results']:
+            regressions.append('%s: results changed from %s to %s' % (name, old['results'],
+                                                                     new['results']))
+        for phase in PHASES:
+            key = phase + '_seconds'
+            if new[key] is not None and old[key] is not None and \
+               new[key] > old[key] * tolerance and new[key] - old[key] > MIN_DELTA:
+                regressions.append('%s: %s took %.3fs, baseline %.3fs' % (name, phase, new[key],
+                                                                          old[key]))
+    return regressions
+
+def report(current, baseline=None):
+    """Prints a table of the phase times and sizes of every case, with ratios to the baseline"""
+    print 'CASE'.ljust(16), ''.join([phase.upper().rjust(18) for phase in PHASES]), \
+          'NODES'.rjust(8), 'SPEC'.rjust(8), 'SMV'.rjust(10)
+    for name in [case for case, _ in SUITE if case in current]:
+        metrics = current[name]
+        columns = []
+        for phase in PHASES:
+            seconds = metrics[phase + '_seconds']
+            column = '-' if seconds is None else '%.3fs' % seconds
+            old = baseline.get(name, {}).get(phase + '_seconds') if baseline else None
+            if seconds is not None and old:
+                column += ' (x%.2f)' % (seconds / old)
+            columns.append(column.rjust(18))
+        print name.ljust(16), ''.join(columns), str(metrics['formula_nodes']).rjust(8), \
+              str(metrics['max_spec_length']).rjust(8), str(metrics['smv_bytes']).rjust(10)
+
+def main():
+    """Parses command line arguments and runs the benchmark suite"""
+
+    # initialize default command line values
+    baseline_file = BASELINE_FILE
+    output_file = None
+    engine = core.NUSMV_ENGINE
+    checking = True
+    save = False
+    repeat = 1
+    tolerance = TOLERANCE
+    cases = []
+
+    # configure command line short-form and long-form options
+    options, _ = getopt.getopt(sys.argv[1:], 'ho:b:r:c:',
+                               ['output=', 'baseline=', 'engine=', 'no-run', 'save', 'repeat=',
+                                'tolerance=', 'case='])
+
+    # parse command line arguments
+    for opt, arg in options:
+        if opt == '-h':
+            print 'python -m benchmarks.runner [-o <jsonfile>] [-b <baselinefile>] [--save]', \
+                  '[--engine ' + '|'.join(core.ENGINES) + '] [--no-run] [-r <repeat>]', \
+                  '[--tolerance <ratio>] [-c <case>]'
+            sys.exit()
+        elif opt in ('-o', '--output'):
+            output_file = arg
+        elif opt in ('-b', '--baseline'):
+            baseline_file = arg
+        elif opt == '--engine':
+            engine = arg
+        elif opt == '--no-run':
+            checking = False
+        elif opt == '--save':
+            save = True
+        elif opt in ('-r', '--repeat'):
+            repeat = int(arg)
+        elif opt == '--tolerance':
+            tolerance = float(arg)
+        elif opt in ('-c', '--case'):
+            cases.append(arg)
+
+    # run every selected case in its own scratch directory
+    current = {}
+    for name, generator in SUITE:
+        if cases and name not in cases:
+            continue
+        workdir = tempfile.mkdtemp()
+        try:
+            current[name] = measure(generator, workdir, engine, checking, repeat)
+        finally:
+            shutil.rmtree(workdir)
+
+    baseline = None
+    if os.path.isfile(baseline_file) and not save:
+        with open(baseline_file, 'r') as ifile:
+            baseline = json.load(ifile)
+    report(current, baseline)
+
+    if output_file:
+        with open(output_file, 'w') as ofile:
+            json.dump(current, ofile, indent=2, sort_keys=True, separators=(',', ': '))
+    if save:
+        with open(baseline_file, 'w') as ofile:
+            json.dump(current, ofile, indent=2, sort_keys=True, separators=(',', ': '))
+        print 'Saved baseline', baseline_file
+    elif baseline:
+        regressions = compare(current, baseline, tolerance)
+        for regression in regressions:
+            print 'REGRESSION', regression
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""Batch module defines a batch run which checks many system specification files in one worker pool
+and streams a JSON record per check"""
+
+import os
+import sys
+import json
+import glob
+import time
+import getopt
+import shutil
+import tempfile
+import subprocess
+from collections import OrderedDict
+from core import parse, generate, iter_run, ParseError, NUSMV_ENGINE, ENGINES
+from matrix import refinement_order
+from cache import ResultCache, SpecCache, CACHE_DIR
+from metrics import Metrics
+
+# batch attributes
+SPEC_EXTS = ('.txt', '.spec')
+SMV_NAME = 'nusmv.smv'
+EXIT_PASSED = 0
+EXIT_FAILED = 1
+EXIT_ERROR = 2
+
+class Batch(object):
+    """Batch class checks the specifications of many files as one list of NuSMV files
+
+    Every file is parsed and split into one NuSMV file per check in its own scratch directory, and
+    the NuSMV files of all specifications are run by a single worker pool.
+
+    Attributes:
+        specfiles: a list of string system specification file names
+        workdir: a string scratch directory for the generated NuSMV files
+        jobs: an integer number of NuSMV processes to run in parallel
+        cache: an optional result cache object
+        spec_cache: an optional spec cache object
+        engine: a string model checking engine
+        owners: a list of tuples containing the file name and check object of every NuSMV file
+        matrices: a list of tuples containing the file name, contracts object, refinement matrix
+            check object and NuSMV file name of every refinement matrix
+        summary: an ordered dictionary of counts and times aggregated over all records, with
+            the number of checks answered by the NuSMV file of an identical earlier check
+    """
+    def __init__(self, specfiles, workdir, jobs=1, cache=None, spec_cache=None,
+                 engine=NUSMV_ENGINE):
+        """Initialize a batch object"""
+        self.specfiles = specfiles
+        self.workdir = workdir
+        self.jobs = jobs
+        self.cache = cache
+        self.spec_cache = spec_cache
+        self.engine = engine
+        self.owners = []
+        self.matrices = []
+        self.summary = OrderedDict([('specs', len(specfiles)), ('checks', 0), ('passed', 0),
+                                    ('failed', 0), ('errors', 0), ('duplicates', 0),
+                                    ('seconds', 0.0)])
+
+    def run(self, ofile):
+        """Checks every specification and writes one JSON line per check as its verdict is known
+
+        A specification which cannot be parsed gets a single record with its error instead. The
+        refinement matrices are computed after the other checks, with one record per pair.
+
+        Args:
+            ofile: a file object the JSON lines are written to
+
+        Returns:
+            An integer exit status, EXIT_ERROR if a specification or NuSMV run failed, else
+            EXIT_FAILED if a check does not hold, else EXIT_PASSED
+        """
+        start = time.time()
+        smvfiles = []
+        for num, specfile in enumerate(self.specfiles):
+            try:
+                contracts, checks = parse(specfile, self.spec_cache)
+            except (ParseError, IOError) as error:
+                self._error(ofile, specfile, error)
+                continue
+            root = os.path.splitext(os.path.basename(specfile))[0]
+            scratch = os.path.join(self.workdir, str(num) + '_' + root)
+            if not os.path.isdir(scratch):
+                os.makedirs(scratch)
+            smvfiles.extend(generate(contracts, checks, os.path.join(scratch, SMV_NAME),
+                                     split=True))
+            self.owners.extend([(specfile, check) for check in checks.checks])
+            self.matrices.extend([(specfile, contracts, matrix, os.path.join(scratch, SMV_NAME))
+                                  for matrix in checks.matrices])
+
+        # the record of a check is written once the metrics of its NuSMV file are recorded
+        metrics, pending, last = Metrics(), [], time.time()
+        try:
+            for num, result, _, _ in iter_run(smvfiles, self.jobs, self.cache, self.engine,
+                                           metrics=metrics):
+                self._flush(ofile, metrics, pending)
+                pending.append((num, result, time.time() - last))
+                last = time.time()
+            self._flush(ofile, metrics, pending)
+        except (subprocess.CalledProcessError, OSError, RuntimeError) as error:
+            self._error(ofile, self.owners[len(metrics.files)][0], error)
+        for specfile, contracts, matrix, smvfile in self.matrices:
+            try:
+                order = refinement_order(contracts, matrix, smvfile, self.jobs, self.cache,
+                                         self.engine)
+            except (subprocess.CalledProcessError, OSError, RuntimeError) as error:
+                self._error(ofile, specfile, error)
+                continue
+            self._pairs(ofile, specfile, matrix, order, time.time() - last)
+            last = time.time()
+        self.summary['seconds'] = time.time() - start
+
+        if self.summary['errors']:
+            return EXIT_ERROR
+        return EXIT_FAILED if self.summary['failed'] else EXIT_PASSED
+
+    def _flush(self, ofile, metrics, pending):
+        """Writes the records of the pending results whose NuSMV files finished"""
+        while pending and pending[0][0] < len(metrics.files):
+            num, result, seconds = pending.pop(0)
+            specfile, check = self.owners[num]
+            verdict = not result if check.check_type == 'refinement' else result
+            self.summary['checks'] += 1
+            self.summary['passed' if verdict else 'failed'] += 1
+            self.summary['duplicates'] += metrics.files[num]['duplicate']
+            _write(ofile, OrderedDict([('spec', specfile), ('check', str(check)),
+                                       ('verdict', verdict), ('seconds', seconds),
+                                       ('cpu_seconds', metrics.files[num]['cpu_seconds']),
+                                       ('cached', metrics.files[num]['cached']),
+                                       ('duplicate', metrics.files[num]['duplicate'])]))
+
+    def _pairs(self, ofile, specfile, matrix, order, seconds):
+        """Writes the records of the pairs of a refinement matrix, the time on its first pair"""
+        for aname in order.names:
+            for bname in order.names:
+                if aname == bname:
+                    continue
+                verdict = order.refines[(aname, bname)]
+                self.summary['checks'] += 1
+                self.summary['passed' if verdict else 'failed'] += 1
+                _write(ofile, OrderedDict([('spec', specfile),
+                                           ('check', str(matrix.get_pair(aname, bname))),
+                                           ('verdict', verdict), ('seconds', seconds),
+                                           ('implied', (aname, bname) in order.implied)]))
+                seconds = 0.0
+
+    def _error(self, ofile, specfile, error):
+        """Writes the record of a specification which could not be checked"""
+        self.summary['errors'] += 1
+        _write(ofile, OrderedDict([('spec', specfile), ('error', str(error))]))
+
+def find_specs(paths):
+    """Expands directories and glob patterns into system specification file names
+
+    Args:
+        paths: a list of string file names, directories searched recursively for files with one of
+            SPEC_EXTS, or glob patterns
+
+    Returns:
+        A sorted list of distinct string file names
+    """
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, names in os.walk(path):
+                found.update([os.path.join(dirpath, name) for name in names
+                              if os.path.splitext(name)[1] in SPEC_EXTS])
+        elif os.path.isfile(path):
+            found.add(path)
+        else:
+            found.update(glob.glob(path))
+    return sorted(found)
+
+def _write(ofile, record):
+    """Writes a record as one JSON line and flushes it to the reader"""
+    ofile.write(json.dumps(record) + '\n')
+    ofile.flush()
+
+def main():
+    """Parses command line arguments and checks every specification file given"""
+
+    # initialize default command line values
+    workdir = None
+    results_file = None
+    summary_file = None
+    jobs = 1
+    use_cache = True
+    cache_dir = CACHE_DIR
+    engine = NUSMV_ENGINE
+
+    # configure command line short-form and long-form options
+    options, paths = getopt.getopt(sys.argv[1:], 'ho:j:',
+                                   ['workdir=', 'jobs=', 'results=', 'summary=', 'no-cache',
+                                    'cache-dir=', 'engine='])
+
+    # parse command line arguments
+    for opt, arg in options:
+        if opt == '-h':
+            print 'batch.py [-o <workdir>] [-j <jobs>] [--results <jsonlfile>]', \
+                  '[--summary <jsonfile>] [--no-cache] [--cache-dir <dir>]', \
+                  '[--engine ' + '|'.join(ENGINES) + '] <specfile|dir|glob> ...'
+            sys.exit()
+        elif opt in ('-o', '--workdir'):
+            workdir = arg
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt == '--results':
+            results_file = arg
+        elif opt == '--summary':
+            summary_file = arg
+        elif opt == '--no-cache':
+            use_cache = False
+        elif opt == '--cache-dir':
+            cache_dir = arg
+        elif opt == '--engine':
+            if arg not in ENGINES:
+                print 'Unknown engine', arg + ', expected one of', ', '.join(ENGINES)
+                sys.exit(EXIT_ERROR)
+            engine = arg
+
+    specfiles = find_specs(paths)
+    if not specfiles:
+        print 'No specification files found in', ' '.join(paths)
+        sys.exit(EXIT_ERROR)
+
+    # generate NuSMV files in a scratch directory, removed afterwards unless given
+    scratch = workdir is None
+    workdir = tempfile.mkdtemp() if scratch else workdir
+    cache = ResultCache(cache_dir) if use_cache else None
+    spec_cache = SpecCache(os.path.join(cache_dir, 'specs')) if use_cache else None
+    batch = Batch(specfiles, workdir, jobs, cache, spec_cache, engine)
+    ofile = open(results_file, 'w') if results_file else sys.stdout
+    try:
+        status = batch.run(ofile)
+    finally:
+        if results_file:
+            ofile.close()
+        if scratch:
+            shutil.rmtree(workdir)
+
+    # write the aggregated summary
+    if summary_file:
+        with open(summary_file, 'w') as sfile:
+            json.dump(batch.summary, sfile, indent=2, separators=(',', ': '))
+            sfile.write('\n')
+    else:
+        sys.stderr.write(json.dumps(batch.summary) + '\n')
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""BDD module defines a small reduced ordered binary decision diagram manager used by the native
+model checking engine"""
+
+# terminal nodes
+FALSE = 0
+TRUE = 1
+
+class BDD(object):
+    """BDD class manages a shared table of reduced ordered binary decision diagram nodes
+
+    Nodes are integers indexing the node table, variables are integer levels where lower levels
+    are closer to the root. All operations are memoized for the lifetime of the manager.
+
+    Attributes:
+        levels: a list of the variable level of every node, terminals have no level
+        lows: a list of the FALSE branch of every node
+        highs: a list of the TRUE branch of every node
+    """
+    def __init__(self):
+        """Initialize a BDD manager holding only the two terminals"""
+        self.levels = [float('inf'), float('inf')]
+        self.lows = [FALSE, TRUE]
+        self.highs = [FALSE, TRUE]
+        self._unique = {}
+        self._cache = {}
+
+    def mk(self, level, low, high):
+        """Returns the unique node testing a level with the given branches"""
+        if low == high:
+            return low
+        key = (level, low, high)
+        node = self._unique.get(key)
+        if node is None:
+            node = len(self.levels)
+            self.levels.append(level)
+            self.lows.append(low)
+            self.highs.append(high)
+            self._unique[key] = node
+        return node
+
+    def var(self, level):
+        """Returns the node of a single variable"""
+        return self.mk(level, FALSE, TRUE)
+
+    def ite(self, fnode, gnode, hnode):
+        """Returns the node of if fnode then gnode else hnode"""
+        if fnode == TRUE or gnode == hnode:
+            return gnode
+        if fnode == FALSE:
+            return hnode
+        if gnode == TRUE and hnode == FALSE:
+            return fnode
+        key = (fnode, gnode, hnode)
+        result = self._cache.get(key)
+        if result is None:
+            level = min(self.levels[fnode], self.levels[gnode], self.levels[hnode])
+            flow, fhigh = self._branches(fnode, level)
+            glow, ghigh = self._branches(gnode, level)
+            hlow, hhigh = self._branches(hnode, level)
+            result = self.mk(level, self.ite(flow, glow, hlow), self.ite(fhigh, ghigh, hhigh))
+            self._cache[key] = result
+        return result
+
+    def neg(self, fnode):
+        """Returns the negation of a node"""
+        return self.ite(fnode, FALSE, TRUE)
+
+    def conj(self, fnode, gnode):
+        """Returns the conjunction of two nodes"""
+        return self.ite(fnode, gnode, FALSE)
+
+    def disj(self, fnode, gnode):
+        """Returns the disjunction of two nodes"""
+        return self.ite(fnode, TRUE, gnode)
+
+    def iff(self, fnode, gnode):
+        """Returns the equivalence of two nodes"""
+        return self.ite(fnode, gnode, self.neg(gnode))
+
+    def exists(self, fnode, levels):
+        """Returns the existential quantification of a node over a frozenset of levels"""
+        if fnode in (FALSE, TRUE):
+            return fnode
+        key = ('exists', fnode, levels)
+        result = self._cache.get(key)
+        if result is None:
+            low = self.exists(self.lows[fnode], levels)
+            high = self.exists(self.highs[fnode], levels)
+            if self.levels[fnode] in levels:
+                result = self.disj(low, high)
+            else:
+                result = self.mk(self.levels[fnode], low, high)
+            self._cache[key] = result
+        return result
+
+    def and_exists(self, fnode, gnode, levels):
+        """Returns the existential quantification of a conjunction over a frozenset of levels"""
+        if fnode == FALSE or gnode == FALSE:
+            return FALSE
+        if fnode == TRUE:
+            return self.exists(gnode, levels)
+        if gnode == TRUE:
+            return self.exists(fnode, levels)
+        if fnode > gnode:
+            fnode, gnode = gnode, fnode
+        key = ('and_exists', fnode, gnode, levels)
+        result = self._cache.get(key)
+        if result is None:
+            level = self.levels[fnode]
+            if self.levels[gnode] < level:
+                level = self.levels[gnode]
+            flow, fhigh = self._branches(fnode, level)
+            glow, ghigh = self._branches(gnode, level)
+            low = self.and_exists(flow, glow, levels)
+            if level in levels:
+                result = TRUE if low == TRUE else \
+                         self.disj(low, self.and_exists(fhigh, ghigh, levels))
+            else:
+                result = self.mk(level, low, self.and_exists(fhigh, ghigh, levels))
+            self._cache[key] = result
+        return result
+
+    def rename(self, fnode, mapping):
+        """Returns a node with its variables renamed
+
+        Args:
+            fnode: a node
+            mapping: a dictionary from levels to levels, other levels are kept
+
+        Returns:
+            A node over the renamed variables
+        """
+        memo = {FALSE: FALSE, TRUE: TRUE}
+        def _rename(node):
+            """Renames a node below the root"""
+            if node not in memo:
+                level = self.levels[node]
+                memo[node] = self.ite(self.var(mapping.get(level, level)),
+                                      _rename(self.highs[node]), _rename(self.lows[node]))
+            return memo[node]
+        return _rename(fnode)
+
+    def support(self, fnode):
+        """Returns the set of levels a node depends on"""
+        levels, seen, stack = set(), set(), [fnode]
+        while stack:
+            node = stack.pop()
+            if node not in (FALSE, TRUE) and node not in seen:
+                seen.add(node)
+                levels.add(self.levels[node])
+                stack.extend((self.lows[node], self.highs[node]))
+        return levels
+
+    def cube(self, assignment):
+        """Returns the conjunction of literals of an assignment
+
+        Args:
+            assignment: a dictionary from levels to boolean values
+
+        Returns:
+            A node satisfied only by the assignment
+        """
+        node = TRUE
+        for level in sorted(assignment, reverse=True):
+            node = self.mk(level, FALSE, node) if assignment[level] else \
+                   self.mk(level, node, FALSE)
+        return node
+
+    def pick(self, fnode, levels):
+        """Returns one satisfying assignment of a node, unconstrained levels are FALSE
+
+        Args:
+            fnode: a node other than FALSE
+            levels: a sequence of levels to assign
+
+        Returns:
+            A dictionary from levels to boolean values
+        """
+        assignment = dict([(level, False) for level in levels])
+        while fnode not in (FALSE, TRUE):
+            if self.lows[fnode] != FALSE:
+                assignment[self.levels[fnode]] = False
+                fnode = self.lows[fnode]
+            else:
+                assignment[self.levels[fnode]] = True
+                fnode = self.highs[fnode]
+        return assignment
+
+    def evaluate(self, fnode, assignment):
+        """Returns the value of a node under an assignment of its levels"""
+        while fnode not in (FALSE, TRUE):
+            fnode = self.highs[fnode] if assignment.get(self.levels[fnode]) else \
+                    self.lows[fnode]
+        return fnode == TRUE
+
+    def _branches(self, node, level):
+        """Returns the FALSE and TRUE cofactors of a node with respect to a level"""
+        if self.levels[node] == level:
+            return self.lows[node], self.highs[node]
+        return node, node
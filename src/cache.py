@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+"""Cache module defines persistent, content-addressed caches of NuSMV check results and compiled
+system specification files"""
+
+import os
+import json
+import cPickle
+import hashlib
+import tempfile
+from collections import OrderedDict
+from counterexample import Trace
+
+# cache attributes
+CACHE_VERSION = '4'
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ltl-contract-checker')
+CACHE_SIZE = 64 * 1024 * 1024
+CACHE_EXT = '.json'
+SPEC_CACHE_VERSION = '4'
+SPEC_CACHE_DIR = os.path.join(CACHE_DIR, 'specs')
+SPEC_EXT = '.pickle'
+SORTED_SECTIONS = ('VAR', 'ASSIGN')
+UNSORTED_SECTIONS = ('MODULE', 'DEFINE', 'LTLSPEC')
+
+class ResultCache(object):
+    """ResultCache class stores check results on disk keyed by a hash of their NuSMV model
+
+    Entries are evicted least recently used first once the cache grows past its size limit. The
+    most recently used entries are also kept in memory, and a cache without a directory is kept
+    in memory only.
+
+    Attributes:
+        directory: a string directory holding one file per cached model, or None
+        max_size: an integer maximum number of bytes of all cached entries
+        memory: an integer maximum number of entries kept in memory
+        hits: an integer number of lookups answered from the cache
+        misses: an integer number of lookups not found in the cache
+    """
+    extension = CACHE_EXT
+
+    def __init__(self, directory=CACHE_DIR, max_size=CACHE_SIZE, memory=0):
+        """Initialize a result cache object"""
+        self.directory = directory
+        self.max_size = max_size
+        self.memory = memory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # keys to entries in memory, least recently used first
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, smvfile):
+        """Computes the canonical hash of a NuSMV model file
+
+        Variable declarations and initial values are sorted, so the key does not depend on the
+        order of the system alphabet.
+
+        Args:
+            smvfile: a string NuSMV file name
+
+        Returns:
+            A string hexadecimal digest
+        """
+        with open(smvfile, 'r') as ifile:
+            return model_key(ifile.read())
+
+    def get(self, key):
+        """Get the cached results of a model
+
+        Args:
+            key: a string key as returned by the key method
+
+        Returns:
+            A tuple containing a list of results, a dictionary of counterexample traces and a list
+            of the string engines which decided the results, or None
+        """
+        if key in self._entries:
+            self.hits += 1
+            self._entries[key] = self._entries.pop(key) # mark as recently used
+            return self._entries[key]
+        if self.directory is None:
+            self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            entry = self._load(path)
+            os.utime(path, None) # mark as recently used
+        except Exception: # missing, truncated or written by another version of the modules
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, output):
+        """Store the results of a model and evict old entries past the size limit
+
+        Args:
+            key: a string key as returned by the key method
+            output: a tuple containing a list of results, a dictionary of counterexample traces
+                and a list of the string engines which decided the results
+        """
+        self._remember(key, output)
+        if self.directory is None:
+            return
+        handle, temp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'wb') as ofile:
+            self._dump(ofile, output)
+        os.rename(temp, self._path(key))
+        self._evict()
+
+    def snapshot(self):
+        """Get the counters and the keys in memory, to find the changes a worker process makes
+
+        Returns:
+            A tuple containing the integer hits and misses and a set of the keys in memory
+        """
+        return self.hits, self.misses, set(self._entries)
+
+    def changes(self, snapshot):
+        """Get the changes made since a snapshot, to be merged by the process which forked
+
+        Args:
+            snapshot: a tuple as returned by the snapshot method
+
+        Returns:
+            A tuple containing the integer hits and misses and a list of the key and entry pairs
+            kept in memory since the snapshot
+        """
+        hits, misses, keys = snapshot
+        return self.hits - hits, self.misses - misses, \
+               [(key, entry) for key, entry in self._entries.iteritems() if key not in keys]
+
+    def merge(self, changes):
+        """Adds the changes made by a worker process
+
+        Args:
+            changes: a tuple as returned by the changes method
+        """
+        hits, misses, entries = changes
+        self.hits += hits
+        self.misses += misses
+        for key, entry in entries:
+            self._remember(key, entry)
+
+    def _load(self, path):
+        """Reads the entry of a cache file"""
+        with open(path, 'r') as ifile:
+            entry = json.load(ifile)
+        counterexamples = dict([(int(num), Trace.from_dict(trace))
+                                for num, trace in entry['counterexamples'].iteritems()])
+        return entry['results'], counterexamples, entry['engines']
+
+    def _dump(self, ofile, output):
+        """Writes an entry to a cache file"""
+        results, counterexamples, engines = output
+        json.dump({'results': results,
+                   'counterexamples': dict([(num, trace.to_dict())
+                                            for num, trace in counterexamples.iteritems()]),
+                   'engines': engines},
+                  ofile)
+
+    def _remember(self, key, entry):
+        """Keeps an entry in memory, forgetting the least recently used ones past the limit"""
+        if not self.memory:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.memory:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        """Returns the file name of a cache entry"""
+        return os.path.join(self.directory, key + self.extension)
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits its size limit"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.extension):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        size = sum([entry[1] for entry in entries])
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError: # already evicted by another process
+                pass
+            size -= entry_size
+
+class SpecCache(ResultCache):
+    """SpecCache class stores parsed system specification files on disk keyed by their content
+
+    Entries are pickled tuples of contracts and checks objects, so an unchanged contract library is
+    loaded without being parsed and saturated again.
+    """
+    extension = SPEC_EXT
+
+    def __init__(self, directory=SPEC_CACHE_DIR, max_size=CACHE_SIZE, memory=0):
+        """Initialize a spec cache object"""
+        ResultCache.__init__(self, directory, max_size, memory)
+
+    def key(self, text, includes=(), version=''):
+        """Computes the hash of a system specification file
+
+        Args:
+            text: a string system specification
+            includes: a list of string keys of the files the specification includes
+            version: a string version of the tool that parsed the specification
+
+        Returns:
+            A string hexadecimal digest
+        """
+        return hashlib.sha256('\n'.join([SPEC_CACHE_VERSION, version] + list(includes) +
+                                         [text])).hexdigest()
+
+    def _load(self, path):
+        """Reads the parsed specification of a cache file"""
+        with open(path, 'rb') as ifile:
+            return cPickle.load(ifile)
+
+    def _dump(self, ofile, output):
+        """Writes a parsed specification to a cache file"""
+        cPickle.dump(output, ofile, cPickle.HIGHEST_PROTOCOL)
+
+def model_key(model):
+    """Returns the canonical hash of the text of a NuSMV model
+
+    Args:
+        model: a string NuSMV model
+
+    Returns:
+        A string hexadecimal digest
+    """
+    sections, section = [], None
+    for line in model.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line in SORTED_SECTIONS or line.startswith(UNSORTED_SECTIONS):
+            section = [] if line in SORTED_SECTIONS else None
+            sections.append(line)
+            if section is not None:
+                sections.append(section)
+        elif section is not None:
+            section.append(line)
+        else:
+            sections.append(line)
+    canonical = [CACHE_VERSION]
+    for entry in sections:
+        canonical.extend(sorted(entry) if isinstance(entry, list) else [entry])
+    return hashlib.sha256('\n'.join(canonical)).hexdigest()
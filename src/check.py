@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Check module defines a check class that links contracts to a pre-defined check type"""
 from collections import OrderedDict
+import formula
 import operations as ops
 
 class Check(object):
@@ -47,6 +48,18 @@ class Check(object):
         """
         return self.contracts[name]
 
+    def get_identity(self):
+        """Get a stable identity of the check from its type and contract names
+
+        Returns:
+            A string that is equal for checks of the same type over the same contracts
+        """
+        return str(self)
+
+    def get_ltl(self):
+        """Returns the LTL statement of the check from the formula of its check type"""
+        return formula.ltlspec(self.get_formula())
+
     def __str__(self):
         """Override the print behavior"""
         astr = self.check_type + ': [ '
@@ -78,13 +91,13 @@ class Compatibility(Check):
         self.check_type = 'compatibility'
         self.comp_type = comp_type
 
-    def get_ltl(self):
-        """Returns the LTL statement for the compatibility of two contracts"""
+    def get_formula(self):
+        """Returns the LTL formula for the compatibility of two contracts"""
         # (DONE) remove hard-coded contract parameters
         if self.comp_type == 'composition':
-			contract = ops.composition(self.contracts.values())
+            contract = ops.composition(self.contracts.values())
         else:
-			contract = ops.conjunction(self.contracts.values())
+            contract = ops.conjunction(self.contracts.values())
         return ops.compatibility(contract)
 
     def __str__(self):
@@ -109,13 +122,13 @@ class Consistency(Check):
         self.check_type = 'consistency'
         self.cons_type = cons_type
 
-    def get_ltl(self):
-        """Returns the LTL statement for the consistency of two contracts"""
+    def get_formula(self):
+        """Returns the LTL formula for the consistency of two contracts"""
         # (DONE) remove hard-coded contract parameters
         if self.cons_type == 'composition':
-			contract = ops.composition(self.contracts.values())
+            contract = ops.composition(self.contracts.values())
         else:
-		    contract = ops.conjunction(self.contracts.values())
+            contract = ops.conjunction(self.contracts.values())
         return ops.consistency(contract)
 
     def __str__(self):
@@ -136,10 +149,53 @@ class Refinement(Check):
         super(Refinement, self).__init__(contracts)
         self.check_type = 'refinement'
 
+    def get_formula(self):
+        """Returns the LTL formula to check if the first contract refines the second"""
+        acontract, bcontract = self.contracts.values()
+        return ops.refinement(acontract, bcontract)
+
+    def __str__(self):
+        """Override the print behavior"""
+        astr = self.check_type + ': {\n'
+        astr += '  contracts: ['
+        for contract in self.contracts.values():
+            astr += contract.name + ', '
+        return astr[:-2] + ']\n}'
+
+class RefinementMatrix(Check):
+    """RefinementMatrix is a subclass of check for the refinement relation among many contracts
+
+    A refinement matrix has no single LTL formula, it is decided pair by pair by the matrix module.
+
+    Attributes:
+        check_type: a string containing the refinement matrix check type
+        contracts (inherited): an ordered dictionary of contracts associated with a check
+    """
+    def __init__(self, contracts=None):
+        """Initialize a refinement matrix check object"""
+        super(RefinementMatrix, self).__init__(contracts)
+        self.check_type = 'refinement_matrix'
+
+    def get_pair(self, aname, bname):
+        """Get the refinement check of two contracts of the matrix
+
+        Args:
+            aname: a string name of the refining contract
+            bname: a string name of the refined contract
+
+        Returns:
+            A refinement check object checking if contract aname refines contract bname
+        """
+        return Refinement([self.contracts[aname], self.contracts[bname]])
+
     def get_ltl(self):
-        """Returns the LTL statement to check if contract_a refines contract_b"""
-        # (TODO) remove hard-coded contract parameters
-        return ops.refinement(self.contracts.values()[0], self.contracts.values()[1])
+        """Raises an error, a refinement matrix is decided by the LTL statements of its pairs
+
+        Raises:
+            ValueError: always, use get_pair or matrix.refinement_order instead
+        """
+        raise ValueError('a refinement matrix has no single LTL statement, check its pairs with '
+                         'get_pair or matrix.refinement_order')
 
     def __str__(self):
         """Override the print behavior"""
@@ -153,11 +209,13 @@ class Checks(object):
     """Checks is a class that stores all the check objects associated with a system
 
     Attributes:
-        checks: a list of check objects
+        checks: a list of check objects, each checked by one LTL specification
+        matrices: a list of refinement matrix check objects
     """
     def __init__(self):
         """Initialize a checks object"""
         self.checks = []
+        self.matrices = []
 
     def add_check(self, check):
         """Add a check to the checks object
@@ -167,6 +225,14 @@ class Checks(object):
         """
         self.checks.append(check)
 
+    def add_matrix(self, matrix):
+        """Add a refinement matrix to the checks object
+
+        Args:
+            matrix: a refinement matrix check object
+        """
+        self.matrices.append(matrix)
+
     def __str__(self):
         """Override the print behavior"""
         astr = '[\n'
@@ -3,24 +3,60 @@
 
 import sys
 import getopt
-from core import parse, generate, run
+import os
+import core
+from core import parse, generate, run, slice_alphabet, ParseError, NUSMV_ENGINE, PORTFOLIO_ENGINE, \
+                 ENGINES, VERSION
+from cache import ResultCache, SpecCache, CACHE_DIR
+from session import SessionPool
+from metrics import Metrics
+from counterexample import TraceStore, TRACE_BUDGET
+from watch import Watcher
+from matrix import refinement_order, print_order
+from compose import decompose
+from server import Server, running, request, report, SOCKET_PATH, MEMORY_ENTRIES, MATRICES_ERROR
+
+# options only honoured by local runs, a running server uses its own configuration
+LOCAL_OPTIONS = ('-o', '--smv', '-j', '--jobs', '--no-cache', '--cache-dir', '--watch', '--engine',
+                 '--interactive', '--metrics', '--trace-budget', '--no-order', '--reorder',
+                 '--no-compose')
 
 def main():
     """Parses command line arguments and runs the LTL contract checker tool"""
 
     # initialize default command line values
-    version = '1.0'
+    version = VERSION
     verbose = False
     spec_file = 'system.spec'
     smv_file = 'nusmv.smv'
+    jobs = 1
+    use_cache = True
+    cache_dir = CACHE_DIR
+    watch = False
+    engine = NUSMV_ENGINE
+    interactive = False
+    metrics_file = None
+    serve = False
+    socket_path = SOCKET_PATH
+    trace_budget = TRACE_BUDGET
+    order = True
+    compose = True
 
     # configure command line short-form and long-form options
-    options, _ = getopt.getopt(sys.argv[1:], 'hvi:o:', ['verbose=', 'spec=', 'smv='])
+    options, _ = getopt.getopt(sys.argv[1:], 'hvi:o:j:',
+                               ['verbose=', 'spec=', 'smv=', 'jobs=', 'no-cache', 'cache-dir=',
+                                'watch', 'engine=', 'interactive', 'metrics=', 'serve', 'socket=',
+                                'trace-budget=', 'no-order', 'reorder', 'no-compose'])
 
     # parse command line arguments
     for opt, arg in options:
         if opt == '-h':
-            print 'test.py -i <specfile> -o <smvfile>'
+            print 'test.py -i <specfile> -o <smvfile> -j <jobs> [--no-cache] [--cache-dir <dir>]', \
+                  '[--watch] [--engine ' + '|'.join(ENGINES) + '] [--interactive]', \
+                  '[--metrics <jsonfile>] [--serve] [--socket <path>] [--trace-budget <MB>]', \
+                  '[--no-order] [--reorder] [--no-compose]'
+            print 'One .smv file holds every check only with -j 1, --no-cache and an engine', \
+                  'other than ' + PORTFOLIO_ENGINE + ', otherwise there is one file per check'
             sys.exit()
         elif opt in ('-v', '--verbose'):
             verbose = True
@@ -28,6 +64,35 @@ def main():
             spec_file = arg
         elif opt in ('-o', '--smv'):
             smv_file = arg
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt == '--no-cache':
+            use_cache = False
+        elif opt == '--cache-dir':
+            cache_dir = arg
+        elif opt == '--watch':
+            watch = True
+        elif opt == '--engine':
+            if arg not in ENGINES:
+                print 'Unknown engine', arg + ', expected one of', ', '.join(ENGINES)
+                sys.exit(2)
+            engine = arg
+        elif opt == '--interactive':
+            interactive = True
+        elif opt == '--metrics':
+            metrics_file = arg
+        elif opt == '--serve':
+            serve = True
+        elif opt == '--socket':
+            socket_path = arg
+        elif opt == '--trace-budget':
+            trace_budget = int(float(arg) * 1024 * 1024)
+        elif opt == '--no-order':
+            order = False
+        elif opt == '--reorder':
+            core.DYNAMIC_REORDERING = True
+        elif opt == '--no-compose':
+            compose = False
 
     # print tool configurations
     if verbose:
@@ -35,17 +100,122 @@ def main():
         print 'VERBOSE    :', verbose
         print 'SPEC_FILE  :', spec_file
         print 'SMV_FILE   :', smv_file
+        print 'JOBS       :', jobs
+        print 'CACHE_DIR  :', cache_dir if use_cache else None
+        print 'WATCH      :', watch
+        print 'ENGINE     :', engine
+        print 'INTERACTIVE:', interactive
+        print 'METRICS    :', metrics_file
+        print 'SERVE      :', serve
+        print 'SOCKET     :', socket_path
+        print 'BUDGET     :', trace_budget
+        print 'ORDER      :', order
+        print 'REORDER    :', core.DYNAMIC_REORDERING
+        print 'COMPOSE    :', compose
+
+    # answer check requests on a socket, keeping specifications and results in memory
+    if serve:
+        cache = ResultCache(cache_dir if use_cache else None, memory=MEMORY_ENTRIES)
+        spec_cache = SpecCache(os.path.join(cache_dir, 'specs') if use_cache else None,
+                               memory=MEMORY_ENTRIES)
+        try:
+            Server(socket_path, jobs, cache, spec_cache).serve()
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
+
+    # forward the specification to a running server, and check it locally when it has refinement
+    # matrices, which only local runs compute
+    local = [opt for opt, _ in options if opt in LOCAL_OPTIONS]
+    if not local and running(socket_path):
+        response = request({'spec': os.path.abspath(spec_file)}, socket_path)
+        if response.get('error') != MATRICES_ERROR:
+            if 'error' in response:
+                print 'Error:', response['error']
+                sys.exit(1)
+            report(response)
+            sys.exit()
+
+    # keep interactive NuSMV sessions open for the checks of the same model
+    sessions = SessionPool() if interactive else None
 
-    # parse system specification file
-    contracts, checks = parse(spec_file)
+    # re-check the system specification file after every edit
+    if watch:
+        if metrics_file:
+            print 'Error: --metrics records a single run and cannot be used with --watch'
+            sys.exit(2)
+        try:
+            cache = ResultCache(cache_dir) if use_cache else None
+            spec_cache = SpecCache(os.path.join(cache_dir, 'specs')) if use_cache else None
+            Watcher(spec_file, smv_file, jobs, cache, engine, sessions, spec_cache, order,
+                    compose, trace_budget).watch()
+        except KeyboardInterrupt:
+            sys.exit()
+        finally:
+            if sessions:
+                sessions.close()
 
-    # compile NuSMV file
-    generate(contracts, checks, smv_file)
+    # time every phase, recording the cost of each check when requested
+    metrics = Metrics()
+
+    # parse system specification file, loading unchanged files and libraries from the cache
+    spec_cache = SpecCache(os.path.join(cache_dir, 'specs')) if use_cache else None
+    try:
+        contracts, checks = metrics.timed('parse', parse, spec_file, spec_cache)
+    except ParseError as error:
+        print 'Error:', error
+        sys.exit(1)
+    metrics.variables = len(contracts.get_alphabet())
+
+    # decide the compositions of independent groups of contracts one group at a time
+    cache = ResultCache(cache_dir) if use_cache else None
+    decided = metrics.timed('compose', decompose, contracts, checks, smv_file, jobs, cache, engine,
+                            sessions) if compose else {}
+
+    # compile NuSMV file, one per check when running in parallel, caching results or racing engines,
+    # so the single file of a serial run needs --no-cache
+    split = jobs > 1 or use_cache or engine == PORTFOLIO_ENGINE
+    smv_files = metrics.timed('generate', generate, contracts, checks, smv_file, split=split,
+                              order=order, exclude=decided)
+
+    # report the variables removed from each check by alphabet slicing
+    if verbose and split:
+        alphabet = contracts.get_alphabet()
+        for num, check in enumerate(checks.checks):
+            kept = len(slice_alphabet(contracts, check))
+            print 'SLICE', str(num).ljust(5) + ':', len(alphabet) - kept, 'of', len(alphabet), \
+                  'variables removed'
 
     print checks
 
     # run NuSMV file
-    run(smv_file, checks)
+    # keep counterexamples in memory up to the budget, spilling the others next to the NuSMV file
+    traces = TraceStore(os.path.splitext(smv_file)[0] + '.traces', trace_budget)
+    try:
+        metrics.timed('run', run, smv_files, checks, jobs, cache, engine, sessions,
+                      metrics if metrics_file else None, traces, decided)
+
+        # compute the refinement order of every refinement matrix
+        for matrix in checks.matrices:
+            order = metrics.timed('matrix', refinement_order, contracts, matrix, smv_file, jobs,
+                                  cache, engine, sessions)
+            print_order(order)
+    finally:
+        if sessions:
+            sessions.close()
+        traces.close()
+    if traces.index:
+        print 'Spilled', len(traces.index), 'counterexamples to', traces.path
+    if decided:
+        print 'Composed:', len(decided), 'of', len(checks.checks), \
+              'checks decided from independent groups of contracts'
+    if smv_files.duplicates:
+        print 'Duplicates:', smv_files.duplicates, 'of', len(checks.checks), \
+              'checks share the specification of an earlier check'
+    if cache:
+        print 'Cache:', cache.hits, 'hits,', cache.misses, 'misses'
+    if metrics_file:
+        metrics.write(metrics_file)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""Compose module decides the composition checks of contracts which fall into independent groups
+sharing no variables, model checking every group as its own smaller model"""
+
+import os
+import formula
+from fractions import gcd
+from check import Compatibility, Consistency
+from counterexample import Trace
+from core import write_model, iter_run, NUSMV_ENGINE, COMPOSE_ENGINE
+
+def components(check):
+    """Groups the contracts of a check into the connected components of their shared variables
+
+    Two contracts are connected when one declares or uses a variable the other declares or uses.
+
+    Args:
+        check: a check object
+
+    Returns:
+        A list of lists of contract objects, in check order
+    """
+    contracts = check.contracts.values()
+    owners = {} # variables to the index of the first contract using them
+    parents = range(len(contracts))
+    for num, contract in enumerate(contracts):
+        for var in _variables(contract):
+            parents[_find(parents, owners.setdefault(var, num))] = _find(parents, num)
+
+    groups = {}
+    for num, contract in enumerate(contracts):
+        groups.setdefault(_find(parents, num), []).append(contract)
+    return sorted(groups.values(), key=lambda group: contracts.index(group[0]))
+
+def decomposable(check):
+    """Returns a boolean indicating if a check composes independent groups of contracts"""
+    if isinstance(check, Compatibility):
+        comp_type = check.comp_type
+    elif isinstance(check, Consistency):
+        comp_type = check.cons_type
+    else:
+        return False
+    return comp_type == 'composition' and len(components(check)) > 1
+
+def decompose(contracts, checks, smvfile, jobs=1, cache=None, engine=NUSMV_ENGINE,
+              sessions=None):
+    """Decides every decomposable check by model checking its components separately
+
+    The guarantees of a composition can hold exactly when the guarantees of every component can
+    hold, so the composition is consistent when every component is. Its assumptions can hold
+    when the assumptions of every component can hold or the guarantees of some component can
+    fail, so every component of a compatibility check is checked for both. The components share
+    no variables, so their counterexamples run side by side as the counterexample of the check.
+
+    Args:
+        contracts: a contracts object containing all the contracts in a system
+        checks: a checks object containing the checks to run
+        smvfile: a string name the generated NuSMV files are derived from
+        jobs: an integer number of NuSMV processes to run in parallel over the component files
+        cache: an optional result cache object
+        engine: a string model checking engine
+        sessions: an optional session pool object
+
+    Returns:
+        A dictionary from the indices of the decomposed checks to tuples containing their result,
+        counterexample trace object or None and COMPOSE_ENGINE
+    """
+    root, ext = os.path.splitext(smvfile)
+    smvfiles = []
+    owners = [] # specification indices to their check index and component index
+    parts = {}  # check indices to the alphabet of every component
+    for num, check in enumerate(checks.checks):
+        if not decomposable(check):
+            continue
+        parts[num] = []
+        for group in components(check):
+            used = set()
+            for contract in group:
+                used.update(_variables(contract))
+            parts[num].append([(var, init) for (var, init) in contracts.get_alphabet()
+                               if var in used])
+            specs = formula.simplify_all(_specs(check, group))
+            smvfiles.append(root + '_' + str(num) + '_comp_' + str(len(parts[num]) - 1) + ext)
+            write_model(smvfiles[-1], parts[num][-1], specs)
+            owners.extend([(num, len(parts[num]) - 1)] * len(specs))
+
+    # every component of a check gets the results of its specifications, in order
+    outputs = dict([(num, [[] for _ in alphabets]) for num, alphabets in parts.iteritems()])
+    for spec, result, counterexample, _ in iter_run(smvfiles, jobs, cache, engine, sessions):
+        num, part = owners[spec]
+        outputs[num][part].append((result, counterexample))
+    return dict([(num, _combine(checks.checks[num], outputs[num], parts[num]) + (COMPOSE_ENGINE,))
+                 for num in parts])
+
+def stitch(parts):
+    """Runs the lasso traces of independent components side by side as one lasso trace
+
+    The stitched trace loops back after the longest prefix of the parts, and its loop is as long
+    as the least common multiple of their loops. As in NuSMV traces, its last state repeats the
+    state it loops back to.
+
+    Args:
+        parts: a list of tuples containing a trace object and the list of string variables it
+            contributes, no variable contributed by two parts
+
+    Returns:
+        A trace object
+    """
+    lassos = [_lasso(trace) for trace, _ in parts]
+    prefix = max([start for start, _ in lassos])
+    period = reduce(_lcm, [length for _, length in lassos], 1)
+    stitched = Trace([var for _, names in parts for var in names])
+    for step in range(prefix + period + 1):
+        point = step if step < prefix + period else prefix
+        values = {}
+        for (trace, names), (start, length) in zip(parts, lassos):
+            state = point if point < start else start + (point - start) % length
+            values.update([(var, trace.value(state, var)) for var in names
+                           if var in trace.index])
+        stitched.add_state(values)
+    stitched.loop = prefix
+    stitched.number, stitched.engine = parts[0][0].number, parts[0][0].engine
+    return stitched
+
+def _combine(check, outputs, alphabets):
+    """Returns the result and counterexample of a check from the outputs of its components
+
+    Every component of a consistency check has one output, for its guarantees. Every component of
+    a compatibility check has two, for its assumptions and for the failure of its guarantees.
+    """
+    first = [part[0] for part in outputs]
+    if all([result for result, _ in first]):
+        return True, _stitched([trace for _, trace in first], alphabets)
+    failing = [num for num, part in enumerate(outputs) if len(part) > 1 and part[1][0]]
+    if not failing:
+        return False, None
+
+    # the other components are unconstrained, any of their paths runs alongside the failing one
+    traces = [trace if result else _initial(alphabet)
+              for (result, trace), alphabet in zip(first, alphabets)]
+    traces[failing[0]] = outputs[failing[0]][1][1]
+    return True, _stitched(traces, alphabets)
+
+def _stitched(traces, alphabets):
+    """Returns the stitched trace of the components, or None if a trace is missing"""
+    if any([trace is None or not len(trace) for trace in traces]):
+        return None
+    return stitch([(trace, [var for var, _ in alphabet])
+                   for trace, alphabet in zip(traces, alphabets)])
+
+def _specs(check, group):
+    """Returns the formulas checked for a group of contracts of a composition check"""
+    guarantees = formula.conj([formula.to_formula(guarantee) for contract in group
+                               for guarantee in contract.guarantees])
+    if isinstance(check, Consistency):
+        return [formula.mk_not(guarantees)]
+    assumptions = formula.conj([formula.to_formula(assumption) for contract in group
+                                for assumption in contract.assumptions])
+    return [formula.mk_not(assumptions), guarantees]
+
+def _variables(contract):
+    """Returns the set of variables declared or used by a contract"""
+    used = formula.variables([formula.to_formula(line)
+                              for line in contract.assumptions + contract.guarantees])
+    return used | set([var for (var, _) in contract.variables])
+
+def _initial(alphabet):
+    """Returns a trace staying in the initial state of an alphabet"""
+    trace = Trace([var for var, _ in alphabet])
+    trace.add_state(dict([(var, init == 'TRUE') for var, init in alphabet]))
+    trace.loop = 0
+    return trace
+
+def _lasso(trace):
+    """Returns the loop start and loop length of a trace, not counting the last state of NuSMV
+    traces which repeats the loop start, a trace without a loop stays in its last state"""
+    start = len(trace) - 1 if trace.loop is None else trace.loop
+    end = len(trace)
+    if end - start > 1 and trace.state(end - 1) == trace.state(start):
+        end -= 1
+    return start, end - start
+
+def _find(parents, num):
+    """Returns the representative of the component of a contract, compressing its path"""
+    while parents[num] != num:
+        parents[num] = parents[parents[num]]
+        num = parents[num]
+    return num
+
+def _lcm(anum, bnum):
+    """Returns the least common multiple of two positive integers"""
+    return anum * bnum // gcd(anum, bnum)
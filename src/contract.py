@@ -2,6 +2,7 @@
 """Contract module defines a contract class to store contract data attributes and a contracts class
 to store all system contracts and overall system alphabet"""
 
+import hashlib
 from collections import OrderedDict
 
 class Contract(object):
@@ -10,8 +11,8 @@ class Contract(object):
     Attributes:
         name: a string name for the contract
         variables: a list of tuples containing string variables and initial values
-        assumptions: a list of string relations assumed by contract
-        guarantees: a list of string relations guaranteed by contract
+        assumptions: a list of string relations or formula nodes assumed by contract
+        guarantees: a list of string relations or formula nodes guaranteed by contract
     """
     def __init__(self):
         """Initialize a contract object"""
@@ -67,7 +68,7 @@ class Contract(object):
         Returns:
             A parenthesized, concatenated string of assumptions
         """
-        assumptions = [assumption + ' & ' for assumption in self.assumptions]
+        assumptions = [str(assumption) + ' & ' for assumption in self.assumptions]
         return '(' + ''.join(assumptions)[:-3] + ')'
 
     def get_guarantees(self):
@@ -76,9 +77,19 @@ class Contract(object):
         Returns:
             A parenthesized, concatenated string of guarantees
         """
-        guarantees = [guarantee + ' & ' for guarantee in self.guarantees]
+        guarantees = [str(guarantee) + ' & ' for guarantee in self.guarantees]
         return '(' + ''.join(guarantees)[:-3] + ')'
 
+    def get_digest(self):
+        """Get a stable digest of the contract contents
+
+        Returns:
+            A string hexadecimal digest of the name, variables, assumptions and guarantees
+        """
+        return hashlib.sha1(repr((self.name, [tuple(variable) for variable in self.variables],
+                                  [str(assumption) for assumption in self.assumptions],
+                                  [str(guarantee) for guarantee in self.guarantees]))).hexdigest()
+
     def is_full(self):
         """Check if contract parameters are filled
 
@@ -101,10 +112,10 @@ class Contract(object):
             astr += '(' + var + ' := ' + init + '), '
         astr = astr[:-2] + ' ]\n  assumptions: [ '
         for assumption in self.assumptions:
-            astr += assumption + ', '
+            astr += str(assumption) + ', '
         astr = astr[:-2] + ' ]\n  guarantees: [ '
         for guarantee in self.guarantees:
-            astr += guarantee + ', '
+            astr += str(guarantee) + ', '
         return astr[:-2] + ' ]\n]'
 
     def __eq__(self, other):
@@ -121,22 +132,35 @@ class Contracts(object):
     """Contracts class stores all contracts for a system and the shared alphabet
 
     Attributes:
-        contracts: a list of contract objects
-        alphabet: a list of tuples containing the shared alphabet among all contracts
+        contracts: an ordered dictionary from contract names to contract objects
+        alphabet: an ordered dictionary from the variables shared among all contracts to their
+            initial values, in order of first declaration
     """
     def __init__(self):
         """Initialize a contracts object"""
         self.contracts = OrderedDict()
-        self.alphabet = []
+        self.alphabet = OrderedDict()
 
     def add_contract(self, contract):
         """Add a contract to the contracts object and update the alphabet
 
         Args:
             contract: a contract object
+
+        Raises:
+            ValueError: a contract with the same name was already added, or a variable of the
+                contract was declared with a different initial value
         """
+        if contract.name in self.contracts:
+            raise ValueError('duplicate contract ' + contract.name)
+        for var, init in contract.variables:
+            if self.alphabet.get(var, init) != init:
+                raise ValueError('variable ' + var + ' of contract ' + contract.name +
+                                 ' is initialized to ' + init + ', but was initialized to ' +
+                                 self.alphabet[var])
+        for var, init in contract.variables:
+            self.alphabet.setdefault(var, init)
         self.contracts[contract.name] = contract
-        self.alphabet = list(set(self.alphabet) | set(contract.variables))
 
     def get_contract(self, name):
         """Get the contract with the specified name
@@ -162,7 +186,11 @@ class Contracts(object):
         Returns:
             A list of tuples containing the shared alphabet and their initial values
         """
-        return self.alphabet
+        return self.alphabet.items()
+
+    def __contains__(self, name):
+        """Check if a contract with the specified name was added"""
+        return name in self.contracts
 
     def __str__(self):
         """Override the print behavior"""
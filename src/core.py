@@ -1,9 +1,21 @@
 #!/usr/bin/env python
 """Core module defines the core workflow functions of the LTL contract checker tool"""
 
+import os
+import re
+import sys
+import select
 import subprocess
+import copy
+import functools
+import multiprocessing
+import formula
+import native
+import sat
 from contract import Contract, Contracts
-from check import Compatibility, Consistency, Refinement, Checks
+from counterexample import Trace, SpilledTrace
+from cache import model_key
+from check import Compatibility, Consistency, Refinement, RefinementMatrix, Checks
 
 # contract file attributes
 TAB_WIDTH = 2
@@ -15,6 +27,7 @@ COMMENT_CHAR = '##'
 ASSIGNMENT_CHAR = ':='
 CHECKS_HEADER = 'CHECKS'
 CONTRACT_HEADER = 'CONTRACT'
+INCLUDE_HEADER = 'INCLUDE'
 CONTRACT_NAME_HEADER = 'NAME'
 CONTRACT_VARIABLES_HEADER = 'VARIABLES'
 CONTRACT_ASSUMPTIONS_HEADER = 'ASSUMPTIONS'
@@ -24,176 +37,936 @@ COMPATIBILITY_CONJ_CHECK = 'COMPATIBILITY_CONJ'
 CONSISTENCY_COMP_CHECK = 'CONSISTENCY_COMP'
 CONSISTENCY_CONJ_CHECK = 'CONSISTENCY_CONJ'
 REFINEMENT = 'REFINEMENT'
+REFINEMENT_MATRIX = 'REFINEMENT_MATRIX'
+CONTRACT_HEADERS = (CONTRACT_NAME_HEADER, CONTRACT_VARIABLES_HEADER, CONTRACT_ASSUMPTIONS_HEADER,
+                    CONTRACT_GUARANTEES_HEADER)
+FILE_HEADERS = (CONTRACT_HEADER, CHECKS_HEADER)
+CHECK_RE = re.compile(r'^(\w+)\s*\((.*)\)$')
 
-def parse(specfile):
+# model checker attributes
+NUSMV = 'NuSMV'
+DYNAMIC_REORDERING = False
+ORDER_EXT = '.ord'
+NUSMV_ENGINE = 'nusmv'
+NATIVE_ENGINE = 'native'
+PORTFOLIO_ENGINE = 'portfolio'
+ENGINES = (NUSMV_ENGINE, NATIVE_ENGINE, PORTFOLIO_ENGINE)
+BDD_ENGINE = 'bdd'
+BMC_ENGINE = 'bmc'
+SIMPLIFIER_ENGINE = 'simplifier'
+SAT_ENGINE = 'sat'
+COMPOSE_ENGINE = 'compose'
+BMC_LENGTH = 10
+BMC_MAX_LENGTH = 160
+READ_SIZE = 65536
+SUMMARY_STATES = 10
+
+# tool attributes
+VERSION = '1.0'
+
+class ParseError(ValueError):
+    """ParseError class reports a malformed line of a system specification file
+
+    Attributes:
+        specfile: a string name of the system specification file
+        lineno: an integer line number, starting at 1
+    """
+    def __init__(self, specfile, lineno, message):
+        """Initialize a parse error object, its arguments are kept so it can be pickled"""
+        ValueError.__init__(self, specfile, lineno, message)
+        self.specfile = specfile
+        self.lineno = lineno
+
+    def __str__(self):
+        """Override the print behavior"""
+        return '%s:%d: %s' % self.args
+
+class SmvFiles(list):
+    """SmvFiles class is the list of NuSMV file names written by generate
+
+    Checks whose formulas only differ in the order of the arguments of commutative operators are
+    decided by one LTL specification. When the files are split, the duplicate check repeats the
+    file name of the first check with the same formula.
+
+    Attributes:
+        specs: a list from check indices to the indices of the LTL specifications deciding them,
+            counted across the files
+        duplicates: an integer number of checks decided by the specification of an earlier check
+        formulas: a list from check indices to the formula nodes of the LTL specifications deciding
+            them, None for the checks without a specification
+    """
+    def __init__(self, smvfiles, specs, duplicates=0, formulas=None):
+        """Initialize a list of NuSMV file names"""
+        list.__init__(self, smvfiles)
+        self.specs = specs
+        self.duplicates = duplicates
+        self.formulas = formulas or [None] * len(specs)
+
+def parse(specfile, cache=None, text=None):
     """Parses the system specification file and returns the contracts and checks
 
+    The file is read in a single pass, every line is classified by its indentation and exact
+    header name. An INCLUDE: path heading adds the contracts of another specification file, with
+    the path relative to the including file; the checks of included files are not run.
+
     Args:
         specfile: a string input file name for the system specification file
+        cache: an optional spec cache object, storing every parsed file by its contents
+        text: an optional string specification parsed instead of the contents of specfile, such
+            as an unsaved editor buffer, its includes are still relative to specfile
 
     Returns:
         A tuple containing a contracts object and a checks object
+
+    Raises:
+        ParseError: a line of the file is malformed or inconsistent with the previous ones
+    """
+    return _parse(specfile, cache, (), text)[1:]
+
+def includes(specfile, stack=()):
+    """Lists the files a system specification file includes, directly or transitively
+
+    Args:
+        specfile: a string input file name for the system specification file
+        stack: a tuple of the absolute names of the files including the specification file
+
+    Returns:
+        A list of string file names, in order of first inclusion
+
+    Raises:
+        ParseError: if a file includes itself, directly or transitively
     """
+    stack += (os.path.abspath(specfile),)
+    found = []
+    with open(specfile, 'r') as ifile:
+        for lineno, path in _includes(specfile, _tokenize(ifile)):
+            if os.path.abspath(path) in stack:
+                raise ParseError(specfile, lineno, 'circular include of ' + path)
+            if path not in found and os.path.isfile(path):
+                found.append(path)
+                found.extend([afile for afile in includes(path, stack) if afile not in found])
+    return found
+
+def _parse(specfile, cache, stack, text=None):
+    """Parses a system specification file, loading it and the files it includes from the cache
+
+    Returns:
+        A tuple containing the string cache key, or None without a cache, a contracts object and
+        a checks object
+    """
+    stack += (os.path.abspath(specfile),)
+    if text is None:
+        with open(specfile, 'r') as ifile:
+            text = ifile.read()
+    tokens = list(_tokenize(text.splitlines()))
+
+    # parse included files first, their keys are part of the key of the including file
+    included = {}
+    for lineno, path in _includes(specfile, tokens):
+        if os.path.abspath(path) in stack:
+            raise ParseError(specfile, lineno, 'circular include of ' + path)
+        try:
+            included[lineno] = _parse(path, cache, stack)
+        except (IOError, OSError) as error:
+            raise ParseError(specfile, lineno, 'cannot include ' + path + ': ' +
+                             (error.strerror or str(error)))
+    key = None
+    if cache is not None:
+        key = cache.key(text, [included[lineno][0] for lineno in sorted(included)], VERSION)
+        entry = cache.get(key)
+        if entry is not None:
+            return (key,) + entry
+
     contracts, checks = Contracts(), Checks() # returned contracts and checks
-    contract = Contract() # contract and check holders
+    contract, contract_line = None, 0 # contract holder and the line it starts on
     file_header = '' # file header line contents
     contract_header = '' # contract header line contents
 
-    with open(specfile, 'r') as ifile:
-        for line in ifile:
-            line, ntabs = _clean_line(line)
+    def store():
+        """Adds the contract being parsed to the contracts"""
+        if not contract.is_full():
+            raise ParseError(specfile, contract_line, 'contract ' + (contract.name or '') +
+                             ' needs a name, variables, assumptions and guarantees')
+        contract.saturate_guarantees()
+        try:
+            contracts.add_contract(contract)
+        except ValueError as error:
+            raise ParseError(specfile, contract_line, str(error))
 
-            # skip empty lines
-            if not line:
-                continue
+    for lineno, line, ntabs in tokens:
+
+        # parse file header line
+        if ntabs == FILE_HEADER_INDENT:
+            if contract is not None: # store previously parsed contract
+                store()
+                contract = None
+            file_header, contract_header = _header(line, FILE_HEADERS), ''
+            if lineno in included: # add the contracts of an included file
+                file_header = INCLUDE_HEADER
+                for name, icontract in included[lineno][1].get_contracts().iteritems():
+                    if name in contracts and contracts.get_contract(name) == icontract:
+                        continue # included again through another file
+                    try:
+                        contracts.add_contract(icontract)
+                    except ValueError as error:
+                        raise ParseError(specfile, lineno, str(error))
+            elif file_header == CONTRACT_HEADER:
+                contract, contract_line = Contract(), lineno
+            elif file_header != CHECKS_HEADER:
+                raise ParseError(specfile, lineno, 'unexpected file heading ' + line)
 
-            # parse file header line
-            elif ntabs == FILE_HEADER_INDENT:
-                # store previously parsed contract
-                if CONTRACT_HEADER in file_header:
-                    if contract.is_full():
-                        contract.saturate_guarantees()
-                        contracts.add_contract(contract)
-                    else: # (TODO) add error - contract params incomplete
-                        pass
-                # parse file headers
-                if CONTRACT_HEADER in line:
-                    if file_header:
-                        contract = Contract()
-                    file_header = line
-                elif CHECKS_HEADER in line:
-                    file_header = line
-                else: # (TODO) add error - unexpected file heading
-                    pass
-
-            # parse contract and check data
+        # parse contract data
+        elif file_header == CONTRACT_HEADER:
+            if ntabs == CONTRACT_HEADER_INDENT:
+                contract_header = _header(line, CONTRACT_HEADERS)
+                if contract_header not in CONTRACT_HEADERS:
+                    raise ParseError(specfile, lineno, 'unexpected contract heading ' + line)
+            elif ntabs != CONTRACT_DATA_INDENT or not contract_header:
+                raise ParseError(specfile, lineno, 'unexpected indentation')
+            elif contract_header == CONTRACT_NAME_HEADER:
+                contract.add_name(line)
+            elif contract_header == CONTRACT_VARIABLES_HEADER:
+                if ASSIGNMENT_CHAR not in line:
+                    raise ParseError(specfile, lineno, 'expected variable ' +
+                                     ASSIGNMENT_CHAR + ' initial value')
+                var, init = [part.strip() for part in line.split(ASSIGNMENT_CHAR, 1)]
+                declared = dict(contract.variables)
+                if var in declared:
+                    raise ParseError(specfile, lineno, 'variable ' + var + ' is declared twice' +
+                                     (', initialized to ' + declared[var] + ' and ' + init
+                                      if declared[var] != init else ''))
+                contract.add_variable((var, init))
+            elif contract_header == CONTRACT_ASSUMPTIONS_HEADER:
+                contract.add_assumption(line)
             else:
-                if CONTRACT_HEADER in file_header:
-                    if ntabs == CONTRACT_HEADER_INDENT:
-                        contract_header = line
-                    elif ntabs == CONTRACT_DATA_INDENT:
-                        if CONTRACT_NAME_HEADER in contract_header:
-                            contract.add_name(line.strip())
-                        elif CONTRACT_VARIABLES_HEADER in contract_header:
-                            var, init = line.split(ASSIGNMENT_CHAR, 1)
-                            contract.add_variable((var.strip(), init.strip()))
-                        elif CONTRACT_ASSUMPTIONS_HEADER in contract_header:
-                            contract.add_assumption(line.strip())
-                        elif CONTRACT_GUARANTEES_HEADER in contract_header:
-                            contract.add_guarantee(line.strip())
-                        else: # (TODO) add error - unexpected contract heading
-                            pass
-                    else: # (TODO) add error - unexpected indentation
-                        pass
-                elif CHECKS_HEADER in file_header:
-                    if ntabs == CHECK_DATA_INDENT:
-                        check_type, check_contracts = line.split(')', 1)[0].split('(', 1)
-                        check_contracts = [contracts.get_contract(
-                            contract.strip()) for contract in check_contracts.split(',')]
-                        if COMPATIBILITY_COMP_CHECK in check_type.upper():
-                            check = Compatibility('composition', check_contracts)
-                        elif COMPATIBILITY_CONJ_CHECK in check_type.upper():
-                            check = Compatibility('conjunction', check_contracts)
-                        elif CONSISTENCY_COMP_CHECK in check_type.upper():
-                            check = Consistency('composition', check_contracts)
-                        elif CONSISTENCY_CONJ_CHECK in check_type.upper():
-                            check = Consistency('conjunction', check_contracts)
-                        elif REFINEMENT in check_type.upper():
-                            check = Refinement(check_contracts)
-                        else: # (TODO) add error - unrecognized check
-                            pass
-                        checks.add_check(check)
-                    else: # (TODO) add error - unexpected indentation
-                        pass
-
-    return contracts, checks
-
-def generate(contracts, checks, smvfile):
+                contract.add_guarantee(line)
+
+        # parse check data
+        elif file_header == CHECKS_HEADER:
+            if ntabs != CHECK_DATA_INDENT:
+                raise ParseError(specfile, lineno, 'unexpected indentation')
+            match = CHECK_RE.match(line)
+            if not match:
+                raise ParseError(specfile, lineno, 'expected CHECK(contract, ...)')
+            check_type = match.group(1).upper()
+            names = [name.strip() for name in match.group(2).split(',')]
+            missing = [name for name in names if name not in contracts]
+            if missing:
+                raise ParseError(specfile, lineno, 'unknown contract ' + missing[0])
+            check_contracts = [contracts.get_contract(name) for name in names]
+            if check_type == COMPATIBILITY_COMP_CHECK:
+                check = Compatibility('composition', check_contracts)
+            elif check_type == COMPATIBILITY_CONJ_CHECK:
+                check = Compatibility('conjunction', check_contracts)
+            elif check_type == CONSISTENCY_COMP_CHECK:
+                check = Consistency('composition', check_contracts)
+            elif check_type == CONSISTENCY_CONJ_CHECK:
+                check = Consistency('conjunction', check_contracts)
+            elif check_type == REFINEMENT:
+                if len(check_contracts) != 2:
+                    raise ParseError(specfile, lineno, 'refinement needs two contracts')
+                check = Refinement(check_contracts)
+            elif check_type == REFINEMENT_MATRIX:
+                if len(check_contracts) < 2:
+                    raise ParseError(specfile, lineno, 'refinement matrix needs two contracts')
+                checks.add_matrix(RefinementMatrix(check_contracts))
+                continue
+            else:
+                raise ParseError(specfile, lineno, 'unrecognized check ' + match.group(1))
+            checks.add_check(check)
+
+        else:
+            raise ParseError(specfile, lineno, 'data before any file heading')
+
+    if contract is not None:
+        store()
+    if cache is not None:
+        cache.put(key, (contracts, checks))
+    return key, contracts, checks
+
+def generate(contracts, checks, smvfile, split=False, simplify=True, order=True, dedupe=True,
+             exclude=()):
     """Generates a NuSMV file with configured variable declarations and LTL checks
 
     Args:
         contracts: a contracts object containing all the contracts in a system
         checks: a checks object containing all the desired checks on the system
         smvfile: a string name for the generated NuSMV file
+        split: a boolean to write one self-contained NuSMV file per check instead, each declaring
+            only the variables of its check
+        simplify: a boolean to write the simplified formula of every check, a check simplified
+            to a constant is then decided without running a model checker on its file
+        order: a boolean to declare the variables of every NuSMV file in the order computed by
+            variable_order, and to write that order to the file NuSMV reads it from
+        dedupe: a boolean to write the canonical formula shared by several checks only once
+        exclude: a collection of integer indices of the checks decided elsewhere, such as by the
+            compose module, which get no LTL specification
+
+    Returns:
+        A smv files object, the list of string names of the generated NuSMV files
+    """
+    kept = [num for num in range(len(checks.checks)) if num not in exclude]
+    formulas = [checks.checks[num].get_formula() for num in kept]
+    if simplify:
+        formulas = formula.simplify_all(formulas)
+    specs = dict(zip(kept, formulas))
+
+    # the first check with the canonical formula of every check, None for excluded checks
+    memo, index = {}, {}
+    firsts = [None] * len(checks.checks)
+    for num in kept:
+        key = formula.canonical(specs[num], memo) if dedupe else num
+        firsts[num] = index.setdefault(key, num)
+    duplicates = len([num for num in kept if firsts[num] != num])
+    written = [specs.get(first) for first in firsts]
+
+    uses = {} # contract names to the variables of each assumption and guarantee
+    if not split:
+        distinct = sorted(set(kept) & set(firsts))
+        position = dict([(first, pos) for pos, first in enumerate(distinct)])
+        if not distinct and exclude: # every check is decided elsewhere
+            return SmvFiles([], [None] * len(firsts), duplicates, written)
+        _write_ordered(smvfile, contracts.get_alphabet(), [specs[num] for num in distinct],
+                       contracts.get_contracts().values(), order, uses)
+        return SmvFiles([smvfile], [position.get(first) for first in firsts], duplicates,
+                        written)
+
+    smvfiles = []
+    files = [] # check indices to the indices of their files
+    root, ext = os.path.splitext(smvfile)
+    for num, check in enumerate(checks.checks):
+        if firsts[num] is None:
+            files.append(None)
+            continue
+        if firsts[num] != num:
+            smvfiles.append(smvfiles[files[firsts[num]]])
+        else:
+            smvfiles.append(root + '_' + str(num) + ext)
+            _write_ordered(smvfiles[-1], _slice(contracts.get_alphabet(), check, specs[num]),
+                           [specs[num]], check.contracts.values(), order, uses)
+        files.append(len(smvfiles) - 1)
+    return SmvFiles(smvfiles, files, duplicates, written)
+
+def variable_order(alphabet, contracts, uses=None):
+    """Orders an alphabet so the variables used together by contracts are declared next to each
+    other
+
+    Every assumption and guarantee adds one to the weight of the edges between the variables it
+    uses. The order starts from the variable with the heaviest edges and then places the variable
+    most connected to the variables already placed, ties and unconnected variables following the
+    alphabet order, so the order only depends on the specification.
+
+    Args:
+        alphabet: a list of tuples containing variables and initial values
+        contracts: a list of contract objects
+        uses: an optional dictionary from contract names to lists of variable sets, one per
+            assumption and guarantee, filled for the contracts missing from it
+
+    Returns:
+        A list of the alphabet tuples in order
+    """
+    uses = {} if uses is None else uses
+    position = dict([(var, num) for num, (var, _) in enumerate(alphabet)])
+    weights = dict([(var, {}) for var in position])
+    for contract in contracts:
+        if contract.name not in uses:
+            uses[contract.name] = [formula.variables([formula.parse(str(line))]) for line in
+                                   contract.assumptions + contract.guarantees]
+        for used in uses[contract.name]:
+            used = [var for var in used if var in position]
+            for var in used:
+                for other in used:
+                    if other != var:
+                        weights[var][other] = weights[var].get(other, 0) + 1
+
+    degree = dict([(var, sum(edges.values())) for var, edges in weights.iteritems()])
+    connection = dict([(var, 0) for var in position]) # edge weights to the placed variables
+    ordered = []
+    while connection:
+        var = min(connection, key=lambda var: (-connection[var], -degree[var], position[var]))
+        del connection[var]
+        ordered.append(alphabet[position[var]])
+        for other, weight in weights[var].iteritems():
+            if other in connection:
+                connection[other] += weight
+    return ordered
+
+def order_file(smvfile):
+    """Returns the name of the variable order file of a NuSMV file"""
+    return os.path.splitext(smvfile)[0] + ORDER_EXT
+
+def nusmv_command(smvfile, options=()):
+    """Builds the NuSMV command line checking a file
+
+    The variable order file of the NuSMV file is passed with -i when it exists, and -dynamic is
+    added when DYNAMIC_REORDERING is set.
+
+    Args:
+        smvfile: a string NuSMV file name
+        options: a list of string NuSMV options
+
+    Returns:
+        A list of string command line arguments
+    """
+    return [NUSMV] + list(options) + _order_options(smvfile) + [smvfile]
+
+def slice_alphabet(contracts, check):
+    """Returns the part of the system alphabet that a check depends on
+
+    Args:
+        contracts: a contracts object containing all the contracts in a system
+        check: a check object
+
+    Returns:
+        A list of tuples containing the variables and initial values used by the check
     """
+    return _slice(contracts.get_alphabet(), check, check.get_formula())
+
+def write_model(smvfile, alphabet, specs):
+    """Writes a NuSMV file declaring an alphabet and checking a list of formulas
+
+    Args:
+        smvfile: a string name for the generated NuSMV file
+        alphabet: a list of tuples containing variables and initial values
+        specs: a list of formula nodes, one LTL specification each
+    """
+    with open(smvfile, 'w') as ofile:
+        _write_model(ofile, alphabet, specs)
+
+def _write_ordered(smvfile, alphabet, specs, contracts, order, uses):
+    """Writes a NuSMV file and its variable order file, or removes a stale order file"""
+    ordfile = order_file(smvfile)
+    if order:
+        alphabet = variable_order(alphabet, contracts, uses)
+        with open(ordfile, 'w') as ofile:
+            ofile.write(''.join([var + '\n' for var, _ in alphabet]))
+    elif os.path.exists(ordfile):
+        os.remove(ordfile)
     with open(smvfile, 'w') as ofile:
+        _write_model(ofile, alphabet, specs)
+
+def _order_options(smvfile):
+    """Returns the NuSMV options reading the variable order of a file and enabling reordering"""
+    options = ['-i', order_file(smvfile)] if os.path.isfile(order_file(smvfile)) else []
+    return options + ['-dynamic'] if DYNAMIC_REORDERING else options
 
-        # write module heading declaration
-        ofile.write('MODULE main\n')
+def _slice(alphabet, check, spec):
+    """Returns the alphabet entries used by the contracts or the formula of a check"""
+    used = formula.variables([spec])
+    for contract in check.contracts.values():
+        used.update([var for (var, _) in contract.variables])
+    return [(var, init) for (var, init) in alphabet if var in used]
 
-        # write variable type declarations
-        ofile.write('VAR\n')
-        for (var, _) in contracts.get_alphabet():
-            ofile.write('\t' + var + ': boolean;\n')
+def _write_model(ofile, alphabet, specs):
+    """Writes a NuSMV main module declaring the alphabet and checking the formulas"""
 
-        # write variable assignment declarations
-        ofile.write('ASSIGN\n')
-        for (var, init) in contracts.get_alphabet():
-            ofile.write('\tinit(' + var + ') := ' + init + ';\n')
+    # write module heading declaration
+    ofile.write('MODULE main\n')
+
+    # write variable type declarations
+    ofile.write('VAR\n')
+    for (var, _) in alphabet:
+        ofile.write('\t' + var + ': boolean;\n')
+
+    # write variable assignment declarations
+    ofile.write('ASSIGN\n')
+    for (var, init) in alphabet:
+        ofile.write('\tinit(' + var + ') := ' + init + ';\n')
+    ofile.write('\n')
+
+    # write shared subformula declarations
+    defines = formula.shared(specs)
+    if defines:
+        ofile.write('DEFINE\n')
+        for node, name in defines.iteritems():
+            ofile.write('\t' + name + ' := ' + formula.to_str(node, defines, node) + ';\n')
         ofile.write('\n')
 
-        # write LTL specifications declarations for each check
-        for check in checks.checks:
-            ofile.write(check.get_ltl())
+    # write LTL specifications declarations for each check
+    for spec in specs:
+        ofile.write(formula.ltlspec(spec, defines))
 
-def run(smvfile, checks):
-    """runs the set of contracts and checks through NuSMV and parses the results to return to the user"""
+def run(smvfile, checks, jobs=1, cache=None, engine=NUSMV_ENGINE, sessions=None, metrics=None,
+        traces=None, decided=None):
+    """runs the set of contracts and checks through NuSMV and parses the results to return to the user
 
-    # Initialize an array to hold the results of the checks
+    The result of each check is printed as soon as it is known, checks sharing a specification
+    get the result of that specification. With a trace store, the counterexamples past its memory
+    budget are spilled to its file, only the first states of a spilled counterexample are printed
+    and it is returned as a spilled trace reading its states on demand.
+
+    Args:
+        smvfile: a string NuSMV file name, or a list of NuSMV file names as returned by generate
+        checks: a checks object containing the checks in the order of the NuSMV specifications
+        jobs: an integer number of NuSMV processes to run in parallel over a list of files
+        cache: an optional result cache object consulted before running NuSMV on each file
+        engine: a string model checking engine, one of ENGINES
+        sessions: an optional session pool object, its sessions are used instead of a worker pool
+        metrics: an optional metrics object recording the cost of every file and check
+        traces: an optional trace store object keeping the counterexamples within its budget
+        decided: an optional dictionary from the indices of the checks excluded from generate to
+            tuples containing their result, counterexample trace object or None and the string
+            engine which decided them
+
+    Returns:
+        A tuple containing a list of check results and a dictionary of counterexample traces
+
+    Raises:
+        ValueError: if NuSMV files given without the mapping of generate do not have one LTL
+            specification per check, or if the files end before the specification of a check
+    """
+    decided = decided or {}
+    specs = getattr(smvfile, 'specs', None)
+    if specs is None:
+        specs = _spec_indices(smvfile, checks, decided)
+    formulas = getattr(smvfile, 'formulas', None) or [None] * len(checks.checks)
+    outputs = {} # specification indices to their result, counterexample and deciding engine
+    pending = iter_run(smvfile, jobs, cache, engine, sessions, metrics, traces)
     results = []
+    counterexamples = {}
+    for num, check in enumerate(checks.checks):
+        if num not in decided and specs[num] not in outputs:
+            for spec, result, counterexample, decider in pending: # up to the check
+                outputs[spec] = (result, counterexample, decider)
+                if spec == specs[num]:
+                    break
+            else:
+                raise ValueError('the NuSMV files have no LTL specification for check ' +
+                                 str(num))
+        result, counterexample, decider = decided[num] if num in decided else \
+                                          outputs[specs[num]]
+        if counterexample is not None:
+            if traces is not None:
+                counterexample = traces.keep(num, counterexample)
+            counterexamples[num] = counterexample
+        results.append(result)
+        if metrics is not None:
+            metrics.add_check(check, result, counterexample, formulas[num])
+        _report(check, result, counterexample, engine, decider)
+    for _ in pending: # let the last file record its metrics and cache its results
+        pass
+    return results, counterexamples
+
+def _spec_indices(smvfile, checks, decided):
+    """Returns the specification index of every check of NuSMV files given without the mapping
+    of generate, which must have one LTL specification per check not decided"""
+    kept = [num for num in range(len(checks.checks)) if num not in decided]
+    count = 0
+    for afile in smvfile if isinstance(smvfile, list) else [smvfile]:
+        with open(afile, 'r') as ifile:
+            count += len([line for line in ifile if line.strip().startswith('LTLSPEC')])
+    if count != len(kept):
+        raise ValueError('%d LTL specifications for %d checks, pass the files returned by '
+                         'generate to map duplicate checks to their specification' %
+                         (count, len(kept)))
+    specs = [None] * len(checks.checks)
+    for spec, num in enumerate(kept):
+        specs[num] = spec
+    return specs
+
+def iter_run(smvfile, jobs=1, cache=None, engine=NUSMV_ENGINE, sessions=None, metrics=None,
+             traces=None):
+    """Runs NuSMV files and yields the result of each specification in order as it is produced
+
+    Files with the same model, such as the repeated file of checks sharing a specification or
+    identical checks of different system specifications, are run once and their results repeated.
+    With a trace store, the counterexamples are kept by the store before they are cached or
+    repeated, so only the handles of spilled counterexamples stay in memory, and files run in
+    process parse their counterexamples straight to its file once its budget is used up.
+
+    Args:
+        smvfile: a string NuSMV file name, or a list of NuSMV file names as returned by generate
+        jobs: an integer number of NuSMV processes to run in parallel over a list of files
+        cache: an optional result cache object consulted before running NuSMV on each file
+        engine: a string model checking engine, one of ENGINES
+        sessions: an optional session pool object, its sessions are used instead of a worker pool
+        metrics: an optional metrics object recording the cost of every file
+        traces: an optional trace store object keeping the counterexamples within its budget
+
+    Yields:
+        A tuple containing the specification index, the check result, the counterexample trace
+        object or None and the string engine which decided the specification
+    """
+    smvfiles = smvfile if isinstance(smvfile, list) else [smvfile]
+
+    # look up the results of unchanged models in the cache, once per distinct model
+    keys = [cache.key(afile) if cache else _model_key(afile) for afile in smvfiles]
+    firsts = {}
+    for num, key in enumerate(keys):
+        firsts.setdefault(key or num, num)
+    duplicate = [firsts[key or num] != num for num, key in enumerate(keys)]
+    repeated = set([key for num, key in enumerate(keys) if duplicate[num]])
+    outputs = [cache.get(key) if cache and not duplicate[num] else None
+               for num, key in enumerate(keys)]
+    missing = [smvfiles[num] for num, output in enumerate(outputs)
+               if output is None and not duplicate[num]]
+
+    # run the remaining NuSMV files in a worker pool when parallel jobs are requested
+    pool = None
+    if jobs > 1 and len(missing) > 1 and sessions is None:
+        pool = multiprocessing.Pool(min(jobs, len(missing)))
+        fresh = pool.imap(functools.partial(_check, engine=engine), missing)
+
+    try:
+        num = 0
+        number = 0 # traces are numbered across files as in a single NuSMV run
+        done = {}  # repeated model keys to the results of their first file
+        for index, (afile, key, output) in enumerate(zip(smvfiles, keys, outputs)):
+            usage = {}
+            if duplicate[index]:
+                file_results = [(result, copy.copy(counterexample), decider)
+                                for result, counterexample, decider in _iter_output(done[key])]
+            elif output is not None:
+                file_results = _iter_output(output)
+            elif pool:
+                results, counterexamples, deciders, usage = fresh.next()
+                file_results = _iter_output((results, counterexamples, deciders))
+            else:
+                file_results = iter_check(afile, engine, sessions, usage, traces)
+            first = num
+            collected = ([], {}, [])
+            for result, counterexample, decider in file_results:
+                if counterexample is not None:
+                    if not duplicate[index]: # repeated traces keep their number
+                        number += 1
+                        counterexample.number = number
+                    if traces is not None and not duplicate[index]:
+                        counterexample = traces.keep(None, counterexample)
+                    collected[1][len(collected[0])] = counterexample
+                collected[0].append(result)
+                collected[2].append(decider)
+                yield num, result, counterexample, decider
+                num += 1
+            if key in repeated:
+                done.setdefault(key, collected)
+            if cache and output is None and not duplicate[index]:
+                cache.put(key, collected)
+            if metrics is not None:
+                metrics.add_file(afile, range(first, num), usage, output is not None,
+                                 duplicate[index])
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+def iter_check(smvfile, engine=NUSMV_ENGINE, sessions=None, usage=None, traces=None):
+    """Runs NuSMV on a file and yields the result of each specification as soon as it is parsed
+
+    NuSMV output is read line by line from a pipe, so only the counterexample being parsed is
+    held in memory, as a packed trace object. A file whose specifications are all TRUE or FALSE
+    is decided without a model checker, and a file whose specifications use no temporal operators
+    other than G and F over state formulas is decided by the SAT solver. The native engine checks
+    the file in process and falls back to NuSMV for models it does not support. The portfolio
+    engine races the BDD and bounded model checking engines of NuSMV on the file. With a session
+    pool, the specifications are checked one at a time by an interactive NuSMV process which
+    already encoded the model.
+
+    Args:
+        smvfile: a string NuSMV file name
+        engine: a string model checking engine, one of ENGINES
+        sessions: an optional session pool object
+        usage: an optional dictionary updated with the cpu_seconds and max_rss_kb of the NuSMV
+            processes run on the file
+        traces: an optional trace store object providing the traces NuSMV counterexamples are
+            parsed into
+
+    Yields:
+        A tuple containing the check result, the counterexample trace object or None and the
+        string engine which decided the specification
+    """
+    decided = decide(smvfile)
+    if decided is not None:
+        for output in decided:
+            yield output
+        return
+
+    if engine == NATIVE_ENGINE:
+        try:
+            traces = native.check_file(smvfile)
+        except ValueError: # unsupported operators or values, let NuSMV decide
+            pass
+        else:
+            for counterexample in traces:
+                yield _decided((counterexample is not None, counterexample), NATIVE_ENGINE)
+            return
+
+    if engine == PORTFOLIO_ENGINE:
+        for output in race(smvfile, usage):
+            yield output
+        return
+
+    if sessions is not None:
+        session, specs = sessions.get(NUSMV, smvfile, _order_options(smvfile))
+        for spec in specs:
+            outputs = list(iter_results(session.check(spec), traces))
+            if len(outputs) != 1:
+                raise RuntimeError('NuSMV session did not check specification ' + spec)
+            yield _decided(outputs[0], BDD_ENGINE)
+        return
+
+    command = nusmv_command(smvfile)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        for output in iter_results(iter(process.stdout.readline, ''), traces):
+            yield _decided(output, BDD_ENGINE)
+        if reap(process, usage):
+            raise subprocess.CalledProcessError(process.returncode, command)
+    finally:
+        if process.poll() is None: # stopped early by the caller
+            process.kill()
+            process.wait()
+
+def race(smvfile, usage=None):
+    """Runs the BDD and bounded model checking engines of NuSMV on a file in parallel
+
+    The first conclusive run wins and the other one is killed. A BDD run always decides every
+    specification, a bounded run is conclusive only if it finds a counterexample for every
+    specification, and is restarted with a doubled bound while the BDD run is still going.
+
+    Args:
+        smvfile: a string NuSMV file name
+        usage: an optional dictionary updated with the cpu_seconds and max_rss_kb of the NuSMV
+            processes of both engines
 
-    # create the command and run in terminal
-    output = subprocess.check_output(['NuSMV', smvfile]).splitlines()
+    Returns:
+        A list of tuples containing the check result, the counterexample trace object or None and
+        the string engine which decided the specification
+    """
+    with open(smvfile, 'r') as ifile:
+        specs = len([line for line in ifile if line.strip().startswith('LTLSPEC')])
+    length = BMC_LENGTH
+    processes = {BDD_ENGINE: subprocess.Popen(nusmv_command(smvfile), stdout=subprocess.PIPE),
+                 BMC_ENGINE: _bmc(smvfile, length)}
+    outputs = dict([(engine, []) for engine in processes])
+    try:
+        while True:
+            streams = dict([(process.stdout.fileno(), engine)
+                            for engine, process in processes.iteritems()])
+            handle = select.select(streams.keys(), [], [])[0][0]
+            engine = streams[handle]
+            data = os.read(handle, READ_SIZE)
+            if data:
+                outputs[engine].append(data)
+                continue
+
+            # the run finished, decide if its results are conclusive
+            process = processes.pop(engine)
+            process.stdout.close()
+            if reap(process, usage) and engine == BDD_ENGINE:
+                raise subprocess.CalledProcessError(process.returncode, nusmv_command(smvfile))
+            results = list(iter_results(''.join(outputs[engine]).splitlines()))
+            if engine == BDD_ENGINE or not process.returncode and len(results) == specs and \
+               all([result for result, _ in results]):
+                return [_decided(output, engine) for output in results]
+
+            # deepen the bounded run
+            if not process.returncode and length < BMC_MAX_LENGTH:
+                length *= 2
+                processes[BMC_ENGINE] = _bmc(smvfile, length)
+                outputs[BMC_ENGINE] = []
+    finally:
+        for process in processes.values(): # the losing run
+            if process.poll() is None:
+                process.kill()
+            reap(process, usage)
+
+def decide(smvfile):
+    """Decides a NuSMV file without a model checker, if its specifications are all constants or
+    use no temporal operators other than G and F over state formulas
+
+    Args:
+        smvfile: a string NuSMV file name
+
+    Returns:
+        A list of tuples containing the check result, the counterexample trace object or None and
+        the string engine which decided the specification, or None if the file needs a model
+        checker
+    """
+    decided = _decide(smvfile)
+    if decided is not None:
+        return [_decided(output, SIMPLIFIER_ENGINE) for output in decided]
+    try:
+        traces = sat.check_file(smvfile)
+    except (IOError, ValueError): # temporal specifications, let the engine decide
+        return None
+    return [_decided((trace is not None, trace), SAT_ENGINE) for trace in traces]
+
+def reap(process, usage=None):
+    """Reaps a NuSMV process and adds its CPU time and peak memory to usage
+
+    Args:
+        process: a NuSMV process object
+        usage: an optional dictionary updated with the cpu_seconds and max_rss_kb of the process
+
+    Returns:
+        An integer exit status, negative when the process was killed by a signal
+    """
+    if process.returncode is not None: # already reaped
+        return process.returncode
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else \
+                         os.WEXITSTATUS(status)
+    if usage is not None:
+        usage['cpu_seconds'] = usage.get('cpu_seconds', 0.0) + rusage.ru_utime + rusage.ru_stime
+        usage['max_rss_kb'] = max(usage.get('max_rss_kb', 0), rusage.ru_maxrss)
+    return process.returncode
+
+def iter_results(lines, traces=None):
+    """Parses NuSMV output lines and yields each result once its counterexample is complete
 
-    # Get rid of all initial notes, warnings and blank lines
-    output = [x for x in output if not (x[:3] == '***' or x[:7] == 'WARNING' or x == '')]
-    # pprint(self.output)
+    Args:
+        lines: an iterable of string NuSMV output lines
+        traces: an optional trace store object providing the traces counterexamples are parsed
+            into, which are written straight to its file once its budget is used up
 
-    # Iterate through all remaining lines of output, stopping at each "-- specification line to parse it"
-    result_num = -1      # Counter to keep track of what result you're looking at
+    Yields:
+        A tuple containing the check result and the counterexample trace object or None
+    """
+    pending = None      # false result waiting for the end of its counterexample
     in_result = False   # Flag to track if you're in a counterexample output
-    temp_counterexample = []
-    counterexamples = {}
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        # Get rid of all initial notes, warnings and blank lines
+        if line[:3] == '***' or line[:7] == 'WARNING' or line == '':
+            continue
 
-    for line in output:
         # If this line is going to indicate whether or not a LTL spec is true/false
         if line[:16] == '-- specification':
-            if in_result == True:
-                in_result = False
-                # pprint(temp_counterexample)
-                counterexamples[result_num] = temp_counterexample
-                temp_counterexample = []
+            in_result = False
+            if pending:
+                yield pending
+                pending = None
             if 'is false' in line:
-                results.append(True)
-                result_num += 1
+                pending = (True, Trace() if traces is None else traces.trace())
             elif 'is true' in line:
-                results.append(False)
-                result_num += 1
+                yield False, None
 
         # If you are currently in a counterexample
         if in_result:
-            temp_counterexample.append(line)
+            pending[1].add_line(line)
 
         # If the next line is going to be the start of a counterexample, set the in_result flag
-        if line == 'Trace Type: Counterexample ':
+        if line == 'Trace Type: Counterexample ' and pending:
             in_result = True
 
-    if in_result:
-        in_result = False
-        counterexamples[result_num] = temp_counterexample
-        temp_counterexample = []
-
-    for x in range(result_num + 1):
-        print "Result of checking:", checks.checks[x]
-        if checks.checks[x].check_type == 'refinement':
-            print 'Statement is', not results[x]
-        else:    
-            print 'Statement is', results[x]
-            if results[x] == True:
-                print 'Example:'
-                for y in counterexamples[x]:
-                    print y
-                print ''
+    if pending:
+        yield pending
+
+def _decided(output, engine):
+    """Returns the result and counterexample of a specification with the engine which decided it,
+    also recorded on the counterexample"""
+    result, counterexample = output
+    if counterexample is not None:
+        counterexample.engine = engine
+    return result, counterexample, engine
+
+def _model_key(smvfile):
+    """Returns the canonical hash of a NuSMV file, or None if it cannot be read"""
+    try:
+        with open(smvfile, 'r') as ifile:
+            return model_key(ifile.read())
+    except IOError: # let the model checker report the file
+        return None
+
+def _decide(smvfile):
+    """Returns the results of a NuSMV file whose specifications are all constants, or None
+
+    A FALSE specification fails on every path, its counterexample is the initial state looping.
+    """
+    inits, specs = [], []
+    try:
+        with open(smvfile, 'r') as ifile:
+            for line in ifile:
+                line = line.strip().rstrip(';')
+                if line.startswith('init('):
+                    var, init = line[len('init('):].split(') :=', 1)
+                    inits.append((var.strip(), init.strip()))
+                elif line.startswith('LTLSPEC '):
+                    specs.append(line[len('LTLSPEC '):].strip())
+    except (IOError, ValueError): # let the model checker report the file
+        return None
+    if not specs or any([spec not in (formula.TRUE, formula.FALSE) for spec in specs]) or \
+       any([init not in (formula.TRUE, formula.FALSE) for _, init in inits]):
+        return None
+    outputs = []
+    for spec in specs:
+        if spec == formula.TRUE:
+            outputs.append((False, None))
+            continue
+        trace = Trace([var for var, _ in inits])
+        trace.add_state(dict([(var, init == formula.TRUE) for var, init in inits]))
+        trace.loop = 0
+        outputs.append((True, trace))
+    return outputs
+
+def _bmc(smvfile, length):
+    """Starts a bounded model checking NuSMV run searching counterexamples up to a length"""
+    return subprocess.Popen(nusmv_command(smvfile, ['-bmc', '-bmc_length', str(length)]),
+                            stdout=subprocess.PIPE)
+
+def _check(smvfile, engine=NUSMV_ENGINE):
+    """Runs NuSMV on a file and returns the list of results, dictionary of counterexamples, list
+    of deciding engines and resource usage of the NuSMV processes"""
+    results = []
+    counterexamples = {}
+    deciders = []
+    usage = {}
+    for result, counterexample, decider in iter_check(smvfile, engine, usage=usage):
+        if counterexample is not None:
+            counterexamples[len(results)] = counterexample
+        results.append(result)
+        deciders.append(decider)
+    return results, counterexamples, deciders, usage
+
+def _iter_output(output):
+    """Yields the results, counterexamples and deciding engines of a completed NuSMV run"""
+    results, counterexamples, deciders = output
+    for num, result in enumerate(results):
+        yield result, counterexamples.get(num), deciders[num]
+
+def _report(check, result, counterexample, engine=NUSMV_ENGINE, decider=None):
+    """Prints the result of a check, its counterexample and the engine which decided it"""
+    print "Result of checking:", check
+    if engine == PORTFOLIO_ENGINE:
+        print 'Decided by:', decider
+    if check.check_type == 'refinement':
+        print 'Statement is', not result
+    else:
+        print 'Statement is', result
+        if result == True:
+            print 'Example:'
+            spilled = isinstance(counterexample, SpilledTrace)
+            for y in counterexample.to_lines(SUMMARY_STATES if spilled else None) \
+                     if counterexample else []:
+                print y
+            if spilled and len(counterexample) > SUMMARY_STATES:
+                print '  ...', len(counterexample) - SUMMARY_STATES, 'more states in', \
+                      counterexample.path, 'at offset', counterexample.offset(SUMMARY_STATES)
+            print ''
+    sys.stdout.flush()
+
+def _tokenize(ifile):
+    """Yields the line number, comment-free contents and indentation of every non-empty line"""
+    for lineno, line in enumerate(ifile, 1):
+        line, ntabs = _clean_line(line)
+        if line:
+            yield lineno, line, ntabs
+
+def _includes(specfile, tokens):
+    """Yields the line number and path, relative to the specification file, of every include"""
+    for lineno, line, ntabs in tokens:
+        heading, _, path = line.partition(':')
+        if ntabs == FILE_HEADER_INDENT and heading.strip() == INCLUDE_HEADER and path.strip():
+            yield lineno, os.path.join(os.path.dirname(specfile), path.strip())
+
+def _header(line, names):
+    """Returns the first of the header names a header line contains, so variants such as
+    CONTRACTS: are accepted, else the line without its trailing colon"""
+    for name in names:
+        if name in line:
+            return name
+    return line[:-1].rstrip() if line.endswith(':') else line
 
 def _clean_line(line):
     """Returns a comment-free, tab-replaced line with no whitespace and the number of tabs"""
@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+"""Counterexample module defines a compact trace class that stores NuSMV counterexamples as a packed
+boolean state matrix, and a store which spills traces past a memory budget to an indexed file"""
+
+import os
+import re
+import json
+import mmap
+import base64
+import struct
+import tempfile
+import weakref
+from collections import OrderedDict
+
+# NuSMV trace line formats
+STATE_RE = re.compile(r'^\s*-> State: (\d+)\.(\d+) <-\s*$')
+VALUE_RE = re.compile(r'^\s*(\S+) = (\S+)\s*$')
+LOOP_LINE = '  -- Loop starts here'
+STATE_LINE = '  -> State: %d.%d <-'
+VALUE_LINE = '    %s = %s'
+VALUES = {'TRUE': True, 'FALSE': False}
+
+# binary serialisation attributes
+BINARY_MAGIC = 'LTLT'
+BINARY_HEADER = struct.Struct('<4sIIiI')
+
+# trace store attributes
+TRACE_BUDGET = 64 * 1024 * 1024
+SPOOL_STATES = 4096 # states copied at once from a spool file
+
+class Trace(object):
+    """Trace class stores a counterexample as a packed boolean matrix of states by variables
+
+    NuSMV prints only the variables that changed in each state after the first one, the trace
+    expands these deltas so every state holds the value of every variable.
+
+    Attributes:
+        variables: a list of string variable names, the column order of the matrix
+        index: a dictionary from variable names to column numbers
+        rows: a bytearray of packed states, one bit per variable
+        width: an integer number of bytes per state
+        loop: an integer index of the state the lasso loops back to, or None
+        number: an integer NuSMV trace number
+        engine: a string name of the engine which found the trace, or None
+    """
+    def __init__(self, variables=None):
+        """Initialize a trace object"""
+        self.variables = []
+        self.index = {}
+        self.rows = bytearray()
+        self.width = 0
+        self.loop = None
+        self.number = 1
+        self.engine = None
+        self._states = 0
+        self._loop_next = False
+        for name in variables or []:
+            self.add_variable(name)
+
+    def add_variable(self, name):
+        """Adds a variable column, initially FALSE in every state
+
+        Args:
+            name: a string variable name
+
+        Returns:
+            An integer column number of the variable
+        """
+        if name in self.index:
+            return self.index[name]
+        self.index[name] = len(self.variables)
+        self.variables.append(name)
+        width = (len(self.variables) + 7) // 8
+        if width > self.width: # repack every state into wider rows
+            rows = bytearray(width * len(self))
+            for state in range(len(self)):
+                rows[state * width:state * width + self.width] = self._row(state)
+            self.rows, self.width = rows, width
+        return self.index[name]
+
+    def add_state(self, values=None):
+        """Adds a state that repeats the previous state with some values changed
+
+        Args:
+            values: an optional dictionary from variable names to boolean values
+
+        Returns:
+            An integer index of the new state
+        """
+        self.rows.extend(self._row(len(self) - 1) if len(self) else bytearray(self.width))
+        self._states += 1
+        if self._loop_next:
+            self.loop, self._loop_next = len(self) - 1, False
+        for name, value in (values or {}).iteritems():
+            self.set_value(len(self) - 1, name, value)
+        return len(self) - 1
+
+    def set_value(self, state, name, value):
+        """Sets the value of a variable in a state
+
+        Args:
+            state: an integer state index
+            name: a string variable name
+            value: a boolean value
+        """
+        column = self.add_variable(name)
+        offset = state * self.width + column // 8
+        if value:
+            self.rows[offset] |= 1 << (column % 8)
+        else:
+            self.rows[offset] &= ~(1 << (column % 8)) & 0xff
+
+    def add_line(self, line):
+        """Parses one line of a NuSMV counterexample into the trace
+
+        Args:
+            line: a string line printed by NuSMV after the trace type line
+        """
+        if line.strip() == LOOP_LINE.strip():
+            self._loop_next = True
+            return
+        match = STATE_RE.match(line)
+        if match:
+            self.number = int(match.group(1))
+            self.add_state()
+            return
+        match = VALUE_RE.match(line)
+        if match and len(self):
+            if match.group(2) not in VALUES:
+                raise ValueError('non-boolean trace value: ' + line.strip())
+            self.set_value(len(self) - 1, match.group(1), VALUES[match.group(2)])
+
+    def value(self, state, name):
+        """Get the value of a variable in a state
+
+        Args:
+            state: an integer state index
+            name: a string variable name
+
+        Returns:
+            A boolean value
+        """
+        column = self.index[name]
+        return bool(self.rows[state * self.width + column // 8] >> (column % 8) & 1)
+
+    def state(self, state):
+        """Get all variable values of a state
+
+        Args:
+            state: an integer state index, negative indices count from the end
+
+        Returns:
+            An ordered dictionary from variable names to boolean values
+        """
+        state = state % len(self)
+        row = self._row(state)
+        return OrderedDict([(name, bool(row[column // 8] >> (column % 8) & 1))
+                            for column, name in enumerate(self.variables)])
+
+    def column(self, name):
+        """Get the values of a variable in every state
+
+        Args:
+            name: a string variable name
+
+        Returns:
+            A list of boolean values, one per state
+        """
+        column = self.index[name]
+        offset, bit = column // 8, column % 8
+        return [bool(self.rows[state * self.width + offset] >> bit & 1)
+                for state in range(len(self))]
+
+    def to_lines(self, limit=None):
+        """Get the trace in the NuSMV counterexample format, printing only changed values
+
+        Args:
+            limit: an optional integer maximum number of states to print
+
+        Returns:
+            A list of string lines
+        """
+        lines = []
+        previous = None
+        for state in range(len(self) if limit is None else min(limit, len(self))):
+            if state == self.loop:
+                lines.append(LOOP_LINE)
+            lines.append(STATE_LINE % (self.number, state + 1))
+            values = self.state(state)
+            for name, value in values.iteritems():
+                if previous is None or previous[name] != value:
+                    lines.append(VALUE_LINE % (name, 'TRUE' if value else 'FALSE'))
+            previous = values
+        return lines
+
+    def to_dict(self):
+        """Get a JSON serialisable dictionary of the trace
+
+        Returns:
+            A dictionary with the variables, loop, number, engine, state count and base64 packed
+            states
+        """
+        return {'variables': self.variables, 'loop': self.loop, 'number': self.number,
+                'engine': self.engine, 'states': len(self),
+                'rows': base64.b64encode(str(self.rows))}
+
+    def to_json(self):
+        """Get the trace serialised as a JSON string"""
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def to_bytes(self):
+        """Get the trace serialised in a compact binary format
+
+        Returns:
+            A string of a fixed header, the NUL separated variable names and the packed states
+        """
+        names = '\0'.join(self.variables)
+        loop = -1 if self.loop is None else self.loop
+        return BINARY_HEADER.pack(BINARY_MAGIC, len(self), self.number, loop, len(names)) + \
+               names + str(self.rows)
+
+    def write(self, ofile):
+        """Writes the trace to a file in the binary format of to_bytes
+
+        Args:
+            ofile: a file object opened for binary writing
+        """
+        ofile.write(self.to_bytes())
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Parses a NuSMV counterexample
+
+        Args:
+            lines: a sequence of string lines printed by NuSMV after the trace type line
+
+        Returns:
+            A trace object
+        """
+        trace = cls()
+        for line in lines:
+            trace.add_line(line)
+        return trace
+
+    @classmethod
+    def from_dict(cls, data):
+        """Loads a trace from a dictionary as returned by to_dict"""
+        trace = cls(data['variables'])
+        trace.rows = bytearray(base64.b64decode(data['rows']))
+        trace._states = data['states']
+        trace.loop = data['loop']
+        trace.number = data['number']
+        trace.engine = data.get('engine')
+        return trace
+
+    @classmethod
+    def from_json(cls, text):
+        """Loads a trace from a string as returned by to_json"""
+        return cls.from_dict(json.loads(text))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Loads a trace from a string as returned by to_bytes"""
+        magic, states, number, loop, size = BINARY_HEADER.unpack_from(data)
+        if magic != BINARY_MAGIC:
+            raise ValueError('not a binary trace')
+        start = BINARY_HEADER.size
+        names = data[start:start + size]
+        trace = cls(names.split('\0') if names else [])
+        trace.rows = bytearray(data[start + size:])
+        trace._states = states
+        trace.loop = None if loop < 0 else loop
+        trace.number = number
+        return trace
+
+    def _row(self, state):
+        """Returns the packed bytes of a state"""
+        return self.rows[state * self.width:(state + 1) * self.width]
+
+    def __len__(self):
+        """Returns the number of states"""
+        return self._states
+
+    def __eq__(self, other):
+        """Override the default Equals behavior"""
+        if isinstance(other, self.__class__):
+            return (self.variables, self.rows, self.loop, self.number) == \
+                   (other.variables, other.rows, other.loop, other.number)
+        return False
+
+    def __ne__(self, other):
+        """Define a non-equality test"""
+        return not self.__eq__(other)
+
+class SpilledTrace(Trace):
+    """SpilledTrace class is a read-only trace whose states stay in a trace store file
+
+    States are read from the memory-mapped file on demand, every state is a fixed-width row at a
+    known offset of the file.
+
+    Attributes:
+        path: a string trace store file name
+        start: an integer offset of the serialised trace in the file
+    """
+    def __init__(self, store, start, engine=None):
+        """Initialize a trace handle from the header of a serialised trace"""
+        data = store.view()
+        _, states, number, loop, size = BINARY_HEADER.unpack_from(data, start)
+        names = data[start + BINARY_HEADER.size:start + BINARY_HEADER.size + size]
+        self.variables = names.split('\0') if names else []
+        self.index = dict([(name, column) for column, name in enumerate(self.variables)])
+        self.width = (len(self.variables) + 7) // 8
+        self.loop = None if loop < 0 else loop
+        self.number = number
+        self.engine = engine
+        self.path = store.path
+        self.start = start
+        self._states = states
+        self._store = store
+        self._base = start + BINARY_HEADER.size + size
+
+    @property
+    def rows(self):
+        """Get a read-only view of the packed states in the file"""
+        return _Rows(self._store, self._base, self._states * self.width)
+
+    def offset(self, state):
+        """Get the file offset of the packed row of a state
+
+        Args:
+            state: an integer state index
+
+        Returns:
+            An integer byte offset in the trace store file
+        """
+        return self._base + state * self.width
+
+class TraceWriter(Trace):
+    """TraceWriter class parses a counterexample for a trace store without holding its states
+
+    Only the last state is kept in memory, earlier states are spooled to a temporary file until the
+    store writes the trace, so the trace can only be written once it is complete.
+
+    Attributes:
+        store: the trace store object the trace is written to
+    """
+    def __init__(self, store):
+        """Initialize an empty trace spooled next to the file of a trace store"""
+        Trace.__init__(self)
+        self.store = store
+        self._spool = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(store.path)))
+        self._widths = [] # runs of spooled states of the same row width, as [states, width] lists
+
+    def add_variable(self, name):
+        """Adds a variable column, the spooled states are widened when the trace is written"""
+        if name in self.index:
+            return self.index[name]
+        self.index[name] = len(self.variables)
+        self.variables.append(name)
+        width = (len(self.variables) + 7) // 8
+        if width > self.width:
+            if len(self):
+                self.rows.extend(bytearray(width - self.width))
+            self.width = width
+        return self.index[name]
+
+    def add_state(self, values=None):
+        """Spools the last state and adds a state that repeats it with some values changed"""
+        if len(self):
+            self._spool.write(str(self.rows))
+            if self._widths and self._widths[-1][1] == self.width:
+                self._widths[-1][0] += 1
+            else:
+                self._widths.append([1, self.width])
+        else:
+            self.rows = bytearray(self.width)
+        self._states += 1
+        if self._loop_next:
+            self.loop, self._loop_next = len(self) - 1, False
+        for name, value in (values or {}).iteritems():
+            self.set_value(len(self) - 1, name, value)
+        return len(self) - 1
+
+    def set_value(self, state, name, value):
+        """Sets the value of a variable in the last state"""
+        if state != len(self) - 1:
+            raise ValueError('only the last state of a trace being written can change')
+        Trace.set_value(self, 0, name, value)
+
+    def write(self, ofile):
+        """Writes the trace in the binary format of to_bytes and removes the spool file"""
+        names = '\0'.join(self.variables)
+        loop = -1 if self.loop is None else self.loop
+        ofile.write(BINARY_HEADER.pack(BINARY_MAGIC, len(self), self.number, loop, len(names)) +
+                    names)
+        self._spool.seek(0)
+        for states, width in self._widths:
+            padding = '\0' * (self.width - width)
+            for start in range(0, states, SPOOL_STATES):
+                count = min(SPOOL_STATES, states - start)
+                data = self._spool.read(count * width)
+                ofile.write(data if not padding else
+                            ''.join([data[num * width:(num + 1) * width] + padding
+                                     for num in range(count)]))
+        ofile.write(str(self.rows))
+        self._spool.close()
+
+class _Rows(object):
+    """Read-only view of the packed states of a spilled trace"""
+    def __init__(self, store, base, size):
+        """Initialize a view of size bytes starting at base"""
+        self._store = store
+        self._base = base
+        self._size = size
+
+    def __getitem__(self, key):
+        """Returns a byte value, or a bytearray of a slice"""
+        data = self._store.view()
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(self._size)
+            return bytearray(data[self._base + start:self._base + max(start, stop)])
+        if not 0 <= key < self._size:
+            raise IndexError('row offset out of range')
+        return ord(data[self._base + key])
+
+    def __len__(self):
+        """Returns the number of bytes"""
+        return self._size
+
+    def __str__(self):
+        """Returns all bytes"""
+        return str(self[:])
+
+class TraceStore(object):
+    """TraceStore class keeps counterexample traces in memory up to a budget, and spills later
+    traces to an indexed file
+
+    Traces kept again, such as the trace of a specification shared by several checks, are counted
+    and written once.
+
+    Attributes:
+        path: a string file name the spilled traces are appended to, created on the first spill
+        budget: an integer maximum number of bytes of packed states kept in memory
+        used: an integer number of bytes of packed states kept in memory
+        index: a dictionary from check indices to the offset and size of their spilled trace
+    """
+    def __init__(self, path, budget=TRACE_BUDGET):
+        """Initialize an empty trace store"""
+        self.path = path
+        self.budget = budget
+        self.used = 0
+        self.index = {}
+        self._kept = weakref.WeakValueDictionary() # ids of the traces kept in memory
+        self._file = None
+        self._map = None
+        self._spilled = False
+
+    def trace(self):
+        """Get a new trace to parse a counterexample into
+
+        Returns:
+            A trace object, or a trace writer object once the budget is used up
+        """
+        return Trace() if self.used < self.budget else TraceWriter(self)
+
+    def keep(self, num, trace):
+        """Keeps a trace in memory if it fits the budget, else appends it to the file
+
+        Args:
+            num: an integer check index, or None to keep a trace which is indexed later
+            trace: a trace object
+
+        Returns:
+            The trace object, or a spilled trace object reading it from the file
+        """
+        if isinstance(trace, SpilledTrace) and trace._store is self:
+            start = trace.start
+            size = trace.offset(len(trace)) - start
+        elif self._kept.get(id(trace)) is trace:
+            return trace
+        elif not isinstance(trace, TraceWriter) and \
+             self.used + len(trace.rows) <= self.budget:
+            self.used += len(trace.rows)
+            self._kept[id(trace)] = trace
+            return trace
+        else:
+            self._open()
+            self._file.seek(0, os.SEEK_END)
+            start = self._file.tell()
+            trace.write(self._file)
+            self._file.flush()
+            self._spilled = True
+            size = self._file.tell() - start
+            trace = SpilledTrace(self, start, trace.engine)
+        if num is not None:
+            self.index[num] = (start, size)
+        return trace
+
+    def get(self, num):
+        """Get the spilled trace of a check
+
+        Args:
+            num: an integer check index
+
+        Returns:
+            A spilled trace object, or None if the trace of the check was not spilled
+        """
+        if num not in self.index:
+            return None
+        return SpilledTrace(self, self.index[num][0])
+
+    def view(self):
+        """Returns a read-only memory map of the file, mapped again after it grew"""
+        self._open()
+        size = os.fstat(self._file.fileno()).st_size
+        if self._map is None or len(self._map) < size:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _open(self):
+        """Opens the file, truncating it on the first spill"""
+        if self._file is None:
+            self._file = open(self.path, 'r+b' if self._spilled else 'w+b')
+
+    def close(self):
+        """Unmaps and closes the file, which is kept on disk"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+"""Formula module defines a hash-consed LTL formula DAG, a parser for the NuSMV LTL syntax used
+in contract specifications, a rewriting simplifier and a printer that emits shared subformulas as
+NuSMV DEFINE macros"""
+
+import re
+import weakref
+from collections import OrderedDict
+
+# formula operators
+TRUE = 'TRUE'
+FALSE = 'FALSE'
+VAR = 'var'
+RAW = 'raw'
+NOT = '!'
+AND = '&'
+OR = '|'
+XOR = 'xor'
+XNOR = 'xnor'
+IMPLIES = '->'
+IFF = '<->'
+EQUAL = '='
+NOT_EQUAL = '!='
+TEMPORAL_UNARY = ('X', 'G', 'F', 'Y', 'Z', 'H', 'O')
+TEMPORAL_BINARY = ('U', 'V', 'S', 'T')
+
+# simplifier identities of temporal operators
+_IDEMPOTENT = ('G', 'F', 'H', 'O')        # op op p = op p
+_CONSTANT_PRESERVING = ('X', 'G', 'F', 'H', 'O')  # op TRUE = TRUE and op FALSE = FALSE
+_DUALS = {'X': 'X', 'G': 'F', 'F': 'G'}   # !op !p = dual p
+_COMMUTATIVE = (AND, OR, XOR, XNOR, IFF, EQUAL, NOT_EQUAL)
+
+# DEFINE macro attributes
+DEFINE_PREFIX = '_ltl_def'
+
+# parser token patterns
+_TOKEN_RE = re.compile(r'\s*(?:(<->|->|!=|[!&|()=])|([A-Za-z_][A-Za-z0-9_$#.]*))')
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_$#.]*')
+
+# binary operator precedence, lowest first
+_BINARY_LEVELS = [(IMPLIES,), (IFF,), (OR, XOR, XNOR), (AND,), TEMPORAL_BINARY, (EQUAL, NOT_EQUAL)]
+_RIGHT_ASSOCIATIVE = (IMPLIES,)
+
+# hash-consing table of all live formula nodes
+_NODES = weakref.WeakValueDictionary()
+_COUNTER = [0]
+
+# parsed texts to formula nodes, least recently used first
+_PARSED = OrderedDict()
+PARSED_SIZE = 4096
+
+class Formula(object):
+    """Formula class is an immutable, hash-consed node of an LTL formula DAG
+
+    Formula nodes are only created through the module factory functions, which return the existing
+    node for any structurally identical formula, so identity comparison is structural equality.
+
+    Attributes:
+        op: a string operator, one of the module operator constants
+        args: a tuple of child formula nodes, or a tuple holding the name of a variable or raw text
+        uid: an integer creation index, children always have a smaller uid than their parents
+        temporal: a boolean indicating if the formula may contain temporal operators
+    """
+    __slots__ = ('op', 'args', 'uid', 'temporal', '__weakref__')
+
+    def __init__(self, op, args, temporal):
+        """Initialize a formula node, use the module factory functions instead"""
+        self.op = op
+        self.args = args
+        self.uid = _COUNTER[0]
+        self.temporal = temporal
+        _COUNTER[0] += 1
+
+    def is_atom(self):
+        """Check if the formula is a constant, a variable or raw text
+
+        Returns:
+            A boolean indicating if the formula has no child formulas
+        """
+        return self.op in (TRUE, FALSE, VAR, RAW)
+
+    def is_literal(self):
+        """Check if the formula is an atom or a negated atom
+
+        Returns:
+            A boolean indicating if the formula is a literal
+        """
+        return self.is_atom() or (self.op == NOT and self.args[0].is_atom())
+
+    def __str__(self):
+        """Override the print behavior"""
+        return to_str(self)
+
+    def __repr__(self):
+        """Override the representation behavior"""
+        return 'Formula(' + to_str(self) + ')'
+
+    def __reduce__(self):
+        """Pickle formulas by their operator and arguments so unpickled nodes are hash-consed again
+        with the same structure"""
+        return (_mk, (self.op, self.args))
+
+def _mk(op, args):
+    """Returns the unique formula node for an operator and its arguments"""
+    key = (op, args)
+    node = _NODES.get(key)
+    if node is None:
+        if op in (VAR, TRUE, FALSE):
+            temporal = False
+        elif op == RAW:
+            temporal = True # unparsed text may hide temporal operators
+        else:
+            temporal = op in TEMPORAL_UNARY or op in TEMPORAL_BINARY or \
+                       any(arg.temporal for arg in args)
+        node = Formula(op, args, temporal)
+        _NODES[key] = node
+    return node
+
+def true():
+    """Returns the TRUE constant"""
+    return _mk(TRUE, ())
+
+def false():
+    """Returns the FALSE constant"""
+    return _mk(FALSE, ())
+
+def var(name):
+    """Returns the variable with the given name"""
+    return _mk(VAR, (name,))
+
+def raw(text):
+    """Returns an opaque formula for text that could not be parsed"""
+    return _mk(RAW, (text.strip(),))
+
+def mk_not(node):
+    """Returns logical not of node"""
+    return _mk(NOT, (node,))
+
+def mk_and(*nodes):
+    """Returns logical and of all nodes"""
+    return conj(nodes)
+
+def mk_or(*nodes):
+    """Returns logical or of all nodes"""
+    return disj(nodes)
+
+def mk_imply(anode, bnode):
+    """Returns logical implication of bnode by anode"""
+    return _mk(IMPLIES, (anode, bnode))
+
+def mk_unary(op, node):
+    """Returns a unary temporal operator applied to node"""
+    return _mk(op, (node,))
+
+def mk_binary(op, anode, bnode):
+    """Returns a binary operator applied to anode and bnode"""
+    return _mk(op, (anode, bnode))
+
+def conj(nodes):
+    """Returns the n-ary logical and of a sequence of nodes
+
+    Args:
+        nodes: a sequence of formula nodes
+
+    Returns:
+        A single formula node, the node itself for one element and TRUE for none
+    """
+    nodes = tuple(nodes)
+    if not nodes:
+        return true()
+    if len(nodes) == 1:
+        return nodes[0]
+    return _mk(AND, nodes)
+
+def disj(nodes):
+    """Returns the n-ary logical or of a sequence of nodes
+
+    Args:
+        nodes: a sequence of formula nodes
+
+    Returns:
+        A single formula node, the node itself for one element and FALSE for none
+    """
+    nodes = tuple(nodes)
+    if not nodes:
+        return false()
+    if len(nodes) == 1:
+        return nodes[0]
+    return _mk(OR, nodes)
+
+def to_formula(value):
+    """Returns value as a formula node, parsing it if it is a string"""
+    if isinstance(value, Formula):
+        return value
+    return parse(value)
+
+def parse(text):
+    """Parses a NuSMV LTL expression into a formula node
+
+    Text that does not follow the supported syntax is kept as a single raw node, so that it is
+    still passed through to NuSMV unchanged.
+
+    Args:
+        text: a string LTL expression
+
+    Returns:
+        A formula node
+    """
+    node = _PARSED.pop(text, None)
+    if node is None:
+        try:
+            node = _Parser(text).parse()
+        except ValueError:
+            node = raw(text)
+    _PARSED[text] = node # mark as recently used
+    while len(_PARSED) > PARSED_SIZE:
+        _PARSED.popitem(last=False)
+    return node
+
+class _Parser(object):
+    """Recursive descent parser for NuSMV LTL expressions"""
+    def __init__(self, text):
+        """Tokenize the input text"""
+        self.tokens = []
+        self.pos = 0
+        text = text.rstrip()
+        index = 0
+        while index < len(text):
+            match = _TOKEN_RE.match(text, index)
+            if not match or match.end() == index:
+                raise ValueError('unexpected character at ' + str(index))
+            self.tokens.append(match.group(1) or match.group(2))
+            index = match.end()
+
+    def parse(self):
+        """Parse the full token list"""
+        node = self._binary(0)
+        if self.pos != len(self.tokens):
+            raise ValueError('unexpected token ' + self.tokens[self.pos])
+        return node
+
+    def _peek(self):
+        """Returns the next token or None"""
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        """Consumes and returns the next token"""
+        token = self._peek()
+        if token is None:
+            raise ValueError('unexpected end of expression')
+        self.pos += 1
+        return token
+
+    def _binary(self, level):
+        """Parses a binary expression at the given precedence level"""
+        if level == len(_BINARY_LEVELS):
+            return self._unary()
+        operators = _BINARY_LEVELS[level]
+        node = self._binary(level + 1)
+        while self._peek() in operators:
+            op = self._next()
+            if op in _RIGHT_ASSOCIATIVE:
+                return _mk(op, (node, self._binary(level)))
+            node = _mk(op, (node, self._binary(level + 1)))
+        return node
+
+    def _unary(self):
+        """Parses a unary expression"""
+        token = self._next()
+        if token == NOT:
+            return mk_not(self._unary())
+        if token in TEMPORAL_UNARY:
+            return mk_unary(token, self._unary())
+        if token == '(':
+            node = self._binary(0)
+            if self._next() != ')':
+                raise ValueError('expected )')
+            return node
+        if token == TRUE:
+            return true()
+        if token == FALSE:
+            return false()
+        if token in TEMPORAL_BINARY or not re.match(r'[A-Za-z_]', token) or \
+           token in (XOR, XNOR):
+            raise ValueError('unexpected token ' + token)
+        return var(token)
+
+def _render(node, strs):
+    """Renders one node given the rendered strings of its children"""
+    op = node.op
+    if op in (TRUE, FALSE):
+        return op
+    if op == VAR:
+        return node.args[0]
+    if op == RAW:
+        return '(' + node.args[0] + ')'
+    if op == NOT:
+        return '!' + strs[node.args[0]]
+    if op in TEMPORAL_UNARY:
+        return op + ' ' + strs[node.args[0]]
+    return '(' + (' ' + op + ' ').join([strs[arg] for arg in node.args]) + ')'
+
+def to_str(node, names=None, expand=None):
+    """Renders a formula as NuSMV text
+
+    Args:
+        node: a formula node
+        names: an optional dictionary from formula nodes to DEFINE names used in their place
+        expand: an optional node which is rendered in full even if it is named
+
+    Returns:
+        A string NuSMV expression
+    """
+    names = names or {}
+    strs = {}
+    stack = [node]
+    while stack:
+        top = stack[-1]
+        if top in strs:
+            stack.pop()
+        elif top in names and top is not expand:
+            strs[top] = names[top]
+            stack.pop()
+        elif top.is_atom():
+            strs[top] = _render(top, strs)
+            stack.pop()
+        else:
+            pending = [arg for arg in top.args if arg not in strs]
+            if pending:
+                stack.extend(pending)
+            else:
+                strs[top] = _render(top, strs)
+                stack.pop()
+    return strs[node]
+
+def nodes(roots):
+    """Returns all nodes reachable from the roots, children before parents
+
+    Args:
+        roots: a sequence of formula nodes
+
+    Returns:
+        A list of distinct formula nodes sorted by creation index
+    """
+    seen = set()
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            if not node.is_atom():
+                stack.extend(node.args)
+    return sorted(seen, key=lambda node: node.uid)
+
+def variables(roots):
+    """Returns the names of all variables used in the roots
+
+    Args:
+        roots: a sequence of formula nodes
+
+    Returns:
+        A set of string variable names, which over-approximates the variables of raw formulas
+    """
+    names = set()
+    for node in nodes(roots):
+        if node.op == VAR:
+            names.add(node.args[0])
+        elif node.op == RAW: # every identifier of unparsed text may be a variable
+            names.update(_IDENTIFIER_RE.findall(node.args[0]))
+    return names
+
+def shared(roots):
+    """Selects the subformulas worth emitting once as NuSMV DEFINE macros
+
+    A node is shared when its text would otherwise be printed more than once across all roots.
+    NuSMV only accepts propositional DEFINE bodies, so nodes with temporal operators stay inline.
+
+    Args:
+        roots: a sequence of formula nodes
+
+    Returns:
+        An ordered dictionary from formula nodes to DEFINE names, children before parents
+    """
+    order = nodes(roots)
+    uses = dict([(node, 0) for node in order])
+    for root in roots:
+        uses[root] += 1
+    names = OrderedDict()
+    for node in reversed(order): # parents before children
+        if node.is_atom():
+            continue
+        if uses[node] > 1 and not node.temporal and not node.is_literal():
+            names[node] = None
+            weight = 1
+        else:
+            weight = uses[node]
+        for arg in node.args:
+            uses[arg] += weight
+    # numbered in a postorder walk of the roots, so the names do not depend on other formulas
+    # built earlier in the process
+    defines = OrderedDict()
+    seen = set()
+    stack = [(root, False) for root in reversed(roots)]
+    while stack:
+        node, done = stack.pop()
+        if done:
+            if node in names:
+                defines[node] = DEFINE_PREFIX + str(len(defines))
+        elif node not in seen:
+            seen.add(node)
+            stack.append((node, True))
+            if not node.is_atom():
+                stack.extend([(arg, False) for arg in reversed(node.args)])
+    return defines
+
+def simplify(node, memo=None):
+    """Rewrites a formula into an equivalent, usually smaller formula
+
+    Constants are folded, nested conjunctions and disjunctions are flattened and their duplicate
+    or complementary arguments removed, double negations are dropped and basic LTL identities
+    such as G G p = G p and X TRUE = TRUE are applied. Raw formulas are kept as they are.
+
+    Args:
+        node: a formula node
+        memo: an optional dictionary from formula nodes to their simplified nodes, shared between
+            calls on formulas with common subformulas
+
+    Returns:
+        A formula node, TRUE or FALSE if the formula is decided by the rewriting alone
+    """
+    memo = {} if memo is None else memo
+    for top in nodes([node]):
+        if top not in memo:
+            memo[top] = top if top.is_atom() else \
+                        _rewrite(top.op, [memo[arg] for arg in top.args])
+    return memo[node]
+
+def simplify_all(roots):
+    """Simplifies a list of formulas sharing one memo
+
+    Args:
+        roots: a sequence of formula nodes
+
+    Returns:
+        A list of simplified formula nodes
+    """
+    memo = {}
+    return [simplify(root, memo) for root in roots]
+
+def canonical(node, memo=None):
+    """Returns a canonical node of a formula, equal for formulas which only differ in the order of
+    the arguments of commutative operators
+
+    Args:
+        node: a formula node
+        memo: an optional dictionary from nodes to their canonical node and text, shared between
+            calls
+
+    Returns:
+        A formula node
+    """
+    memo = {} if memo is None else memo
+    for current in nodes([node]):
+        if current in memo:
+            continue
+        if current.is_atom():
+            memo[current] = (current, to_str(current))
+            continue
+        args = [memo[arg] for arg in current.args]
+        if current.op in _COMMUTATIVE:
+            args.sort(key=lambda arg: arg[1])
+        result = _mk(current.op, tuple([arg for arg, _ in args]))
+        memo[current] = (result, current.op + '(' + ','.join([text for _, text in args]) + ')')
+    return memo[node][0]
+
+def _rewrite(op, args):
+    """Returns the simplified node of an operator applied to simplified arguments"""
+    top, bottom = true(), false()
+    if op == NOT:
+        arg = args[0]
+        if arg.op in (TRUE, FALSE):
+            return bottom if arg is top else top
+        if arg.op == NOT:
+            return arg.args[0]
+        if arg.op in _DUALS and arg.args[0].op == NOT:
+            return mk_unary(_DUALS[arg.op], arg.args[0].args[0])
+        return mk_not(arg)
+
+    if op in (AND, OR):
+        unit, zero = (top, bottom) if op == AND else (bottom, top)
+        flat = OrderedDict()
+        for arg in args:
+            for item in arg.args if arg.op == op else (arg,):
+                if item is zero:
+                    return zero
+                if item is not unit:
+                    flat[item] = None
+        for item in flat:
+            if item.op == NOT and item.args[0] in flat: # p & !p, p | !p
+                return zero
+        return conj(flat.keys()) if op == AND else disj(flat.keys())
+
+    if op == IMPLIES:
+        anode, bnode = args
+        if anode is top:
+            return bnode
+        if anode is bottom or bnode is top or anode is bnode:
+            return top
+        if bnode is bottom:
+            return _rewrite(NOT, [anode])
+        return mk_imply(anode, bnode)
+
+    if op in (IFF, XNOR, EQUAL, XOR, NOT_EQUAL):
+        anode, bnode = args
+        same = op in (IFF, XNOR, EQUAL) # true when both sides are equal
+        if anode is bnode:
+            return top if same else bottom
+        for cnode, other in ((anode, bnode), (bnode, anode)):
+            if cnode.op in (TRUE, FALSE):
+                return other if (cnode is top) == same else _rewrite(NOT, [other])
+        return mk_binary(op, anode, bnode)
+
+    if op in TEMPORAL_UNARY:
+        arg = args[0]
+        if op in _CONSTANT_PRESERVING and arg.op in (TRUE, FALSE):
+            return arg
+        if (op == 'Y' and arg is bottom) or (op == 'Z' and arg is top):
+            return arg
+        if op in _IDEMPOTENT and arg.op == op:
+            return arg
+        return mk_unary(op, arg)
+
+    if op in ('U', 'V'):
+        anode, bnode = args
+        if bnode.op in (TRUE, FALSE) or anode is bnode:
+            return bnode
+        if anode is (bottom if op == 'U' else top): # FALSE U q = q, TRUE V q = q
+            return bnode
+        return mk_binary(op, anode, bnode)
+
+    return _mk(op, tuple(args))
+
+def ltlspec(node, names=None):
+    """Returns a NuSMV LTLSPEC declaration line for node
+
+    Args:
+        node: a formula node
+        names: an optional dictionary from formula nodes to DEFINE names
+
+    Returns:
+        A string LTLSPEC declaration
+    """
+    return '\tLTLSPEC ' + to_str(node, names) + ';\n'
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""Matrix module computes the refinement relation among the contracts of a refinement matrix, model
+checking only the pairs which do not follow from the results already known"""
+
+import os
+import formula
+from core import write_model, iter_run, NUSMV_ENGINE
+
+class RefinementOrder(object):
+    """RefinementOrder class stores the refinement relation among a list of contracts
+
+    Refinement is reflexive and transitive, so the relation is a preorder, and contracts refining
+    each other form one equivalence class of its partial order.
+
+    Attributes:
+        names: a list of string contract names, in matrix order
+        refines: a dictionary from tuples of two contract names to a boolean indicating if the
+            first contract refines the second
+        counterexamples: a dictionary from tuples of two contract names, the first not refining
+            the second, to counterexample trace objects
+        implied: a dictionary from tuples of two contract names to the tuple of the two known
+            pairs their result was inferred from
+        checked: an integer number of pairs decided by the model checker
+    """
+    def __init__(self, names):
+        """Initialize a refinement order with only the reflexive pairs known"""
+        self.names = list(names)
+        self.refines = dict([((name, name), True) for name in names])
+        self.counterexamples = {}
+        self.implied = {}
+        self.checked = 0
+        self._up = dict([(name, set([name])) for name in names])    # contracts refined by name
+        self._down = dict([(name, set([name])) for name in names])  # contracts refining name
+
+    def add(self, aname, bname, refines, counterexample=None):
+        """Records a model checked pair and every refining pair it implies by transitivity
+
+        Args:
+            aname: a string name of the refining contract
+            bname: a string name of the refined contract
+            refines: a boolean indicating if contract aname refines contract bname
+            counterexample: a counterexample trace object if contract aname does not refine bname
+        """
+        self.checked += 1
+        self.implied.pop((aname, bname), None)
+        self.refines[(aname, bname)] = refines
+        if not refines:
+            if counterexample is not None:
+                self.counterexamples[(aname, bname)] = counterexample
+            return
+        for lower in list(self._down[aname]):
+            for upper in list(self._up[bname]):
+                if (lower, upper) not in self.refines:
+                    self.implied[(lower, upper)] = ((lower, aname), (bname, upper))
+                self.refines[(lower, upper)] = True
+                self._up[lower].add(upper)
+                self._down[upper].add(lower)
+
+    def infer(self, aname, bname):
+        """Decides a pair from the known results, if possible
+
+        Contract a cannot refine contract b when some contract refining a does not refine b, or
+        when a does not refine some contract refined by b.
+
+        Args:
+            aname: a string name of the refining contract
+            bname: a string name of the refined contract
+
+        Returns:
+            A boolean result of the pair, or None if it does not follow from the known pairs
+        """
+        if (aname, bname) in self.refines:
+            return self.refines[(aname, bname)]
+        for lower in self._down[aname]:
+            if self.refines.get((lower, bname)) is False:
+                self.refines[(aname, bname)] = False
+                self.implied[(aname, bname)] = ((lower, aname), (lower, bname))
+                return False
+        for upper in self._up[bname]:
+            if self.refines.get((aname, upper)) is False:
+                self.refines[(aname, bname)] = False
+                self.implied[(aname, bname)] = ((bname, upper), (aname, upper))
+                return False
+        return None
+
+    def classes(self):
+        """Get the equivalence classes of contracts refining each other
+
+        Returns:
+            A list of lists of string contract names, in matrix order
+        """
+        classes, seen = [], set()
+        for name in self.names:
+            if name not in seen:
+                classes.append([other for other in self.names
+                                if other in self._up[name] and other in self._down[name]])
+                seen.update(classes[-1])
+        return classes
+
+    def hasse(self):
+        """Get the covering pairs of the partial order of the equivalence classes
+
+        Returns:
+            A list of tuples of two string contract names, the first name of each class, such that
+            the first class strictly refines the second with no class in between
+        """
+        heads = [aclass[0] for aclass in self.classes()]
+        above = dict([(head, set([other for other in heads if other != head and
+                                  other in self._up[head]])) for head in heads])
+        return [(head, upper) for head in heads for upper in heads if upper in above[head] and
+                not any([upper in above[middle] for middle in above[head]])]
+
+    def __str__(self):
+        """Override the print behavior"""
+        astr = 'refinement order: {\n'
+        for aclass in self.classes():
+            if len(aclass) > 1:
+                astr += '  equivalent: [' + ', '.join(aclass) + ']\n'
+        for aname, bname in self.hasse():
+            astr += '  ' + aname + ' refines ' + bname + '\n'
+        for aname in self.names:
+            for bname in self.names:
+                if self.refines[(aname, bname)] is False:
+                    astr += '  ' + aname + ' does not refine ' + bname + '\n'
+        return astr + '}'
+
+def refinement_order(contracts, matrix, smvfile, jobs=1, cache=None, engine=NUSMV_ENGINE,
+                     sessions=None, batch=None, witnesses=True):
+    """Computes the refinement relation among the contracts of a refinement matrix
+
+    Pairs are checked in rounds, nearest contracts in matrix order first, and all pairs of a round
+    are written as LTL specifications of shared NuSMV models. After every round the pairs which
+    follow from the known results by transitivity are skipped.
+
+    Args:
+        contracts: a contracts object containing all the contracts in a system
+        matrix: a refinement matrix check object
+        smvfile: a string name the generated NuSMV files are derived from
+        jobs: an integer number of NuSMV processes, and NuSMV files, per round
+        cache: an optional result cache object
+        engine: a string model checking engine
+        sessions: an optional session pool object
+        batch: an integer maximum number of pairs per round, by default the number of contracts
+        witnesses: a boolean to also model check the non-refining pairs inferred from other
+            results, so every non-refining pair has a counterexample
+
+    Returns:
+        A refinement order object
+    """
+    names = matrix.contracts.keys()
+    order = RefinementOrder(names)
+    batch = batch or len(names)
+    index = dict([(name, num) for num, name in enumerate(names)])
+    pairs = sorted([(aname, bname) for aname in names for bname in names if aname != bname],
+                   key=lambda pair: (abs(index[pair[0]] - index[pair[1]]), index[pair[0]],
+                                     index[pair[1]]))
+
+    # every model declares the variables of all contracts of the matrix
+    used = set()
+    for contract in matrix.contracts.values():
+        used.update([var for (var, _) in contract.variables])
+    alphabet = contracts.get_alphabet()
+
+    rounds = 0
+    while True:
+        todo = [pair for pair in pairs if order.infer(*pair) is None][:batch]
+        if not todo:
+            break
+        _check_pairs(matrix, todo, order, alphabet, used, smvfile, rounds, jobs, cache, engine,
+                     sessions)
+        rounds += 1
+
+    if witnesses:
+        inferred = [pair for pair in pairs if pair in order.implied and not order.refines[pair]]
+        for start in range(0, len(inferred), batch):
+            _check_pairs(matrix, inferred[start:start + batch], order, alphabet, used, smvfile,
+                         rounds, jobs, cache, engine, sessions)
+            rounds += 1
+    return order
+
+def print_order(order):
+    """Prints a refinement order, the number of pairs checked and the counterexample of every
+    non-refining pair
+
+    Args:
+        order: a refinement order object
+    """
+    print order
+    print 'Checked', order.checked, 'of', len(order.names) * (len(order.names) - 1), 'pairs'
+    for (aname, bname), counterexample in sorted(order.counterexamples.items()):
+        print 'Example of', aname, 'not refining', bname + ':'
+        for line in counterexample.to_lines():
+            print line
+        print ''
+
+def _check_pairs(matrix, pairs, order, alphabet, used, smvfile, rounds, jobs, cache, engine,
+                 sessions):
+    """Model checks a round of pairs in up to jobs shared NuSMV files and records the results"""
+    specs = formula.simplify_all([matrix.get_pair(aname, bname).get_formula()
+                                  for aname, bname in pairs])
+
+    # the formulas may use alphabet variables no contract of the matrix declares
+    used = used | formula.variables(specs)
+    alphabet = [(var, init) for (var, init) in alphabet if var in used]
+
+    root, ext = os.path.splitext(smvfile)
+    files = min(jobs, len(specs))
+    chunks = [range(num, len(specs), files) for num in range(files)]
+    smvfiles = []
+    for num, chunk in enumerate(chunks):
+        smvfiles.append(root + '_matrix_' + str(rounds) + '_' + str(num) + ext)
+        write_model(smvfiles[-1], alphabet, [specs[index] for index in chunk])
+    indices = [index for chunk in chunks for index in chunk]
+
+    # a spec is false when the refinement fails, and its counterexample shows why
+    for num, result, counterexample, _ in iter_run(smvfiles, jobs, cache, engine, sessions):
+        aname, bname = pairs[indices[num]]
+        order.add(aname, bname, not result, counterexample)
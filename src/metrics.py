@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Metrics module defines a collector of machine readable timing and cost data of the LTL contract
+checker tool workflow"""
+
+import json
+import time
+from collections import OrderedDict
+import formula
+
+class Metrics(object):
+    """Metrics class collects the wall time of every phase and the cost of every check
+
+    Attributes:
+        phases: an ordered dictionary from phase names to wall times in seconds
+        variables: an integer number of variables declared by the system, or None
+        files: a list of dictionaries, one per NuSMV file run, with its declared variable count
+            and the CPU time and peak memory of the NuSMV processes which checked it
+        checks: a list of dictionaries, one per check, with its specification size, result and
+            counterexample length
+    """
+    def __init__(self):
+        """Initialize an empty metrics object"""
+        self.phases = OrderedDict()
+        self.variables = None
+        self.files = []
+        self.checks = []
+
+    def timed(self, phase, function, *args, **kwargs):
+        """Calls a function and records its wall time as a phase
+
+        Args:
+            phase: a string phase name
+            function: a function to call with the remaining arguments
+
+        Returns:
+            The return value of the function
+        """
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.phases[phase] = self.phases.get(phase, 0.0) + time.time() - start
+
+    def add_file(self, smvfile, checks, usage=None, cached=False, duplicate=False):
+        """Records the cost of running one NuSMV file
+
+        Args:
+            smvfile: a string NuSMV file name
+            checks: a list of integer indices of the checks in the file
+            usage: an optional dictionary with the cpu_seconds and max_rss_kb of the NuSMV
+                processes, missing when the file was not checked by a NuSMV process
+            cached: a boolean indicating if the results were read from the result cache
+            duplicate: a boolean indicating if the results were repeated from an earlier file
+                with the same model
+        """
+        usage = usage or {}
+        self.files.append(OrderedDict([('file', smvfile),
+                                       ('checks', checks),
+                                       ('variables', declared(smvfile)),
+                                       ('cached', cached),
+                                       ('duplicate', duplicate),
+                                       ('cpu_seconds', usage.get('cpu_seconds')),
+                                       ('max_rss_kb', usage.get('max_rss_kb'))]))
+
+    def add_check(self, check, result, counterexample, spec=None):
+        """Records the specification size and outcome of one check
+
+        Args:
+            check: a check object
+            result: a boolean check result
+            counterexample: a counterexample trace object or None
+            spec: the formula node of the LTL specification written for the check, as simplified
+                by generate, or None if the check has no single specification
+        """
+        length = len(counterexample) if counterexample is not None else None
+        self.checks.append(OrderedDict([('type', check.check_type),
+                                        ('contracts', check.contracts.keys()),
+                                        ('spec_length', len(formula.to_str(spec))
+                                         if spec is not None else None),
+                                        ('spec_nodes', len(formula.nodes([spec]))
+                                         if spec is not None else None),
+                                        ('result', result),
+                                        ('counterexample_length', length)]))
+
+    def to_dict(self):
+        """Get a JSON serialisable dictionary of the metrics"""
+        return OrderedDict([('phases', self.phases), ('variables', self.variables),
+                            ('files', self.files), ('checks', self.checks)])
+
+    def write(self, jsonfile):
+        """Writes the metrics to a JSON file
+
+        Args:
+            jsonfile: a string output file name
+        """
+        with open(jsonfile, 'w') as ofile:
+            json.dump(self.to_dict(), ofile, indent=2, separators=(',', ': '))
+            ofile.write('\n')
+
+def declared(smvfile):
+    """Returns the number of variables declared by a NuSMV file"""
+    count, in_var = 0, False
+    with open(smvfile, 'r') as ifile:
+        for line in ifile:
+            line = line.strip()
+            if line in ('VAR', 'ASSIGN', 'DEFINE') or line.startswith('LTLSPEC'):
+                in_var = line == 'VAR'
+            elif in_var and line:
+                count += 1
+    return count
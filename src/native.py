@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+"""Native module defines a pure-Python LTL model checking engine for the boolean models generated
+by the tool, deciding each LTLSPEC with a symbolic tableau and BDD based fair cycle detection"""
+
+from collections import OrderedDict
+import formula
+from bdd import BDD, FALSE, TRUE
+from counterexample import Trace
+
+# model file sections
+MODEL_SECTIONS = ('VAR', 'ASSIGN', 'DEFINE')
+SPEC_HEADER = 'LTLSPEC'
+
+# supported formula operators
+BOOLEAN_OPS = (formula.NOT, formula.AND, formula.OR, formula.IMPLIES, formula.IFF, formula.XOR,
+               formula.XNOR, formula.EQUAL, formula.NOT_EQUAL)
+FUTURE_OPS = ('X', 'G', 'F', 'U', 'V')
+
+class Model(object):
+    """Model class stores the boolean main module of a generated NuSMV file
+
+    Attributes:
+        variables: a list of string variable names in declaration order
+        inits: an ordered dictionary from variable names to initial value formulas
+        defines: an ordered dictionary from DEFINE names to formulas
+        specs: a list of LTLSPEC formulas
+    """
+    def __init__(self):
+        """Initialize a model object"""
+        self.variables = []
+        self.inits = OrderedDict()
+        self.defines = OrderedDict()
+        self.specs = []
+
+    def add_line(self, section, line):
+        """Adds one declaration line of a model section
+
+        Args:
+            section: a string section header
+            line: a string declaration without the trailing semicolon
+        """
+        if section == 'VAR':
+            name, vtype = [part.strip() for part in line.split(':', 1)]
+            if vtype != 'boolean':
+                raise ValueError('unsupported variable type: ' + vtype)
+            self.variables.append(name)
+        elif section == 'ASSIGN':
+            target, value = [part.strip() for part in line.split(':=', 1)]
+            if not (target.startswith('init(') and target.endswith(')')):
+                raise ValueError('unsupported assignment: ' + line)
+            self.inits[target[len('init('):-1].strip()] = formula.parse(value)
+        elif section == 'DEFINE':
+            name, value = [part.strip() for part in line.split(':=', 1)]
+            self.defines[name] = formula.parse(value)
+        else:
+            raise ValueError('unsupported declaration: ' + line)
+
+    def validate(self):
+        """Raises a ValueError if the model uses constructs the native engine does not support"""
+        for node in formula.nodes(self.inits.values() + self.defines.values() + self.specs):
+            if node.op == formula.RAW:
+                raise ValueError('unsupported expression: ' + node.args[0])
+            if not (node.is_atom() or node.op in BOOLEAN_OPS or node.op in FUTURE_OPS):
+                raise ValueError('unsupported operator: ' + node.op)
+            if node.op == formula.VAR and node.args[0] not in self.variables and \
+               node.args[0] not in self.defines:
+                raise ValueError('undeclared variable: ' + node.args[0])
+        for node in formula.nodes(self.inits.values() + self.defines.values()):
+            if node.temporal:
+                raise ValueError('temporal operator outside LTLSPEC: ' + str(node))
+
+    @classmethod
+    def from_file(cls, smvfile):
+        """Parses a NuSMV file generated by the tool
+
+        Args:
+            smvfile: a string NuSMV file name
+
+        Returns:
+            A model object
+
+        Raises:
+            ValueError: the model uses constructs the native engine does not support
+        """
+        model = cls()
+        section = None
+        with open(smvfile, 'r') as ifile:
+            for line in ifile:
+                line = line.split('--', 1)[0].strip()
+                if not line or line.startswith('MODULE'):
+                    continue
+                if line in MODEL_SECTIONS:
+                    section = line
+                elif line.startswith(SPEC_HEADER):
+                    model.specs.append(formula.parse(line[len(SPEC_HEADER):].rstrip(';')))
+                else:
+                    model.add_line(section, line.rstrip(';'))
+        model.validate()
+        return model
+
+def check_file(smvfile):
+    """Checks every LTLSPEC of a NuSMV file generated by the tool
+
+    Args:
+        smvfile: a string NuSMV file name
+
+    Returns:
+        A list containing a counterexample trace object, or None if it holds, per specification
+
+    Raises:
+        ValueError: the model uses constructs the native engine does not support
+    """
+    model = Model.from_file(smvfile)
+    traces = []
+    for spec in model.specs:
+        traces.append(check(model, spec, len([trace for trace in traces if trace]) + 1))
+    return traces
+
+def check(model, spec, number=1):
+    """Checks if every path of a model satisfies an LTL formula
+
+    Args:
+        model: a model object
+        spec: a formula node
+        number: an integer trace number given to the counterexample
+
+    Returns:
+        A lasso shaped counterexample trace object, or None if the formula holds
+    """
+    return _Tableau(model, spec).counterexample(number)
+
+class _Tableau(object):
+    """Symbolic tableau of the negation of an LTL formula composed with a boolean model
+
+    Every X subformula gets an elementary state variable, U subformulas are unfolded through the
+    elementary variable of their next state and contribute one fairness constraint each.
+    """
+    def __init__(self, model, spec):
+        """Build the initial states, transition relation and fairness constraints"""
+        self.bdd = BDD()
+        self.model = model
+        self.levels = OrderedDict() # state variables to current state levels
+        self.sats = {}
+        self.fairness = []
+        self.elementary = []
+        for name in model.variables:
+            self._level(name)
+
+        self.init = self._sat(formula.mk_not(spec))
+        for name, value in model.inits.iteritems():
+            self.init = self.bdd.conj(self.init, self.bdd.iff(self._sat(formula.var(name)),
+                                                              self._sat(value)))
+
+        # the transition relation is kept partitioned, one constraint per elementary variable
+        self.trans = []
+        done = 0
+        while done < len(self.elementary): # constraining may add elementary variables
+            node = self.elementary[done]
+            following = self.bdd.rename(self._sat(node.args[0]), self._next_map())
+            self.trans.append(self.bdd.iff(self.sats[node], following))
+            done += 1
+        self.current = frozenset(self.levels.values())
+        self.next = frozenset([level + 1 for level in self.levels.values()])
+        self._forward = self._schedule(self.current)
+        self._backward = self._schedule(self.next)
+
+    def _level(self, key):
+        """Returns the current state level of a state variable, allocating a new pair"""
+        if key not in self.levels:
+            self.levels[key] = 2 * len(self.levels)
+        return self.levels[key]
+
+    def _next_map(self):
+        """Returns the renaming of current state levels to next state levels"""
+        return dict([(level, level + 1) for level in self.levels.values()])
+
+    def _sat(self, node):
+        """Returns the set of tableau states satisfying a formula"""
+        if node in self.sats:
+            return self.sats[node]
+        bdd, op, args = self.bdd, node.op, node.args
+        if op == formula.TRUE:
+            result = TRUE
+        elif op == formula.FALSE:
+            result = FALSE
+        elif op == formula.VAR:
+            if args[0] in self.model.defines:
+                result = self._sat(self.model.defines[args[0]])
+            else:
+                result = bdd.var(self._level(args[0]))
+        elif op == formula.NOT:
+            result = bdd.neg(self._sat(args[0]))
+        elif op == formula.AND:
+            result = reduce(bdd.conj, [self._sat(arg) for arg in args])
+        elif op == formula.OR:
+            result = reduce(bdd.disj, [self._sat(arg) for arg in args])
+        elif op == formula.IMPLIES:
+            result = bdd.disj(bdd.neg(self._sat(args[0])), self._sat(args[1]))
+        elif op in (formula.IFF, formula.XNOR, formula.EQUAL):
+            result = bdd.iff(self._sat(args[0]), self._sat(args[1]))
+        elif op in (formula.XOR, formula.NOT_EQUAL):
+            result = bdd.neg(bdd.iff(self._sat(args[0]), self._sat(args[1])))
+        elif op == 'X':
+            result = bdd.var(self._level(node))
+            self.elementary.append(node)
+        elif op == 'U':
+            result = bdd.disj(self._sat(args[1]),
+                              bdd.conj(self._sat(args[0]), self._sat(formula.mk_unary('X', node))))
+            self.fairness.append(bdd.disj(bdd.neg(result), self._sat(args[1])))
+        elif op == 'F':
+            result = self._sat(formula.mk_binary('U', formula.true(), args[0]))
+        elif op == 'G':
+            result = bdd.neg(self._sat(formula.mk_unary('F', formula.mk_not(args[0]))))
+        elif op == 'V':
+            result = bdd.neg(self._sat(formula.mk_binary('U', formula.mk_not(args[0]),
+                                                         formula.mk_not(args[1]))))
+        else:
+            raise ValueError('unsupported operator: ' + op)
+        self.sats[node] = result
+        return result
+
+    def _schedule(self, levels):
+        """Returns the levels to quantify before and after conjoining each transition constraint
+
+        Every level is quantified right after the last constraint that depends on it.
+        """
+        last = {}
+        for num, constraint in enumerate(self.trans):
+            for level in self.bdd.support(constraint) & levels:
+                last[level] = num
+        after = [frozenset([level for level, num in last.iteritems() if num == index])
+                 for index in range(len(self.trans))]
+        return frozenset(levels - set(last)), after
+
+    def _product(self, states, schedule):
+        """Returns the conjunction of states with the transition relation, quantified early"""
+        before, after = schedule
+        result = self.bdd.exists(states, before)
+        for constraint, levels in zip(self.trans, after):
+            result = self.bdd.and_exists(result, constraint, levels)
+        return result
+
+    def _image(self, states):
+        """Returns the successors of a set of states"""
+        following = self._product(states, self._forward)
+        return self.bdd.rename(following, dict([(level + 1, level) for level in self.current]))
+
+    def _preimage(self, states):
+        """Returns the predecessors of a set of states"""
+        return self._product(self.bdd.rename(states, self._next_map()), self._backward)
+
+    def _until(self, hold, goal):
+        """Returns the states with a path through hold states to a goal state"""
+        reached = frontier = goal
+        while frontier != FALSE:
+            frontier = self.bdd.conj(self.bdd.conj(hold, self._preimage(frontier)),
+                                     self.bdd.neg(reached))
+            reached = self.bdd.disj(reached, frontier)
+        return reached
+
+    def reachable(self):
+        """Returns the states reachable from an initial state"""
+        reached = frontier = self.init
+        while frontier != FALSE:
+            frontier = self.bdd.conj(self._image(frontier), self.bdd.neg(reached))
+            reached = self.bdd.disj(reached, frontier)
+        return reached
+
+    def fair_states(self):
+        """Returns the reachable states with an infinite path visiting every fairness constraint
+        infinitely often, by the Emerson-Lei greatest fixpoint"""
+        states = self.reachable()
+        while True:
+            fair = states
+            for constraint in self.fairness or [TRUE]:
+                goal = self.bdd.conj(states, constraint)
+                fair = self.bdd.conj(fair, self._preimage(self._until(states, goal)))
+            if fair == states:
+                return states
+            states = fair
+
+    def _pick(self, states):
+        """Returns one state of a non-empty set as a full assignment of current levels"""
+        return self.bdd.pick(states, sorted(self.current))
+
+    def _path(self, source, goal, within, step):
+        """Returns a shortest path of states from a source state to a goal state
+
+        Args:
+            source: an assignment of the source state
+            goal: a set of goal states
+            within: a set of states the path stays in
+            step: an integer minimum path length of 0 or 1
+
+        Returns:
+            A list of assignments from the source to a goal state, or None
+        """
+        start = self.bdd.cube(source)
+        layers = [start if step == 0 else self.bdd.conj(self._image(start), within)]
+        reached = layers[0]
+        while self.bdd.conj(layers[-1], goal) == FALSE:
+            layer = self.bdd.conj(self.bdd.conj(self._image(layers[-1]), within),
+                                  self.bdd.neg(reached))
+            if layer == FALSE:
+                return None
+            reached = self.bdd.disj(reached, layer)
+            layers.append(layer)
+        path = [self._pick(self.bdd.conj(layers[-1], goal))]
+        for layer in reversed(layers[:-1]):
+            predecessors = self._preimage(self.bdd.cube(path[-1]))
+            path.append(self._pick(self.bdd.conj(layer, predecessors)))
+        if step:
+            path.append(source)
+        return list(reversed(path))
+
+    def counterexample(self, number):
+        """Returns a lasso shaped path violating the formula, or None if there is none"""
+        fair = self.fair_states()
+        initial = self.bdd.conj(self.init, fair)
+        if initial == FALSE:
+            return None
+
+        # close a cycle through every fairness constraint, moving down until one exists
+        prefix, loop_start = [], self._pick(initial)
+        while True:
+            cycle, state = [loop_start], loop_start
+            for constraint in self.fairness:
+                cycle.extend(self._path(state, self.bdd.conj(fair, constraint), fair, 0)[1:])
+                state = cycle[-1]
+            back = self._path(state, self.bdd.cube(loop_start), fair, 1)
+            if back:
+                cycle.extend(back[1:])
+                break
+            prefix.extend(cycle) # the cycle start is not reachable again, step past it
+            loop_start = self._pick(self.bdd.conj(self._image(self.bdd.cube(state)), fair))
+        return self._trace(prefix + cycle, len(prefix), number)
+
+    def _trace(self, states, loop, number):
+        """Returns a trace object of the model variables and defines along a path"""
+        names = self.model.variables + self.model.defines.keys()
+        trace = Trace(names)
+        trace.number = number
+        for state in states:
+            values = dict([(name, state[self.levels[name]]) for name in self.model.variables])
+            for name in self.model.defines:
+                values[name] = self.bdd.evaluate(self._sat(formula.var(name)), state)
+            trace.add_state(values)
+        trace.loop = loop
+        return trace
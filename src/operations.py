@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 """Operations module provides LTL operations to test contracts"""
 
+from collections import OrderedDict
 import contract
+import formula
 
 def compatibility(contract):
     """Checks the compatibility of a contract object
@@ -10,9 +12,9 @@ def compatibility(contract):
         contract: a contract object
 
     Returns:
-        A string LTL expression that checks the compatibility of the input
+        A formula node of the LTL expression that checks the compatibility of the input
     """
-    return _ltl_inv(contract.get_assumptions())
+    return formula.mk_not(_assumptions(contract))
 
 def consistency(contract):
     """Checks the consistency of a contract object
@@ -21,9 +23,9 @@ def consistency(contract):
         contract: a contract object
 
     Returns:
-        A string LTL expression that checks the consistency of the input
+        A formula node of the LTL expression that checks the consistency of the input
     """
-    return _ltl_inv(contract.get_guarantees())
+    return formula.mk_not(_guarantees(contract))
 
 def refinement(acontract, bcontract):
     """Checks if acontract refines bcontract
@@ -33,10 +35,10 @@ def refinement(acontract, bcontract):
         bcontract: a contract object
 
     Returns:
-        A string LTL expression that checks if acontract refines bcontract
+        A formula node of the LTL expression that checks if acontract refines bcontract
     """
-    return _ltl(_and(_imply(bcontract.get_assumptions(), acontract.get_assumptions()),
-                     _imply(acontract.get_guarantees(), bcontract.get_guarantees())))
+    return formula.mk_and(formula.mk_imply(_assumptions(bcontract), _assumptions(acontract)),
+                          formula.mk_imply(_guarantees(acontract), _guarantees(bcontract)))
 
 def saturation(contract):
     """Perform a saturation operation on a contract
@@ -44,11 +46,16 @@ def saturation(contract):
     Args:
         contract: an unsaturated contract object
     """
-    contract.guarantees = [_imply(contract.get_assumptions(), g) for g in contract.guarantees]
+    assumptions = _assumptions(contract)
+    contract.guarantees = [formula.mk_imply(assumptions, formula.to_formula(g))
+                           for g in contract.guarantees]
 
 def composition(contracts):
     """Perform a composition operation on a list of contracts
 
+    The pairwise composition of contracts folds into a single n-ary step, since the assumptions of
+    (c1 || c2) || c3 reduce to (A1 & A2 & A3) | !(G1 & G2 & G3). The input list is not modified.
+
     Args:
         contracts: a list of contract objects
 
@@ -59,18 +66,20 @@ def composition(contracts):
         return contracts[0]
     else:
         comp = contract.Contract()
-        comp.add_name(contracts[0].name + '_comp_' + contracts[1].name)
-        comp.add_variables(_merge(contracts[0].variables, contracts[1].variables))
-        comp.add_assumption(_or(_and(contracts[0].get_assumptions(), contracts[1].get_assumptions()),
-                            _inv(_and(contracts[0].get_guarantees(), contracts[1].get_guarantees()))))
-        comp.add_guarantee(_and(contracts[0].get_guarantees(), contracts[1].get_guarantees()))
-        contracts.pop(0) #remove first element in list
-        contracts[0] = comp #replace "new" first element with conj
-        return composition(contracts)
+        comp.add_name('_comp_'.join([c.name for c in contracts]))
+        comp.add_variables(_merge(*[c.variables for c in contracts]))
+        guarantees = formula.conj([_guarantees(c) for c in contracts])
+        comp.add_assumption(formula.mk_or(formula.conj([_assumptions(c) for c in contracts]),
+                                          formula.mk_not(guarantees)))
+        comp.add_guarantee(guarantees)
+        return comp
 
 def conjunction(contracts):
     """Takes the conjunction of a list of contracts
 
+    The pairwise conjunction of contracts folds into a single n-ary step, with the disjunction of
+    all assumptions and the conjunction of all guarantees. The input list is not modified.
+
     Args:
         contracts: a list of contract objects
 
@@ -81,38 +90,24 @@ def conjunction(contracts):
         return contracts[0]
     else:
         conj = contract.Contract()
-        conj.add_name(contracts[0].name + "_conj_" + contracts[1].name)
-        conj.add_variables(_merge(contracts[0].variables, contracts[1].variables))
-        conj.add_assumption(_or(contracts[0].get_assumptions(), contracts[1].get_assumptions()))
-        conj.add_guarantee(_and(contracts[0].get_guarantees(), contracts[1].get_guarantees()))
-        contracts.pop(0) #remove first element in list
-        contracts[0] = conj #replace "new" first element with conj
-        return conjunction(contracts)
-
-def _merge(alist, blist):
-    """Merges input lists and removes duplicates"""
-    return list(set(alist) | set(blist))
-
-def _ltl(astr):
-    """Applies an inverted LTLSPEC wrapper to the input string"""
-    return '\tLTLSPEC ' + astr + ';\n'
-
-def _ltl_inv(astr):
-    """Applies an inverted LTLSPEC wrapper to the input string"""
-    return '\tLTLSPEC !' + astr + ';\n'
-
-def _and(astr, bstr):
-    """Returns logical and of astr and bstr"""
-    return '(' + astr + ' & ' + bstr + ')'
-
-def _or(astr, bstr):
-    """Returns logical or of astr and bstr"""
-    return '(' + astr + ' | ' + bstr + ')'
-
-def _imply(astr, bstr):
-    """Returns logical implication of bstr by astr"""
-    return '(' + astr + ' -> ' + bstr + ')'
-
-def _inv(astr):
-    """Returns logical not of input"""
-    return '!' + astr
+        conj.add_name('_conj_'.join([c.name for c in contracts]))
+        conj.add_variables(_merge(*[c.variables for c in contracts]))
+        conj.add_assumption(formula.disj([_assumptions(c) for c in contracts]))
+        conj.add_guarantee(formula.conj([_guarantees(c) for c in contracts]))
+        return conj
+
+def _merge(*lists):
+    """Merges input lists in order and removes duplicates"""
+    merged = OrderedDict()
+    for alist in lists:
+        for item in alist:
+            merged[item] = None
+    return merged.keys()
+
+def _assumptions(acontract):
+    """Returns the shared formula node of the conjunction of all contract assumptions"""
+    return formula.conj([formula.to_formula(a) for a in acontract.assumptions])
+
+def _guarantees(acontract):
+    """Returns the shared formula node of the conjunction of all contract guarantees"""
+    return formula.conj([formula.to_formula(g) for g in acontract.guarantees])
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+"""Sat module defines a pure-Python CDCL SAT solver and a fast path deciding the LTL specifications
+of generated models which use no temporal operators other than G and F over state formulas"""
+
+import formula
+from native import Model
+from counterexample import Trace
+
+# solver attributes
+ACTIVITY_DECAY = 0.95
+ACTIVITY_LIMIT = 1e100
+
+# temporal operators decided by the fast path, over state formulas only
+STATE_OPS = ('G', 'F')
+
+class Solver(object):
+    """Solver class is a conflict driven clause learning SAT solver
+
+    Variables are positive integers and literals are non-zero integers, negative for negated
+    variables. Every clause is watched by its first two literals, conflicts are analysed up to the
+    first unique implication point, and the solver backjumps to the highest level of the rest of
+    the learnt clause. Decisions follow variable activity and the last value of each variable.
+    Clauses may be added between calls to solve, learnt clauses are kept across calls.
+
+    Attributes:
+        nvars: an integer number of variables
+        clauses: a list of clauses, each a list of literals
+        unsat: a boolean indicating if the clauses are unsatisfiable without assumptions
+    """
+    def __init__(self):
+        """Initialize an empty solver object"""
+        self.nvars = 0
+        self.clauses = []
+        self.unsat = False
+        self._watches = {}   # literals to indices of the clauses watching them
+        self._values = {}    # assigned variables to boolean values
+        self._levels = {}    # assigned variables to decision levels
+        self._reasons = {}   # assigned variables to the index of their implying clause or None
+        self._trail = []     # assigned literals in assignment order
+        self._limits = []    # trail lengths at the start of every decision level
+        self._head = 0       # index of the next trail literal to propagate
+        self._activity = {}
+        self._phases = {}
+        self._bump = 1.0
+
+    def new_var(self):
+        """Allocates a new variable
+
+        Returns:
+            An integer variable
+        """
+        self.nvars += 1
+        self._activity[self.nvars] = 0.0
+        self._watches[self.nvars] = []
+        self._watches[-self.nvars] = []
+        return self.nvars
+
+    def add_clause(self, literals):
+        """Adds a clause, the disjunction of its literals
+
+        Args:
+            literals: a sequence of integer literals
+        """
+        clause = []
+        for literal in literals:
+            value = self._value(literal) if self._level(literal) == 0 else None
+            if value is True or -literal in clause:
+                return # satisfied or tautological
+            if value is None and literal not in clause:
+                clause.append(literal)
+        if not clause:
+            self.unsat = True
+        elif len(clause) == 1:
+            self._enqueue(clause[0], None)
+            if self._propagate() is not None:
+                self.unsat = True
+        else:
+            self._attach(clause)
+
+    def solve(self, assumptions=()):
+        """Searches a satisfying assignment
+
+        Args:
+            assumptions: a sequence of integer literals assumed true for this call only
+
+        Returns:
+            A dictionary from variables to boolean values, or None if there is none
+        """
+        if self.unsat:
+            return None
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                if not self._limits:
+                    self.unsat = True
+                    return None
+                learnt, level = self._analyze(conflict)
+                self._cancel(level)
+                if len(learnt) == 1:
+                    self._enqueue(learnt[0], None)
+                else:
+                    self._enqueue(learnt[0], self._attach(learnt))
+                self._decay()
+                continue
+
+            # assume the next assumption, or decide the most active variable
+            if len(self._limits) < len(assumptions):
+                literal = assumptions[len(self._limits)]
+                value = self._value(literal)
+                if value is False:
+                    self._cancel(0)
+                    return None
+                self._limits.append(len(self._trail))
+                if value is None:
+                    self._enqueue(literal, None)
+                continue
+            variable = self._pick()
+            if variable is None:
+                model = dict(self._values)
+                self._cancel(0)
+                return model
+            self._limits.append(len(self._trail))
+            self._enqueue(variable if self._phases.get(variable) else -variable, None)
+
+    def _value(self, literal):
+        """Returns the boolean value of a literal, or None if it is unassigned"""
+        value = self._values.get(abs(literal))
+        if value is None:
+            return None
+        return value if literal > 0 else not value
+
+    def _level(self, literal):
+        """Returns the decision level of an assigned literal, or None"""
+        return self._levels.get(abs(literal))
+
+    def _attach(self, clause):
+        """Stores a clause of two or more literals and watches its first two literals"""
+        self.clauses.append(clause)
+        index = len(self.clauses) - 1
+        self._watches[clause[0]].append(index)
+        self._watches[clause[1]].append(index)
+        return index
+
+    def _enqueue(self, literal, reason):
+        """Assigns a literal true at the current decision level"""
+        variable = abs(literal)
+        self._values[variable] = literal > 0
+        self._levels[variable] = len(self._limits)
+        self._reasons[variable] = reason
+        self._trail.append(literal)
+
+    def _propagate(self):
+        """Propagates unit clauses, returns the index of a conflicting clause or None"""
+        while self._head < len(self._trail):
+            false = -self._trail[self._head]
+            self._head += 1
+            watching, self._watches[false] = self._watches[false], []
+            for num, index in enumerate(watching):
+                clause = self.clauses[index]
+                if clause[0] == false:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self._value(clause[0]) is True:
+                    self._watches[false].append(index)
+                    continue
+                for pos in range(2, len(clause)):
+                    if self._value(clause[pos]) is not False: # move the watch
+                        clause[1], clause[pos] = clause[pos], clause[1]
+                        self._watches[clause[1]].append(index)
+                        break
+                else:
+                    self._watches[false].append(index)
+                    if self._value(clause[0]) is False:
+                        self._watches[false].extend(watching[num + 1:])
+                        return index
+                    self._enqueue(clause[0], index)
+        return None
+
+    def _analyze(self, conflict):
+        """Returns the first unique implication point clause of a conflict and its backjump level"""
+        level = len(self._limits)
+        learnt, seen, pending = [None], set(), 0
+        literal, pos, index = None, len(self._trail) - 1, conflict
+        while True:
+            for other in self.clauses[index]:
+                variable = abs(other)
+                if other == literal or variable in seen or self._levels[variable] == 0:
+                    continue
+                seen.add(variable)
+                self._activity[variable] += self._bump
+                if self._levels[variable] == level:
+                    pending += 1
+                else:
+                    learnt.append(other)
+            while abs(self._trail[pos]) not in seen:
+                pos -= 1
+            literal = self._trail[pos]
+            pos -= 1
+            pending -= 1
+            if not pending:
+                break
+            index = self._reasons[abs(literal)]
+        learnt[0] = -literal
+        if len(learnt) == 1:
+            return learnt, 0
+        top = max(range(1, len(learnt)), key=lambda num: self._levels[abs(learnt[num])])
+        learnt[1], learnt[top] = learnt[top], learnt[1]
+        return learnt, self._levels[abs(learnt[1])]
+
+    def _cancel(self, level):
+        """Undoes all assignments above a decision level"""
+        if len(self._limits) <= level:
+            return
+        for literal in self._trail[self._limits[level]:]:
+            variable = abs(literal)
+            self._phases[variable] = literal > 0
+            del self._values[variable], self._levels[variable], self._reasons[variable]
+        del self._trail[self._limits[level]:]
+        del self._limits[level:]
+        self._head = len(self._trail)
+
+    def _pick(self):
+        """Returns the most active unassigned variable, or None if all are assigned"""
+        best = None
+        for variable in xrange(1, self.nvars + 1):
+            if variable not in self._values and \
+               (best is None or self._activity[variable] > self._activity[best]):
+                best = variable
+        return best
+
+    def _decay(self):
+        """Favours the variables of recent conflicts, rescaling all activities when they grow"""
+        self._bump /= ACTIVITY_DECAY
+        if self._bump > ACTIVITY_LIMIT:
+            for variable in self._activity:
+                self._activity[variable] /= ACTIVITY_LIMIT
+            self._bump /= ACTIVITY_LIMIT
+
+class _Encoder(object):
+    """Tseitin encoder of propositional formulas into the clauses of a solver
+
+    With state values, variables are replaced by their values and G and F subformulas over state
+    formulas become fresh atom variables, encoding the formula at the first state of a path.
+    """
+    def __init__(self, solver, defines, values=None):
+        """Initialize an encoder of formulas over the variables and defines of a model"""
+        self.solver = solver
+        self.defines = defines
+        self.values = values
+        self.variables = {}
+        self.atoms = {}
+        self.literals = {}
+        self.true = solver.new_var()
+        solver.add_clause([self.true])
+
+    def literal(self, node):
+        """Returns a literal equivalent to a formula, adding its defining clauses"""
+        if node in self.literals:
+            return self.literals[node]
+        op, args, solver = node.op, node.args, self.solver
+        if op == formula.TRUE:
+            result = self.true
+        elif op == formula.FALSE:
+            result = -self.true
+        elif op == formula.VAR and args[0] in self.defines:
+            result = self.literal(self.defines[args[0]])
+        elif op == formula.VAR and self.values is not None:
+            result = self.true if self.values[args[0]] else -self.true
+        elif op == formula.VAR:
+            if args[0] not in self.variables:
+                self.variables[args[0]] = solver.new_var()
+            result = self.variables[args[0]]
+        elif op == formula.NOT:
+            result = -self.literal(args[0])
+        elif op in (formula.AND, formula.OR, formula.IMPLIES):
+            literals = [self.literal(arg) for arg in args]
+            if op == formula.IMPLIES:
+                literals[0] = -literals[0]
+            sign = 1 if op == formula.AND else -1 # or is the negated and of negations
+            result = solver.new_var()
+            for literal in literals:
+                solver.add_clause([-result, sign * literal])
+            solver.add_clause([result] + [-sign * literal for literal in literals])
+            result *= sign
+        elif op in (formula.IFF, formula.XNOR, formula.EQUAL, formula.XOR, formula.NOT_EQUAL):
+            aliteral, bliteral = self.literal(args[0]), self.literal(args[1])
+            result = solver.new_var()
+            solver.add_clause([-result, -aliteral, bliteral])
+            solver.add_clause([-result, aliteral, -bliteral])
+            solver.add_clause([result, aliteral, bliteral])
+            solver.add_clause([result, -aliteral, -bliteral])
+            if op in (formula.XOR, formula.NOT_EQUAL):
+                result = -result
+        elif op in STATE_OPS and self.values is not None and not args[0].temporal:
+            result = self.atoms[node] = solver.new_var()
+        else:
+            raise ValueError('unsupported operator: ' + op)
+        self.literals[node] = result
+        return result
+
+def check_file(smvfile):
+    """Checks every LTLSPEC of a NuSMV file generated by the tool with the SAT solver
+
+    Args:
+        smvfile: a string NuSMV file name
+
+    Returns:
+        A list containing a counterexample trace object, or None if it holds, per specification
+
+    Raises:
+        ValueError: a specification or the model is outside the fragment decided by the solver
+    """
+    model = Model.from_file(smvfile)
+    traces = []
+    for spec in model.specs:
+        traces.append(check(model, spec, len([trace for trace in traces if trace]) + 1))
+    return traces
+
+def check(model, spec, number=1):
+    """Checks if every path of a model satisfies an LTL formula with the SAT solver
+
+    Generated models fix the initial value of every variable and leave the following states
+    free, so a formula built from state formulas and G and F over state formulas only depends on
+    the initial state and the set of states visited after it. The solver enumerates the values of
+    the G and F subformulas satisfying the negated formula in the initial state, and searches a
+    later state for every one of them the initial state does not already satisfy.
+
+    Args:
+        model: a model object
+        spec: a formula node
+        number: an integer trace number given to the counterexample
+
+    Returns:
+        A lasso shaped counterexample trace object, or None if the formula holds
+
+    Raises:
+        ValueError: the formula or the model is outside the fragment decided by the solver
+    """
+    initial = {}
+    for name in model.variables:
+        if name not in model.inits or model.inits[name].op not in (formula.TRUE, formula.FALSE):
+            raise ValueError('initial value of ' + name + ' is not a constant')
+        initial[name] = model.inits[name].op == formula.TRUE
+
+    # the negated formula at the initial state, G and F subformulas become atom variables
+    skeleton = Solver()
+    encoder = _Encoder(skeleton, model.defines, initial)
+    skeleton.add_clause([-encoder.literal(spec)])
+    for node, variable in encoder.atoms.iteritems():
+        holds = _evaluate(node.args[0], initial, model.defines)
+        if node.op == 'G' and not holds:
+            skeleton.add_clause([-variable])
+        elif node.op == 'F' and holds:
+            skeleton.add_clause([variable])
+    states = Solver()
+    later = _Encoder(states, model.defines)
+
+    while True:
+        assignment = skeleton.solve()
+        if assignment is None:
+            return None
+        chosen = [(node, assignment[variable]) for node, variable in encoder.atoms.iteritems()]
+
+        # every later state satisfies the G atoms chosen true and falsifies the F atoms chosen
+        # false, one later state is needed per other atom not decided by the initial state
+        universal = [node.args[0] if value else formula.mk_not(node.args[0])
+                     for node, value in chosen if (node.op == 'G') == value]
+        needed = [node.args[0] if value else formula.mk_not(node.args[0])
+                  for node, value in chosen if (node.op == 'G') != value]
+        path = [initial]
+        for goal in needed:
+            if _evaluate(goal, initial, model.defines):
+                continue
+            found = states.solve([later.literal(formula.conj(universal + [goal]))])
+            if found is None:
+                break
+            path.append(dict([(name, found.get(later.variables.get(name), initial[name]))
+                              for name in model.variables]))
+        else:
+            return _trace(model, path, number)
+        skeleton.add_clause([-variable if assignment[variable] else variable
+                             for variable in encoder.atoms.itervalues()])
+
+def _evaluate(node, values, defines):
+    """Returns the boolean value of a state formula in a state"""
+    op, args = node.op, node.args
+    if op in (formula.TRUE, formula.FALSE):
+        return op == formula.TRUE
+    if op == formula.VAR:
+        if args[0] in defines:
+            return _evaluate(defines[args[0]], values, defines)
+        return values[args[0]]
+    results = [_evaluate(arg, values, defines) for arg in args]
+    if op == formula.NOT:
+        return not results[0]
+    if op == formula.AND:
+        return all(results)
+    if op == formula.OR:
+        return any(results)
+    if op == formula.IMPLIES:
+        return not results[0] or results[1]
+    if op in (formula.IFF, formula.XNOR, formula.EQUAL):
+        return results[0] == results[1]
+    if op in (formula.XOR, formula.NOT_EQUAL):
+        return results[0] != results[1]
+    raise ValueError('unsupported operator: ' + op)
+
+def _trace(model, path, number):
+    """Returns a trace of the model variables and defines looping over the states after the
+    initial one, or on the initial state alone"""
+    trace = Trace(model.variables + model.defines.keys())
+    trace.number = number
+    for state in path:
+        values = dict(state)
+        for name in model.defines:
+            values[name] = _evaluate(formula.var(name), state, model.defines)
+        trace.add_state(values)
+    trace.loop = 1 if len(path) > 1 else 0
+    return trace
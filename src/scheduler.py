@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+"""Scheduler module defines a non-blocking scheduler which runs the checks of many concurrent
+requests as NuSMV processes multiplexed by one select loop, without threads"""
+
+import os
+import signal
+import select
+import cPickle
+import subprocess
+from collections import deque
+from core import generate, decide, reap, iter_results, nusmv_command, BDD_ENGINE
+
+# scheduler attributes
+READ_SIZE = 65536
+
+class Task(object):
+    """Task class runs a function in a forked worker process, and reads its pickled return value
+    from a pipe watched by the select loop like the output of a NuSMV process
+
+    Attributes:
+        pid: an integer process id of the worker process
+        returncode: an integer exit status once the worker process is reaped, or None
+        stdout: a file object of the pipe the worker process writes to
+        output: the return value of the function once the task is done
+        error: the exception raised by the function, or None
+    """
+    def __init__(self, function, *args):
+        """Forks a worker process calling the function with the arguments"""
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0: # never return to the caller in the worker process
+            try:
+                os.close(read)
+                try:
+                    data = cPickle.dumps((function(*args), None), cPickle.HIGHEST_PROTOCOL)
+                except Exception as error:
+                    data = cPickle.dumps((None, RuntimeError(str(error)) if
+                                          _unpicklable(error) else error),
+                                         cPickle.HIGHEST_PROTOCOL)
+                with os.fdopen(write, 'wb') as ofile:
+                    ofile.write(data)
+            finally:
+                os._exit(0)
+        os.close(write)
+        self.pid = pid
+        self.returncode = None
+        self.stdout = os.fdopen(read, 'rb')
+        self.output = None
+        self.error = None
+        self._chunks = []
+
+    def read(self):
+        """Reads the output ready on the pipe, the task is done once the pipe is closed
+
+        Returns:
+            A boolean indicating if the task is done
+        """
+        data = os.read(self.stdout.fileno(), READ_SIZE)
+        if data:
+            self._chunks.append(data)
+            return False
+        self.stdout.close()
+        reap(self)
+        try:
+            self.output, self.error = cPickle.loads(''.join(self._chunks))
+        except Exception: # killed or failed before writing its output
+            self.error = RuntimeError('worker process exited with status ' +
+                                      str(self.returncode))
+        self._chunks = None
+        return True
+
+    def done(self):
+        """Returns a boolean indicating if the output of the task was read"""
+        return self._chunks is None
+
+    def poll(self):
+        """Returns the exit status of the worker process, or None while it runs"""
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else \
+                                  os.WEXITSTATUS(status)
+        return self.returncode
+
+    def kill(self):
+        """Kills the worker process"""
+        os.kill(self.pid, signal.SIGKILL)
+
+class CheckRun(object):
+    """CheckRun class is the handle of the checks of one request submitted to a scheduler
+
+    Iterating over a run drives its scheduler until every check of the run is decided, and yields
+    each result as soon as its NuSMV process exits, so other runs progress in the meantime.
+
+    Attributes:
+        checks: a checks object containing the checks of the request
+        smvfiles: a list of string NuSMV file names, one per check
+        limit: an integer maximum number of NuSMV processes of this run at once
+        results: a deque of tuples containing the check index, the check object, the check result
+            and the counterexample trace object or None, not taken by the caller yet
+        usage: a dictionary with the cpu_seconds and max_rss_kb of the NuSMV processes of the run
+        error: an exception which stopped the run, or None
+        cancelled: a boolean indicating if the run was cancelled
+    """
+    def __init__(self, scheduler, checks, limit):
+        """Initialize a run with none of its checks started, its files are generated later"""
+        self.checks = checks
+        self.smvfiles = None
+        self.limit = limit
+        self.results = deque()
+        self.usage = {}
+        self.error = None
+        self.cancelled = False
+        self._scheduler = scheduler
+        self._pending = deque()   # indices of the files not started yet
+        self._copies = {}         # indices of files to the later indices repeating them
+        self._running = 0         # number of NuSMV processes started and not reaped
+        self._remaining = len(checks.checks)
+
+    def done(self):
+        """Returns a boolean indicating if no more results will be added to the run"""
+        return self.cancelled or self.error is not None or not self._remaining
+
+    def take(self):
+        """Returns the results added since the last call without waiting for NuSMV
+
+        Returns:
+            A list of tuples containing the check index, the check object, the check result and
+            the counterexample trace object or None
+
+        Raises:
+            CalledProcessError: a NuSMV process of the run failed
+            OSError: a NuSMV process of the run could not be started
+        """
+        results = list(self.results)
+        self.results.clear()
+        if not results and self.error is not None:
+            raise self.error
+        return results
+
+    def cancel(self):
+        """Kills the NuSMV processes of the run and drops the checks not decided yet"""
+        self._scheduler.cancel(self)
+
+    def __iter__(self):
+        """Yields the results of the run as they are decided, stepping the scheduler meanwhile"""
+        while True:
+            for output in self.take():
+                yield output
+            if self.done():
+                if self.error is not None:
+                    raise self.error
+                return
+            self._scheduler.step()
+
+class Scheduler(object):
+    """Scheduler class shares a bounded number of NuSMV processes among the runs of many requests
+
+    The files of a submitted run are generated by a task, which also looks up the cached files and
+    decides the files which need no model checker, so the event loop is not blocked by the
+    simplifier or the SAT solver. The remaining files are started round robin over the runs,
+    within the limit of each run and the jobs of the scheduler, so a large request does not starve
+    the others. The output pipes of the tasks and running processes are returned by handles, so an
+    event loop can watch them and call step when one is readable.
+
+    Attributes:
+        jobs: an integer maximum number of NuSMV processes across all runs
+        cache: an optional result cache object
+        runs: a list of the run objects which are not done
+    """
+    def __init__(self, jobs=1, cache=None):
+        """Initialize a scheduler with no runs"""
+        self.jobs = jobs
+        self.cache = cache
+        self.runs = []
+        self._processes = {} # output pipe handles to the run, file index, process and output
+        self._tasks = {}     # output pipe handles to the task and the run it prepares, or None
+
+    def submit(self, contracts, checks, smvfile, limit=None):
+        """Generates one NuSMV file per check of a request in a task and schedules them
+
+        Args:
+            contracts: a contracts object containing all the contracts in a system
+            checks: a checks object containing the checks to run
+            smvfile: a string name the generated NuSMV files are derived from, distinct per run
+            limit: an integer maximum number of NuSMV processes of the run, by default jobs
+
+        Returns:
+            A run object
+        """
+        run = CheckRun(self, checks, limit or self.jobs)
+        self.runs.append(run)
+        task = Task(_prepare, contracts, checks, smvfile, self.cache)
+        self._tasks[task.stdout.fileno()] = (task, run)
+        return run
+
+    def spawn(self, function, *args):
+        """Calls a function in a task, whose output is read by step
+
+        Args:
+            function: a function whose arguments and return value can be pickled
+            args: the arguments of the function
+
+        Returns:
+            A task object
+        """
+        task = Task(function, *args)
+        self._tasks[task.stdout.fileno()] = (task, None)
+        return task
+
+    def handles(self):
+        """Returns the list of output pipe handles of the tasks and running NuSMV processes"""
+        return self._tasks.keys() + self._processes.keys()
+
+    def step(self, timeout=None):
+        """Reads the NuSMV output ready within a timeout and adds the results of exited processes
+        to their runs, then starts pending files
+
+        Args:
+            timeout: a float number of seconds to wait for output, None to wait until some output
+                is ready, 0 to poll
+
+        Returns:
+            A list of the run objects which got new results or failed
+        """
+        self._start()
+        if not self._processes and not self._tasks:
+            return []
+        updated = []
+        for handle in select.select(self.handles(), [], [], timeout)[0]:
+            if handle in self._tasks:
+                task, run = self._tasks[handle]
+                if task.read():
+                    del self._tasks[handle]
+                    if run is not None:
+                        self._prepared(run, task)
+                        if run not in updated:
+                            updated.append(run)
+                continue
+            run, num, process, chunks = self._processes[handle]
+            data = os.read(handle, READ_SIZE)
+            if data:
+                chunks.append(data)
+                continue
+
+            # the process exited, its output is complete
+            del self._processes[handle]
+            process.stdout.close()
+            run._running -= 1
+            if reap(process, run.usage):
+                run.error = subprocess.CalledProcessError(process.returncode,
+                                                          nusmv_command(run.smvfiles[num]))
+                self.cancel(run)
+            else:
+                outputs = iter_results(''.join(chunks).splitlines())
+                self._deliver(run, num, [(result, counterexample, BDD_ENGINE)
+                                         for result, counterexample in outputs], True)
+            if run not in updated:
+                updated.append(run)
+        self._start()
+        return updated
+
+    def cancel(self, run):
+        """Kills the NuSMV processes of a run and drops the checks not decided yet
+
+        Args:
+            run: a run object of the scheduler
+        """
+        for handle, (task, owner) in self._tasks.items():
+            if owner is run:
+                del self._tasks[handle]
+                if task.poll() is None:
+                    task.kill()
+                task.stdout.close()
+                reap(task)
+        for handle, (owner, _, process, _) in self._processes.items():
+            if owner is run:
+                del self._processes[handle]
+                if process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                reap(process, run.usage)
+                run._running -= 1
+        run._pending.clear()
+        run.cancelled = run.error is None
+        if run in self.runs:
+            self.runs.remove(run)
+
+    def close(self):
+        """Cancels every run which is not done and kills the other tasks"""
+        for run in list(self.runs):
+            self.cancel(run)
+        for task, _ in self._tasks.values():
+            if task.poll() is None:
+                task.kill()
+            task.stdout.close()
+            reap(task)
+        self._tasks.clear()
+
+    def _prepared(self, run, task):
+        """Schedules the files generated by the task of a run and adds the results it found"""
+        if task.error is not None:
+            run.error = task.error
+            self.cancel(run)
+            return
+        run.smvfiles, outputs, changes = task.output
+        if changes is not None:
+            self.cache.merge(changes)
+        first = {}
+        for num, afile in enumerate(run.smvfiles):
+            if first.setdefault(afile, num) != num: # a check sharing the specification
+                run._copies.setdefault(first[afile], []).append(num)
+        for num, afile in enumerate(run.smvfiles):
+            if first[afile] != num:
+                continue
+            if num in outputs:
+                self._deliver(run, num, *outputs[num])
+            else:
+                run._pending.append(num)
+        if run.done() and run in self.runs:
+            self.runs.remove(run)
+
+    def _start(self):
+        """Starts pending files round robin over the runs while processes are available"""
+        started = True
+        while started and len(self._processes) < self.jobs:
+            started = False
+            for run in list(self.runs):
+                if not run._pending or run._running >= run.limit or \
+                   len(self._processes) >= self.jobs:
+                    continue
+                num = run._pending.popleft()
+                try:
+                    process = subprocess.Popen(nusmv_command(run.smvfiles[num]),
+                                               stdout=subprocess.PIPE)
+                except OSError as error:
+                    run.error = error
+                    self.cancel(run)
+                    continue
+                self._processes[process.stdout.fileno()] = (run, num, process, [])
+                run._running += 1
+                started = True
+
+    def _deliver(self, run, num, outputs, fresh):
+        """Adds the results of a NuSMV file to its run and caches the results of a fresh file"""
+        if fresh and self.cache:
+            self.cache.put(self.cache.key(run.smvfiles[num]),
+                           ([result for result, _, _ in outputs],
+                            dict([(index, counterexample) for index, (_, counterexample, _)
+                                  in enumerate(outputs) if counterexample is not None]),
+                            [engine for _, _, engine in outputs]))
+        for copy in [num] + run._copies.pop(num, []):
+            for result, counterexample, _ in outputs:
+                run.results.append((copy, run.checks.checks[copy], result, counterexample))
+            run._remaining -= 1
+        if run.done() and run in self.runs:
+            self.runs.remove(run)
+
+def _prepare(contracts, checks, smvfile, cache):
+    """Generates the files of a run, and looks up or decides the files which need no NuSMV process
+
+    Returns:
+        A tuple containing the list of NuSMV file names, a dictionary from the indices of the
+        decided files to their outputs and a boolean indicating if they are fresh, and the
+        changes made to the cache or None
+    """
+    snapshot = cache.snapshot() if cache else None
+    smvfiles = generate(contracts, checks, smvfile, split=True)
+    outputs = {}
+    seen = set()
+    for num, afile in enumerate(smvfiles):
+        if afile in seen: # a check sharing the specification
+            continue
+        seen.add(afile)
+        output = cache.get(cache.key(afile)) if cache else None
+        if output is not None:
+            results, counterexamples, engines = output
+            outputs[num] = ([(result, counterexamples.get(index), engines[index])
+                             for index, result in enumerate(results)], False)
+            continue
+        decided = decide(afile)
+        if decided is not None:
+            outputs[num] = (decided, True)
+    return smvfiles, outputs, cache.changes(snapshot) if cache else None
+
+def _unpicklable(error):
+    """Returns a boolean indicating if an exception cannot be sent back from a worker process"""
+    try:
+        cPickle.loads(cPickle.dumps(error, cPickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return True
+    return False
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+"""Server module defines a long-running check service which answers requests over a Unix socket,
+keeping parsed specifications and check results in memory between requests, and its client"""
+
+import os
+import json
+import errno
+import shutil
+import socket
+import select
+import tempfile
+import subprocess
+from collections import deque, OrderedDict
+from core import parse, CONTRACT_HEADER, CONTRACT_NAME_HEADER, \
+                 CONTRACT_VARIABLES_HEADER, CONTRACT_ASSUMPTIONS_HEADER, \
+                 CONTRACT_GUARANTEES_HEADER, CHECKS_HEADER, ASSIGNMENT_CHAR
+from cache import CACHE_DIR
+from scheduler import Scheduler
+
+# server attributes
+SOCKET_PATH = os.path.join(CACHE_DIR, 'checker.sock')
+SMV_NAME = 'nusmv.smv'
+TEXT_NAME = 'request.txt'
+ACTIVE_REQUESTS = 4
+QUEUE_SIZE = 16
+MEMORY_ENTRIES = 1024
+MATRICES_ERROR = 'refinement matrices are only computed by local runs'
+BACKLOG = 64
+READ_SIZE = 65536
+
+class Server(object):
+    """Server class answers one JSON request line per connection from a single select loop
+
+    A request names a system specification file, gives the text of a specification with the file
+    name its includes are relative to, or lists contracts and checks. At most active requests are
+    parsed by tasks of a scheduler shared by all requests, which then runs their checks, each
+    request limited to its own number of NuSMV processes. Further requests wait in a bounded
+    queue, and are answered with a busy error at once while the queue is full.
+
+    Attributes:
+        path: a string Unix socket file name
+        scheduler: a scheduler object running the checks of every request
+        spec_cache: an optional spec cache object
+        active: an integer maximum number of requests checked at once
+        queue_size: an integer maximum number of requests waiting to be checked
+        limit: an integer maximum number of NuSMV processes per request
+        served: an integer number of requests answered
+    """
+    def __init__(self, path=SOCKET_PATH, jobs=1, cache=None, spec_cache=None,
+                 active=ACTIVE_REQUESTS, queue_size=QUEUE_SIZE, limit=None):
+        """Initialize a server object, listening once serve is called"""
+        self.path = path
+        self.scheduler = Scheduler(jobs, cache)
+        self.spec_cache = spec_cache
+        self.active = active
+        self.queue_size = queue_size
+        self.limit = limit or max(1, jobs / active)
+        self.served = 0
+        self._listener = None
+        self._clients = {}        # sockets to client objects
+        self._queue = deque()     # clients waiting for an active request
+        self._running = []        # clients whose checks are scheduled
+        self._stopped = False
+        self._directory = None
+
+    def listen(self):
+        """Binds the socket, replacing a stale socket file left by a server which is not running
+
+        Raises:
+            RuntimeError: another server is listening on the socket
+        """
+        if running(self.path):
+            raise RuntimeError('a server is already listening on ' + self.path)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(BACKLOG)
+        self._listener.setblocking(False)
+        self._directory = tempfile.mkdtemp()
+
+    def serve(self):
+        """Answers requests until a shutdown request, then closes the server"""
+        if self._listener is None:
+            self.listen()
+        try:
+            while not self._stopped or any([client.output for client in self._clients.values()]):
+                self.step()
+        finally:
+            self.close()
+
+    def step(self, timeout=None):
+        """Accepts connections, reads requests, runs checks and writes responses ready within a
+        timeout
+
+        Args:
+            timeout: a float number of seconds to wait, None to wait until something is ready
+        """
+        readers = [self._listener] + [sock for sock, client in self._clients.iteritems()
+                                      if client.reading]
+        writers = [sock for sock, client in self._clients.iteritems() if client.output]
+        handles = self.scheduler.handles()
+        ready, writable, _ = select.select(readers + handles, writers, [], timeout)
+
+        for sock in ready:
+            if sock is self._listener:
+                self._accept()
+            elif sock in self._clients:
+                self._read(self._clients[sock])
+        if any([handle in ready for handle in handles]):
+            self.scheduler.step(0)
+        for client in list(self._running):
+            self._collect(client)
+        for sock in writable:
+            if sock in self._clients:
+                self._write(self._clients[sock])
+
+    def close(self):
+        """Cancels the running checks, closes every connection and removes the socket file"""
+        self.scheduler.close()
+        for sock in self._clients.keys():
+            sock.close()
+        self._clients.clear()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def _accept(self):
+        """Accepts a pending connection"""
+        try:
+            sock = self._listener.accept()[0]
+        except socket.error as error:
+            if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        sock.setblocking(False)
+        self._clients[sock] = _Client(sock)
+
+    def _read(self, client):
+        """Reads the request of a client and handles it once its line is complete"""
+        try:
+            data = client.sock.recv(READ_SIZE)
+        except socket.error:
+            data = ''
+        if data:
+            client.input.append(data)
+            if '\n' not in data:
+                return
+        client.reading = False
+        line = ''.join(client.input).split('\n', 1)[0]
+        try:
+            payload = json.loads(line)
+            if not isinstance(payload, dict):
+                raise ValueError('expected a JSON object')
+        except ValueError as error:
+            return self._respond(client, {'error': 'malformed request: ' + str(error)})
+
+        command = payload.get('command')
+        if command == 'stats':
+            return self._respond(client, self._stats())
+        if command == 'shutdown':
+            self._stopped = True
+            return self._respond(client, {'stopped': True})
+        client.payload = payload
+        if len(self._running) < self.active:
+            self._start(client)
+        elif len(self._queue) < self.queue_size:
+            self._queue.append(client)
+        else:
+            self._respond(client, {'error': 'busy, ' + str(len(self._queue)) +
+                                            ' requests waiting'})
+
+    def _start(self, client):
+        """Parses the specification of a request in a task"""
+        client.task = self.scheduler.spawn(_parsed, client.payload, self._directory,
+                                           self.spec_cache)
+        self._running.append(client)
+
+    def _submit(self, client):
+        """Submits the checks of a parsed request, or responds with the error of its task"""
+        error = client.task.error
+        if error is not None:
+            message = 'missing ' + str(error) if isinstance(error, KeyError) else \
+                      getattr(error, 'strerror', None) or str(error)
+            return self._finish(client, {'error': message})
+        contracts, checks, changes = client.task.output
+        if changes is not None:
+            self.spec_cache.merge(changes)
+        if checks.matrices:
+            return self._finish(client, {'error': MATRICES_ERROR})
+        client.workdir = tempfile.mkdtemp(dir=self._directory)
+        client.run = self.scheduler.submit(contracts, checks,
+                                           os.path.join(client.workdir, SMV_NAME), self.limit)
+        self._collect(client)
+
+    def _collect(self, client):
+        """Takes the new results of a request and responds once all its checks are decided"""
+        if client.run is None:
+            if client.task.done():
+                self._submit(client)
+            return
+        try:
+            client.results.extend(client.run.take())
+            if not client.run.done():
+                return
+            client.results.extend(client.run.take())
+        except (subprocess.CalledProcessError, OSError) as error:
+            response = {'error': str(error)}
+        else:
+            response = {'checks': [_record(check, result, counterexample) for _, check, result,
+                                   counterexample in sorted(client.results, key=lambda x: x[0])]}
+        self._finish(client, response)
+
+    def _finish(self, client, response):
+        """Responds to a request and starts the next waiting request"""
+        self._running.remove(client)
+        if client.workdir is not None:
+            shutil.rmtree(client.workdir, ignore_errors=True)
+        self._respond(client, response)
+        while self._queue and len(self._running) < self.active:
+            self._start(self._queue.popleft())
+
+    def _respond(self, client, response):
+        """Queues the JSON line of a response to a client"""
+        self.served += 1
+        client.reading = False
+        client.output = json.dumps(response) + '\n'
+
+    def _write(self, client):
+        """Writes the pending response of a client, closing the connection once it is sent"""
+        try:
+            sent = client.sock.send(client.output)
+        except socket.error:
+            sent = len(client.output)
+        client.output = client.output[sent:]
+        if not client.output:
+            client.sock.close()
+            del self._clients[client.sock]
+
+    def _stats(self):
+        """Returns the counters of the server and its caches"""
+        stats = OrderedDict([('served', self.served), ('running', len(self._running)),
+                             ('queued', len(self._queue))])
+        for name, cache in (('results', self.scheduler.cache), ('specs', self.spec_cache)):
+            if cache is not None:
+                stats[name] = OrderedDict([('hits', cache.hits), ('misses', cache.misses)])
+        return stats
+
+class _Client(object):
+    """State of one connection, from its request to its response"""
+    def __init__(self, sock):
+        """Initialize the state of a new connection"""
+        self.sock = sock
+        self.reading = True
+        self.input = []
+        self.output = ''
+        self.payload = None
+        self.workdir = None
+        self.task = None
+        self.run = None
+        self.results = []
+
+def spec_text(contracts, checks):
+    """Writes contracts and checks given as JSON in the system specification file format
+
+    Args:
+        contracts: a list of dictionaries with the string name, the variables as a dictionary or
+            list of pairs from names to initial values, and the lists of string assumptions and
+            guarantees of every contract
+        checks: a list of string checks, such as 'REFINEMENT(a, b)'
+
+    Returns:
+        A string system specification
+    """
+    lines = []
+    for contract in contracts:
+        variables = contract['variables']
+        if isinstance(variables, dict):
+            variables = sorted(variables.items())
+        lines.extend([CONTRACT_HEADER + ':', '\t' + CONTRACT_NAME_HEADER + ':',
+                      '\t\t' + contract['name'], '\t' + CONTRACT_VARIABLES_HEADER + ':'])
+        lines.extend(['\t\t' + var + ' ' + ASSIGNMENT_CHAR + ' ' + str(init)
+                      for var, init in variables])
+        lines.append('\t' + CONTRACT_ASSUMPTIONS_HEADER + ':')
+        lines.extend(['\t\t' + line for line in contract.get('assumptions') or ['TRUE']])
+        lines.append('\t' + CONTRACT_GUARANTEES_HEADER + ':')
+        lines.extend(['\t\t' + line for line in contract.get('guarantees') or ['TRUE']])
+    lines.append(CHECKS_HEADER + ':')
+    lines.extend(['\t' + check for check in checks])
+    return '\n'.join(lines) + '\n'
+
+def running(path=SOCKET_PATH):
+    """Returns a boolean indicating if a server accepts connections on a socket"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+def request(payload, path=SOCKET_PATH):
+    """Sends a request to a server and waits for its response
+
+    Args:
+        payload: a dictionary request, with a string spec file name and optional string text, a
+            list of contracts and a list of checks as taken by spec_text, or a string command,
+            stats or shutdown
+        path: a string Unix socket file name
+
+    Returns:
+        A dictionary response, with a list of checks records, or a string error
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(payload) + '\n')
+        chunks = []
+        while True:
+            data = sock.recv(READ_SIZE)
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        sock.close()
+    return json.loads(''.join(chunks))
+
+def report(response):
+    """Prints the checks of a response as the checker reports them"""
+    for record in response['checks']:
+        print "Result of checking:", record['check']
+        print 'Statement is', record['verdict']
+        if record['type'] != 'refinement' and record['verdict']:
+            print 'Example:'
+            for line in record['counterexample'] or []:
+                print line
+            print ''
+
+def _record(check, result, counterexample):
+    """Returns the response record of a check"""
+    verdict = not result if check.check_type == 'refinement' else result
+    return OrderedDict([('check', str(check)), ('type', check.check_type), ('verdict', verdict),
+                        ('counterexample', counterexample.to_lines() if counterexample else None)])
+
+def _parsed(payload, directory, spec_cache):
+    """Parses the specification of a request, called in a task
+
+    Returns:
+        A tuple containing a contracts object, a checks object and the changes made to the spec
+        cache or None
+    """
+    snapshot = spec_cache.snapshot() if spec_cache is not None else None
+    if 'contracts' in payload:
+        specfile = os.path.join(directory, TEXT_NAME)
+        text = spec_text(payload['contracts'], payload.get('checks', []))
+    else:
+        specfile, text = payload['spec'], payload.get('text')
+    contracts, checks = parse(specfile, spec_cache, text)
+    return contracts, checks, spec_cache.changes(snapshot) if spec_cache is not None else None
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""Session module defines long-lived interactive NuSMV processes which encode a model once and
+check many LTL specifications against it"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+# session attributes
+PROMPT = 'NuSMV > '
+SPEC_HEADER = 'LTLSPEC '
+SESSION_LIMIT = 8
+READ_SIZE = 65536
+
+class Session(object):
+    """Session class drives one NuSMV -int process over its standard input and output
+
+    The model is flattened and BDD encoded once by the go command, every specification is then
+    checked with check_ltlspec -p.
+
+    Attributes:
+        smvfile: a string NuSMV file name of the model, without LTL specifications
+        process: the NuSMV process object
+    """
+    def __init__(self, nusmv, smvfile, options=()):
+        """Start a NuSMV process with extra command line options and encode the model"""
+        self.smvfile = smvfile
+        self.process = subprocess.Popen([nusmv, '-int'] + list(options) + [smvfile],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._buffer = ''
+        self._read() # banner
+        self.command('go')
+
+    def command(self, line):
+        """Sends a command and returns its output once the next prompt is printed
+
+        Args:
+            line: a string interactive NuSMV command
+
+        Returns:
+            A list of string output lines
+
+        Raises:
+            RuntimeError: the process exited before printing the prompt
+        """
+        self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+        return self._read()
+
+    def check(self, spec):
+        """Returns the output lines of checking one LTL specification against the model"""
+        return self.command('check_ltlspec -p "' + spec + '"')
+
+    def alive(self):
+        """Returns a boolean indicating if the process is still running"""
+        return self.process.poll() is None
+
+    def close(self):
+        """Quits the process"""
+        if self.alive():
+            try:
+                self.process.stdin.write('quit\n')
+                self.process.stdin.close()
+            except IOError: # exited meanwhile
+                pass
+            self.process.wait()
+
+    def _read(self):
+        """Returns the output lines printed before the next prompt"""
+        handle = self.process.stdout.fileno()
+        while not self._buffer.endswith(PROMPT):
+            data = os.read(handle, READ_SIZE)
+            if not data:
+                self.process.wait()
+                raise RuntimeError('NuSMV session exited with status ' +
+                                   str(self.process.returncode))
+            self._buffer += data
+        output, self._buffer = self._buffer[:-len(PROMPT)], ''
+        return output.splitlines()
+
+class SessionPool(object):
+    """SessionPool class keeps one session per distinct model and reuses it across checks
+
+    Models are keyed by their text without LTL specifications and by the contents of their variable
+    order file, so every file generated for the same variables, order and DEFINE declarations
+    shares a session. Least recently used sessions are
+    closed once the pool holds more than its limit.
+
+    Attributes:
+        limit: an integer maximum number of open sessions
+        sessions: an ordered dictionary from model keys to session objects, oldest first
+        directory: a string directory holding the model files of the sessions
+    """
+    def __init__(self, limit=SESSION_LIMIT):
+        """Initialize an empty session pool"""
+        self.limit = limit
+        self.sessions = OrderedDict()
+        self.directory = tempfile.mkdtemp()
+
+    def get(self, nusmv, smvfile, options=()):
+        """Get a session for the model of a NuSMV file and its LTL specifications
+
+        Args:
+            nusmv: a string NuSMV binary
+            smvfile: a string NuSMV file name
+            options: a list of string NuSMV command line options, such as the variable order
+
+        Returns:
+            A tuple containing a session object and a list of string LTL specifications
+        """
+        lines, specs = [], []
+        with open(smvfile, 'r') as ifile:
+            for line in ifile:
+                if line.strip().startswith(SPEC_HEADER):
+                    specs.append(line.strip()[len(SPEC_HEADER):].rstrip(';'))
+                else:
+                    lines.append(line)
+        model = ''.join(lines)
+        options = self._pooled(options)
+        key = hashlib.sha256('\n'.join([nusmv] + options + [model])).hexdigest()
+
+        session = self.sessions.pop(key, None)
+        if session is None or not session.alive():
+            path = os.path.join(self.directory, key + '.smv')
+            with open(path, 'w') as ofile:
+                ofile.write(model)
+            session = Session(nusmv, path, options)
+        self.sessions[key] = session
+        while len(self.sessions) > self.limit:
+            self.sessions.popitem(last=False)[1].close()
+        return session, specs
+
+    def _pooled(self, options):
+        """Returns the options with the variable order file copied to the pool directory and
+        named by its contents, so models generated with the same order share a session"""
+        options = list(options)
+        if '-i' in options:
+            num = options.index('-i') + 1
+            with open(options[num], 'r') as ifile:
+                order = ifile.read()
+            path = os.path.join(self.directory, hashlib.sha256(order).hexdigest() +
+                                os.path.splitext(options[num])[1])
+            if not os.path.isfile(path):
+                with open(path, 'w') as ofile:
+                    ofile.write(order)
+            options[num] = path
+        return options
+
+    def close(self):
+        """Closes every session of the pool"""
+        while self.sessions:
+            self.sessions.popitem()[1].close()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Watch module defines a watcher that re-checks a system specification file whenever it changes,
+running only the checks affected by the edit"""
+
+import os
+import time
+from check import Checks
+from core import parse, includes, generate, run, slice_alphabet, NUSMV_ENGINE
+from counterexample import TraceStore, TRACE_BUDGET
+from compose import decompose
+from matrix import refinement_order, print_order
+
+# watch attributes
+POLL_INTERVAL = 1.0
+
+class Watcher(object):
+    """Watcher class keeps the last parsed system in memory and re-runs the checks an edit affects
+
+    A check is affected when it is new, when one of its contracts changed, or when the slice of
+    the alphabet it declares changed. A refinement matrix is affected when it is new or when one
+    of its contracts changed.
+
+    Attributes:
+        specfile: a string input file name for the system specification file
+        smvfile: a string name for the generated NuSMV files
+        jobs: an integer number of NuSMV processes to run in parallel
+        cache: an optional result cache object
+        engine: a string model checking engine
+        sessions: an optional session pool object kept open across updates
+        spec_cache: an optional spec cache object, so unchanged included files are not re-parsed
+        order: a boolean to declare variables in the computed variable order
+        compose: a boolean to decide compositions of independent groups of contracts by group
+        trace_budget: an integer number of bytes of counterexample states kept in memory per update
+        digests: a dictionary from contract names to contract digests of the last parse
+        slices: a dictionary from check identities to alphabet slices of the last parse
+        matrices: a set of the identities of the refinement matrices of the last parse
+        total: an integer number of checks of the last parse
+    """
+    def __init__(self, specfile, smvfile, jobs=1, cache=None, engine=NUSMV_ENGINE,
+                 sessions=None, spec_cache=None, order=True, compose=True,
+                 trace_budget=TRACE_BUDGET):
+        """Initialize a watcher object"""
+        self.specfile = specfile
+        self.smvfile = smvfile
+        self.jobs = jobs
+        self.cache = cache
+        self.engine = engine
+        self.sessions = sessions
+        self.spec_cache = spec_cache
+        self.order = order
+        self.compose = compose
+        self.trace_budget = trace_budget
+        self.digests = {}
+        self.slices = {}
+        self.matrices = set()
+        self.total = 0
+        self._stamp = None
+
+    def changed(self):
+        """Check if the specification file or a file it includes changed since the last call
+
+        Returns:
+            A boolean indicating if the modification time or size of a file changed
+        """
+        stamp = []
+        for afile in [self.specfile] + includes(self.specfile):
+            stat = os.stat(afile)
+            stamp.append((afile, stat.st_mtime, stat.st_size))
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+    def update(self):
+        """Re-parses the specification file and runs the checks affected since the last update
+
+        Returns:
+            A checks object containing the affected checks and refinement matrices, in
+            specification order
+        """
+        contracts, checks = parse(self.specfile, self.spec_cache)
+        digests = dict([(name, contract.get_digest())
+                        for name, contract in contracts.get_contracts().iteritems()])
+        slices = dict([(check.get_identity(), slice_alphabet(contracts, check))
+                       for check in checks.checks])
+
+        affected = Checks()
+        for check in checks.checks:
+            identity = check.get_identity()
+            if identity not in self.slices or self.slices[identity] != slices[identity] or \
+               any([self.digests.get(name) != digests[name] for name in check.contracts]):
+                affected.add_check(check)
+        for matrix in checks.matrices:
+            if matrix.get_identity() not in self.matrices or \
+               any([self.digests.get(name) != digests[name] for name in matrix.contracts]):
+                affected.add_matrix(matrix)
+        self.digests, self.slices = digests, slices
+        self.matrices = set([matrix.get_identity() for matrix in checks.matrices])
+        self.total = len(checks.checks)
+
+        if affected.checks:
+            decided = decompose(contracts, affected, self.smvfile, self.jobs, self.cache,
+                                self.engine, self.sessions) if self.compose else {}
+            smvfiles = generate(contracts, affected, self.smvfile, split=True, order=self.order,
+                                exclude=decided)
+            traces = TraceStore(os.path.splitext(self.smvfile)[0] + '.traces', self.trace_budget)
+            try:
+                run(smvfiles, affected, self.jobs, self.cache, self.engine, self.sessions,
+                    traces=traces, decided=decided)
+            finally:
+                traces.close()
+        for matrix in affected.matrices:
+            print_order(refinement_order(contracts, matrix, self.smvfile, self.jobs, self.cache,
+                                         self.engine, self.sessions))
+        return affected
+
+    def watch(self, interval=POLL_INTERVAL):
+        """Polls the specification file and prints updated verdicts after every edit
+
+        Args:
+            interval: a float number of seconds between polls
+        """
+        while True:
+            try:
+                affected = self.update() if self.changed() else None
+            except Exception as error: # keep watching through incomplete edits
+                print 'Error checking', self.specfile + ':', error
+            else:
+                if affected is not None:
+                    print 'Re-checked', len(affected.checks), 'of', self.total, 'checks'
+            time.sleep(interval)
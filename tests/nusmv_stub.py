@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""NuSMV stub module is a stand-in for the NuSMV binary used by the test suite
+
+Every LTLSPEC starting with a negation is reported false with a one state looping counterexample
+built from the initial values, every other LTLSPEC is reported true. With -bmc no counterexample is
+found for the other LTLSPECs up to the -bmc_length bound. With -int the stub speaks the
+interactive prompt protocol, answering go, check_ltlspec -p and quit commands.
+"""
+
+import sys
+
+PROMPT = 'NuSMV > '
+
+def main():
+    """Prints NuSMV style results for the LTL specifications of the model file argument"""
+    inits, specs = [], []
+    with open(sys.argv[-1]) as ifile:
+        for line in ifile:
+            line = line.strip()
+            if line.startswith('init('):
+                var, init = line[len('init('):].rstrip(';').split(') :=')
+                inits.append((var.strip(), init.strip()))
+            elif line.startswith('LTLSPEC '):
+                specs.append(line[len('LTLSPEC '):].rstrip(';'))
+
+    sys.stdout.write('*** This is a NuSMV stub\n\n')
+    if '-bmc' in sys.argv:
+        bound = int(sys.argv[sys.argv.index('-bmc_length') + 1])
+        number = 0
+        for spec in specs:
+            if spec.startswith('!'):
+                number += report(spec, inits, number + 1)
+            else:
+                for length in range(bound + 1):
+                    sys.stdout.write('-- no counterexample found with bound %d\n' % length)
+        return
+    if '-int' not in sys.argv:
+        number = 0
+        for spec in specs:
+            number += report(spec, inits, number + 1)
+        return
+
+    number = 0
+    while True:
+        sys.stdout.write(PROMPT)
+        sys.stdout.flush()
+        command = sys.stdin.readline()
+        if not command or command.strip() == 'quit':
+            return
+        if command.startswith('check_ltlspec -p '):
+            spec = command.strip()[len('check_ltlspec -p '):].strip('"')
+            number += report(spec, inits, number + 1)
+
+def report(spec, inits, number):
+    """Prints the result of one specification and returns the number of traces printed"""
+    if not spec.startswith('!'):
+        sys.stdout.write('-- specification ' + spec + '  is true\n')
+        return 0
+    sys.stdout.write('-- specification ' + spec + '  is false\n')
+    sys.stdout.write('-- as demonstrated by the following execution sequence\n')
+    sys.stdout.write('Trace Description: LTL Counterexample \n')
+    sys.stdout.write('Trace Type: Counterexample \n')
+    sys.stdout.write('  -- Loop starts here\n')
+    sys.stdout.write('  -> State: %d.1 <-\n' % number)
+    for var, init in inits:
+        sys.stdout.write('    ' + var + ' = ' + init + '\n')
+    sys.stdout.write('  -> State: %d.2 <-\n' % number)
+    return 1
+
+if __name__ == '__main__':
+    main()
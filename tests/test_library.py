@@ -3,16 +3,73 @@
 
 import os
 import sys
+import json
+import cPickle
+import select
+import socket
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
 import unittest
-from src.core import parse, generate, run
+from src import formula
+from src import core
+from src import sat
+from src import compose
+from src.cache import ResultCache, SpecCache
+from src.counterexample import Trace, TraceStore, SpilledTrace
+from src.watch import Watcher
+from src.batch import Batch, find_specs
+from src.matrix import refinement_order
+from src.session import SessionPool
+from src.scheduler import Scheduler
+from src.server import Server, running, MATRICES_ERROR
+from src.metrics import Metrics
+from src import operations as ops
+from src.core import parse, generate, run, slice_alphabet, write_model, variable_order
 from src.contract import Contract, Contracts
-from src.check import Compatibility, Consistency, Checks
+from src.check import Compatibility, Consistency, RefinementMatrix, Checks
+from benchmarks.generator import Generator
+from benchmarks import runner
 
 sys.path.append(os.path.join(os.getcwd(), os.path.pardir))
 
+SPEC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spec')
+NUSMV_STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nusmv_stub.py')
+
+def _contract(name, variables, assumptions, guarantees):
+    """Returns a saturated contract built from the given parameters"""
+    contract = Contract()
+    contract.add_name(name)
+    contract.add_variables(variables)
+    for assumption in assumptions:
+        contract.add_assumption(assumption)
+    for guarantee in guarantees:
+        contract.add_guarantee(guarantee)
+    contract.saturate_guarantees()
+    return contract
+
+def _captured(function, *args, **kwargs):
+    """Returns the return value and printed output of a function call"""
+    stdout, sys.stdout = sys.stdout, StringIO()
+    try:
+        return function(*args, **kwargs), sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
 class TestLibrary(unittest.TestCase):
     """TestLibrary class contains method to test LTL contract verifier operations"""
 
+    def setUp(self):
+        """Run checks against the NuSMV stand-in"""
+        self.nusmv, core.NUSMV = core.NUSMV, NUSMV_STUB
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Restore the NuSMV binary"""
+        core.NUSMV = self.nusmv
+        shutil.rmtree(self.tmpdir)
+
     def test_waiter_customer_model(self):
         """Parse waiter customer model and verify returned contracts and checks objects"""
 
@@ -66,3 +123,811 @@ class TestLibrary(unittest.TestCase):
         # parse waiter customer model
         contracts, checks = parse('tests/waiter_customer.txt')
         #run(cont)
+
+    def test_formula_hash_consing(self):
+        """Parse equal formulas written differently and verify they share one node"""
+        anode = formula.parse('G(request -> X service)')
+        bnode = formula.parse('G ( request->X service )')
+        self.assertIs(anode, bnode)
+        self.assertIs(formula.mk_and(anode, formula.parse('F request')),
+                      formula.parse('G(request -> X service) & F request'))
+        self.assertEqual(str(formula.parse('a -> b -> c')), '(a -> (b -> c))')
+        self.assertEqual(str(formula.parse('!a & b | c')), '((!a & b) | c)')
+        self.assertEqual(formula.parse('a ? b : c').op, formula.RAW)
+
+        # the table of parsed texts stays bounded across specifications
+        self.addCleanup(setattr, formula, 'PARSED_SIZE', formula.PARSED_SIZE)
+        formula.PARSED_SIZE = 8
+        for num in range(4):
+            contract = _contract('a', [('p', 'FALSE')], ['TRUE'],
+                                 ['G(p -> X q%d_%d)' % (num, index) for index in range(4)])
+            for text in contract.guarantees:
+                formula.parse(text)
+            self.assertEqual(formula.parse(contract.get_guarantees()).op, formula.AND)
+            self.assertLessEqual(len(formula._PARSED), formula.PARSED_SIZE)
+
+        # pickling keeps the structure of n-ary and raw nodes, so unpickled nodes are the same
+        node = formula.mk_or(formula.conj([formula.var('a'), formula.raw('b ? c : d'),
+                                           formula.parse('G e')]), formula.parse('F f'))
+        self.assertEqual(len(node.args[0].args), 3)
+        for protocol in range(cPickle.HIGHEST_PROTOCOL + 1):
+            self.assertIs(cPickle.loads(cPickle.dumps(node, protocol)), node)
+
+    def test_generate_defines(self):
+        """Generate a multi contract model and verify shared assumptions are defined once"""
+        contracts, checks = Contracts(), Checks()
+        library = [_contract('c' + str(i), [('a', 'FALSE'), ('b', 'FALSE')],
+                             ['(a | b) & !(a & b)'], ['G(a -> X b)']) for i in range(3)]
+        for contract in library:
+            contracts.add_contract(contract)
+        checks.add_check(Compatibility('composition', library))
+        checks.add_check(Consistency('composition', library))
+        smv_file = os.path.join(self.tmpdir, 'nusmv.smv')
+        generate(contracts, checks, smv_file, simplify=False)
+        with open(smv_file) as ifile:
+            lines = ifile.read().splitlines()
+        defines = [line for line in lines if ':=' in line and 'init(' not in line]
+        self.assertEqual(defines, ['\t_ltl_def0 := ((a | b) & !(a & b));'])
+        specs = [line for line in lines if 'LTLSPEC' in line]
+        self.assertEqual(len(specs), 2)
+        self.assertTrue(all('(a | b)' not in spec for spec in specs))
+        self.assertEqual(specs[1].count('_ltl_def0'), 3)
+
+        # define names follow the roots, not the formulas built earlier in the process
+        earlier = formula.parse('q2 | q3')
+        roots = [formula.parse('G((q0 & q1) -> (q2 | q3))'),
+                 formula.parse('F((q0 & q1) & (q2 | q3))')]
+        self.assertEqual(formula.shared(roots).values(), ['_ltl_def0', '_ltl_def1'])
+        self.assertEqual(formula.shared(roots).keys(), [formula.parse('q0 & q1'), earlier])
+
+    def test_nary_composition(self):
+        """Compose and conjoin many contracts and verify the input list is left untouched"""
+        library = [_contract('c' + str(i), [('v' + str(i), 'FALSE')], ['TRUE'],
+                             ['G(v' + str(i) + ' -> X v' + str(i) + ')']) for i in range(500)]
+        contracts = list(library)
+        comp = ops.composition(contracts)
+        conj = ops.conjunction(contracts)
+        self.assertEqual(contracts, library)
+        self.assertEqual(comp.name, '_comp_'.join(['c' + str(i) for i in range(500)]))
+        self.assertEqual(comp.variables, [('v' + str(i), 'FALSE') for i in range(500)])
+        self.assertEqual(conj.variables, comp.variables)
+        self.assertEqual(len(comp.guarantees[0].args), 500)
+        self.assertIs(comp.guarantees[0], conj.guarantees[0])
+        self.assertEqual(len(formula.nodes([ops.compatibility(comp)])), 5 * 500 + 6)
+
+        # two contracts compose exactly as the pairwise definition
+        aguarantee, bguarantee = [formula.parse(c.guarantees[0]) for c in library[:2]]
+        pair = ops.composition(library[:2])
+        self.assertIs(pair.assumptions[0],
+                      formula.mk_or(formula.mk_and(formula.true(), formula.true()),
+                                    formula.mk_not(formula.mk_and(aguarantee, bguarantee))))
+
+    def test_parallel_run(self):
+        """Run checks serially and in a worker pool and verify identical reports"""
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_file = os.path.join(self.tmpdir, 'nusmv.smv')
+        serial = _captured(run, generate(contracts, checks, smv_file, simplify=False), checks)
+        smv_files = generate(contracts, checks, smv_file, split=True, simplify=False)
+        self.assertEqual(smv_files, [os.path.join(self.tmpdir, 'nusmv_' + str(num) + '.smv')
+                                     for num in range(3)])
+        parallel = _captured(run, smv_files, checks, jobs=3)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial[0][0], [True, True, False])
+        self.assertIn('Statement is True\nExample:', serial[1])
+
+    def test_alphabet_slicing(self):
+        """Generate one model per check and verify each declares only its own variables"""
+        contracts, checks = Contracts(), Checks()
+        library = [_contract('c' + str(i), [('a' + str(i), 'FALSE'), ('b' + str(i), 'TRUE')],
+                             ['TRUE'], ['G(a' + str(i) + ' -> X b' + str(i) + ')'])
+                   for i in range(4)]
+        for contract in library:
+            contracts.add_contract(contract)
+        checks.add_check(Consistency('composition', library[:2]))
+        checks.add_check(Compatibility('conjunction', library[3:]))
+        self.assertEqual(sorted(slice_alphabet(contracts, checks.checks[0])),
+                         [('a0', 'FALSE'), ('a1', 'FALSE'), ('b0', 'TRUE'), ('b1', 'TRUE')])
+        smv_files = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'), split=True)
+        for smv_file, names in zip(smv_files, [['a0', 'a1', 'b0', 'b1'], ['a3', 'b3']]):
+            with open(smv_file) as ifile:
+                declared = [line.split(':')[0].strip() for line in ifile if ': boolean' in line]
+            self.assertEqual(sorted(declared), names)
+
+    def test_result_cache(self):
+        """Run checks twice through a result cache and verify the second run is answered from it"""
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_files = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'), split=True)
+        cache = ResultCache(os.path.join(self.tmpdir, 'cache'))
+        first = _captured(run, smv_files, checks, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        core.NUSMV = 'false' # any NuSMV run would now fail
+        second = _captured(run, smv_files, checks, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        self.assertEqual(first, second)
+
+        # the key ignores the declaration order of variables
+        with open(smv_files[0]) as ifile:
+            lines = ifile.read().splitlines()
+        swapped = os.path.join(self.tmpdir, 'swapped.smv')
+        with open(swapped, 'w') as ofile:
+            ofile.write('\n'.join(lines[:2] + lines[3:4] + lines[2:3] + lines[4:]))
+        self.assertEqual(cache.key(swapped), cache.key(smv_files[0]))
+
+        # least recently used entries are evicted past the size limit
+        cache.max_size = 1
+        cache.put('0' * 64, ([True], {}, [core.BDD_ENGINE]))
+        self.assertEqual(os.listdir(cache.directory), [])
+
+    def test_watch_update(self):
+        """Edit a watched specification and verify only the affected checks are re-run"""
+        spec_file = os.path.join(self.tmpdir, 'system.txt')
+        with open(os.path.join(SPEC_DIR, 'waiter_customer.txt')) as ifile:
+            spec = ifile.read()
+        with open(spec_file, 'w') as ofile:
+            ofile.write(spec)
+        watcher = Watcher(spec_file, os.path.join(self.tmpdir, 'nusmv.smv'))
+        self.assertEqual(len(_captured(watcher.update)[0].checks), 3)
+        self.assertEqual(len(_captured(watcher.update)[0].checks), 0)
+
+        # changing the customer contract re-runs the two checks that use it
+        with open(spec_file, 'w') as ofile:
+            ofile.write(spec.replace('G(service -> X !request)', 'G(service -> X X !request)'))
+        affected, output = _captured(watcher.update)
+        self.assertEqual([check.get_identity() for check in affected.checks],
+                         [check.get_identity() for check in parse(spec_file)[1].checks[:2]])
+        self.assertEqual(output.count('Result of checking:'), 2)
+
+        # repeated checks are counted, and a matrix is computed when its contracts change
+        with open(spec_file, 'a') as ofile:
+            ofile.write('\n\tREFINEMENT(waiter1,waiter2)\n\tREFINEMENT_MATRIX(waiter1, waiter2)\n')
+        affected, output = _captured(watcher.update)
+        self.assertEqual((len(affected.checks), len(affected.matrices), watcher.total), (0, 1, 4))
+        self.assertIn('refinement order', output)
+        self.assertEqual(len(_captured(watcher.update)[0].matrices), 0)
+
+    def test_streaming_results(self):
+        """Read a slow NuSMV run and verify results are yielded before the process exits"""
+        core.NUSMV = os.path.join(self.tmpdir, 'slow_nusmv')
+        with open(core.NUSMV, 'w') as ofile:
+            ofile.write('#!/bin/sh\necho "-- specification a  is false"\n'
+                        'echo "Trace Type: Counterexample "\necho "  -> State: 1.1 <-"\n'
+                        'echo "-- specification b  is true"\nexec sleep 30\n')
+        os.chmod(core.NUSMV, 0755)
+        start = time.time()
+        results = core.iter_run(os.path.join(self.tmpdir, 'nusmv.smv'))
+        num, result, counterexample, decider = results.next()
+        self.assertEqual((num, result, decider), (0, True, core.BDD_ENGINE))
+        self.assertEqual(counterexample.to_lines(), ['  -> State: 1.1 <-'])
+        self.assertEqual(results.next(), (1, False, None, core.BDD_ENGINE))
+        results.close()
+        self.assertLess(time.time() - start, 10)
+
+    def test_counterexample_trace(self):
+        """Parse a delta printed NuSMV lasso and verify the expanded packed trace"""
+        lines = ['  -> State: 2.1 <-', '    request = FALSE', '    service = TRUE',
+                 '  -- Loop starts here', '  -> State: 2.2 <-', '    request = TRUE',
+                 '  -> State: 2.3 <-', '    service = FALSE', '  -> State: 2.4 <-',
+                 '    service = TRUE']
+        trace = Trace.from_lines(lines)
+        self.assertEqual((len(trace), trace.loop, trace.number), (4, 1, 2))
+        self.assertEqual(trace.state(2), {'request': True, 'service': False})
+        self.assertEqual(trace.column('service'), [True, True, False, True])
+        self.assertEqual(trace.to_lines(), lines)
+        self.assertEqual(Trace.from_json(trace.to_json()), trace)
+        self.assertEqual(Trace.from_bytes(trace.to_bytes()), trace)
+
+        # rows are repacked when a state introduces a new variable
+        for num in range(20):
+            trace.set_value(3, 'v' + str(num), num % 2 == 0)
+        self.assertEqual(trace.width, 3)
+        self.assertEqual(trace.state(1)['service'], True)
+        self.assertEqual(trace.column('v18'), [False, False, False, True])
+
+    def test_session_pool(self):
+        """Run checks through pooled interactive sessions and verify each model is encoded once"""
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_file = os.path.join(self.tmpdir, 'nusmv.smv')
+        batch = _captured(run, generate(contracts, checks, smv_file, simplify=False), checks)
+        sessions = SessionPool()
+        try:
+            self.assertEqual(_captured(run, smv_file, checks, sessions=sessions), batch)
+            process = sessions.sessions.values()[0].process
+            self.assertEqual(_captured(run, smv_file, checks, sessions=sessions)[0][0],
+                             batch[0][0])
+            self.assertEqual(len(sessions.sessions), 1)
+            self.assertIs(sessions.sessions.values()[0].process, process)
+
+            # the oldest session is closed past the limit
+            sessions.limit = 1
+            smv_files = generate(contracts, checks, smv_file, split=True, simplify=False)
+            first_two = Checks()
+            for check in checks.checks[:2]:
+                first_two.add_check(check)
+            _captured(run, smv_files[:2], first_two, sessions=sessions)
+            self.assertEqual(len(sessions.sessions), 1)
+            self.assertIsNotNone(process.poll())
+
+            # copies of a model with the same variable order share a session
+            copies = [os.path.join(self.tmpdir, name + '.smv') for name in ('left', 'right')]
+            for copy in copies:
+                shutil.copy(smv_files[0], copy)
+                shutil.copy(core.order_file(smv_files[0]), core.order_file(copy))
+            sessions.limit = 2
+            first, second = [sessions.get(core.NUSMV, copy, ['-i', core.order_file(copy)])[0]
+                             for copy in copies]
+            self.assertIs(first, second)
+        finally:
+            sessions.close()
+        self.assertFalse(os.path.isdir(sessions.directory))
+
+    def test_native_engine(self):
+        """Check models with the native engine and verify verdicts and lasso counterexamples"""
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_files = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'), split=True)
+        core.NUSMV = 'false' # any NuSMV run would now fail
+        results, counterexamples = _captured(run, smv_files, checks,
+                                             engine=core.NATIVE_ENGINE)[0]
+        self.assertEqual(results, [True, True, False])
+        for trace in counterexamples.values():
+            self.assertLess(trace.loop, len(trace))
+
+        # the counterexample of G(a -> X b) reaches a state with a followed by one without b
+        smv_file = os.path.join(self.tmpdir, 'native.smv')
+        with open(smv_file, 'w') as ofile:
+            ofile.write('MODULE main\nVAR\n\ta: boolean;\n\tb: boolean;\nASSIGN\n'
+                        '\tinit(a) := FALSE;\n\tinit(b) := TRUE;\n'
+                        '\tLTLSPEC G (a -> X b);\n\tLTLSPEC a -> X b;\n')
+        (first, trace, _), second = list(core.iter_check(smv_file, core.NATIVE_ENGINE))
+        self.assertEqual((first, second), (True, (False, None, core.NATIVE_ENGINE)))
+        self.assertEqual(trace.column('a')[0], False)
+        states = [trace.state(num) for num in range(len(trace))] + [trace.state(trace.loop)]
+        self.assertTrue(any([state['a'] and not following['b']
+                             for state, following in zip(states, states[1:])]))
+
+        # past time operators fall back to NuSMV
+        core.NUSMV = NUSMV_STUB
+        with open(smv_file, 'a') as ofile:
+            ofile.write('\tLTLSPEC G (b -> Y a);\n')
+        self.assertEqual([output[0] for output in core.iter_check(smv_file, core.NATIVE_ENGINE)],
+                         [False, False, False])
+
+    def test_portfolio_race(self):
+        """Race the BDD and bounded engines and verify which one decides each check"""
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_files = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'), split=True,
+                             simplify=False)
+        (results, counterexamples), output = _captured(run, smv_files, checks,
+                                                       engine=core.PORTFOLIO_ENGINE)
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(output.count('Decided by: '), 3)
+        self.assertIn('Decided by: bdd', output)
+
+        # results cached by a plain NuSMV run still name the engine which decided them
+        cache = ResultCache(os.path.join(self.tmpdir, 'cache'))
+        _captured(run, smv_files, checks, cache=cache)
+        output = _captured(run, smv_files, checks, cache=cache, engine=core.PORTFOLIO_ENGINE)[1]
+        self.assertEqual(cache.hits, 3)
+        self.assertNotIn('Decided by: None', output)
+
+        # a slow BDD run loses every refuted check to the bounded run and is killed
+        core.NUSMV = os.path.join(self.tmpdir, 'slow_nusmv')
+        with open(core.NUSMV, 'w') as ofile:
+            ofile.write('#!/bin/sh\ncase "$1" in -bmc) exec "%s" "$@";; esac\nexec sleep 30\n'
+                        % NUSMV_STUB)
+        os.chmod(core.NUSMV, 0755)
+        start = time.time()
+        outputs = core.race(smv_files[0])
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual([(result, decider) for result, _, decider in outputs],
+                         [(True, core.BMC_ENGINE)])
+
+    def test_benchmark_generator(self):
+        """Generate a synthetic system and verify it parses and is compared against a baseline"""
+        generator = Generator(contracts=3, alphabet=5, guarantees=2, depth=2, sharing=0.4)
+        spec_file = os.path.join(self.tmpdir, 'system.spec')
+        generator.write(spec_file)
+        contracts, checks = parse(spec_file)
+        self.assertEqual(sorted(contracts.get_contracts()), ['c0', 'c1', 'c2'])
+        self.assertEqual(len(checks.checks), 6)
+        self.assertEqual(len(contracts.get_alphabet()), 5)
+        for contract in contracts.get_contracts().values():
+            self.assertEqual(len(contract.guarantees), 2)
+            self.assertEqual([name for name, _ in contract.variables[:2]], ['v0', 'v1'])
+
+        metrics = runner.measure(generator, self.tmpdir, checking=False)
+        self.assertEqual((metrics['checks'], metrics['variables'], metrics['run_seconds']),
+                         (6, 5, None))
+        self.assertEqual(runner.compare({'case': metrics}, {'case': metrics}), [])
+        grown = dict(metrics, smv_bytes=metrics['smv_bytes'] * 2)
+        self.assertEqual(len(runner.compare({'case': grown}, {'case': metrics})), 1)
+        self.assertEqual(runner.compare({'case': metrics}, {'case': grown}), [])
+
+    def test_run_metrics(self):
+        """Run checks with a metrics object and verify phase times and per check costs"""
+        metrics = Metrics()
+        contracts, checks = metrics.timed('parse', parse,
+                                          os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_files = metrics.timed('generate', generate, contracts, checks,
+                                  os.path.join(self.tmpdir, 'nusmv.smv'), split=True,
+                                  simplify=False)
+        _captured(metrics.timed, 'run', run, smv_files, checks, metrics=metrics)
+        self.assertEqual(metrics.phases.keys(), ['parse', 'generate', 'run'])
+        self.assertEqual([afile['checks'] for afile in metrics.files], [[0], [1], [2]])
+        for afile in metrics.files:
+            self.assertEqual(afile['variables'], 2)
+            self.assertGreater(afile['cpu_seconds'], 0)
+            self.assertGreater(afile['max_rss_kb'], 0)
+        self.assertEqual([check['counterexample_length'] for check in metrics.checks],
+                         [2, 2, None])
+        self.assertEqual(metrics.checks[2]['contracts'], ['waiter1', 'waiter2'])
+        spec = checks.checks[0].get_formula()
+        self.assertEqual(metrics.checks[0]['spec_nodes'], len(formula.nodes([spec])))
+
+        # the sizes are those of the simplified specification NuSMV checks
+        smv_files = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'), split=True)
+        metrics = Metrics()
+        _captured(run, smv_files, checks, metrics=metrics)
+        spec = formula.simplify(checks.checks[0].get_formula())
+        self.assertEqual(smv_files.formulas[0], spec)
+        self.assertEqual(metrics.checks[0]['spec_length'], len(formula.to_str(spec)))
+
+        metrics_file = os.path.join(self.tmpdir, 'metrics.json')
+        metrics.write(metrics_file)
+        with open(metrics_file) as ifile:
+            self.assertEqual(json.load(ifile)['checks'][1]['result'], True)
+
+    def test_parse_errors(self):
+        """Parse malformed specifications and verify line numbered errors and the alphabet index"""
+        specfile = os.path.join(self.tmpdir, 'spec.txt')
+        def parsed(text):
+            with open(specfile, 'w') as ofile:
+                ofile.write(text)
+            return parse(specfile)
+
+        contract = 'CONTRACT:\n\tNAME:\n\t\t%s\n\tVARIABLES:\n\t\tx := %s\n\t\ty := FALSE\n' \
+                   '\tASSUMPTIONS:\n\t\tTRUE\n\tGUARANTEES:\n\t\tG(x -> X y)\n'
+        contracts, checks = parsed(contract % ('NAMES', 'FALSE') + contract % ('b', 'FALSE') +
+                                   'CHECKS:\n\tREFINEMENT(NAMES, b)\n')
+        self.assertEqual(contracts.get_alphabet(), [('x', 'FALSE'), ('y', 'FALSE')])
+        self.assertTrue('NAMES' in contracts)
+        self.assertEqual(checks.checks[0].contracts.keys(), ['NAMES', 'b'])
+
+        with self.assertRaises(core.ParseError) as error:
+            parsed(contract % ('a', 'FALSE') + contract % ('b', 'TRUE'))
+        self.assertEqual(error.exception.lineno, 11)
+        with self.assertRaises(core.ParseError) as error:
+            parsed(contract % ('a', 'FALSE') + 'CHECKS:\n\tREFINEMENT(a, c)\n')
+        self.assertEqual(error.exception.lineno, 12)
+        with self.assertRaises(core.ParseError) as error:
+            parsed(contract % ('a', 'FALSE') + '\tINPUTS:\n')
+        self.assertEqual(error.exception.lineno, 11)
+
+        # headers containing a header name are accepted as in the original format
+        contracts, _ = parsed((contract % ('a', 'FALSE')).replace('CONTRACT:', 'CONTRACTS:'))
+        self.assertTrue('a' in contracts)
+        for init, message in [('TRUE', 'x is declared twice'),
+                              ('FALSE', 'x is declared twice, initialized to TRUE and FALSE')]:
+            with self.assertRaises(core.ParseError) as error:
+                parsed(contract.replace('y := FALSE', 'x := ' + init) % ('a', 'TRUE'))
+            self.assertEqual(error.exception.lineno, 6)
+            self.assertTrue(message in str(error.exception))
+
+    def test_spec_include_cache(self):
+        """Include a contract library and verify parsed files are loaded from the spec cache"""
+        with open(os.path.join(SPEC_DIR, 'waiter_customer.txt')) as ifile:
+            library, system = ifile.read().split('CHECKS:')
+        with open(os.path.join(self.tmpdir, 'library.txt'), 'w') as ofile:
+            ofile.write(library)
+        spec_file = os.path.join(self.tmpdir, 'system.txt')
+        with open(spec_file, 'w') as ofile:
+            ofile.write('INCLUDE: library.txt\nCHECKS:' + system)
+        expected = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+
+        cache = SpecCache(os.path.join(self.tmpdir, 'specs'))
+        self.assertEqual(parse(spec_file, cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(parse(spec_file, cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        self.assertEqual(core.includes(spec_file), [os.path.join(self.tmpdir, 'library.txt')])
+
+        # editing the library invalidates the library and every file including it
+        with open(os.path.join(self.tmpdir, 'library.txt'), 'w') as ofile:
+            ofile.write(library.replace('G(service -> X !request)', 'G(service -> X X !request)'))
+        contracts, _ = parse(spec_file, cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        self.assertTrue('X X !request' in contracts.get_contract('customer').get_guarantees())
+
+        with open(os.path.join(self.tmpdir, 'library.txt'), 'a') as ofile:
+            ofile.write('INCLUDE: system.txt\n')
+        with self.assertRaises(core.ParseError) as error:
+            parse(spec_file)
+        self.assertTrue('circular include' in str(error.exception))
+        self.assertRaises(core.ParseError, core.includes, spec_file)
+
+    def test_batch_run(self):
+        """Check a directory of specifications in one batch and verify the streamed records"""
+        spec_dir = os.path.join(self.tmpdir, 'specs')
+        shutil.copytree(SPEC_DIR, spec_dir)
+        with open(os.path.join(spec_dir, 'broken.txt'), 'w') as ofile:
+            ofile.write('CHECKS:\n\tREFINEMENT(a, b)\n')
+        specfiles = find_specs([spec_dir, os.path.join(spec_dir, '*.txt')])
+        self.assertEqual([os.path.basename(afile) for afile in specfiles],
+                         ['broken.txt', 'train_door.txt', 'waiter_customer.txt'])
+
+        output = StringIO()
+        batch = Batch(specfiles, os.path.join(self.tmpdir, 'work'), jobs=2)
+        self.assertEqual(batch.run(output), 2)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertTrue('unknown contract a' in records[0]['error'])
+        self.assertEqual([os.path.basename(record['spec']) for record in records[1:]],
+                         ['train_door.txt'] + ['waiter_customer.txt'] * 3)
+        self.assertEqual(records[-1]['check'], str(parse(specfiles[2])[1].checks[2]))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, 'work'))),
+                         ['1_train_door', '2_waiter_customer'])
+        self.assertEqual(batch.summary['checks'], 4)
+        self.assertEqual(batch.summary['passed'] + batch.summary['failed'], 4)
+        self.assertEqual(batch.summary['errors'], 1)
+
+        # a refinement matrix gets one record per ordered pair of its contracts
+        with open(os.path.join(SPEC_DIR, 'waiter_customer.txt')) as ifile:
+            library = ifile.read().split('CHECKS:')[0]
+        matrix_file = os.path.join(self.tmpdir, 'matrix.txt')
+        with open(matrix_file, 'w') as ofile:
+            ofile.write(library + 'CHECKS:\n\tREFINEMENT_MATRIX(waiter1, waiter2, customer)\n')
+        output = StringIO()
+        batch = Batch([matrix_file], os.path.join(self.tmpdir, 'matrix'))
+        self.assertNotEqual(batch.run(output), 2)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[0]['check'], str(parse(matrix_file)[1].matrices[0].get_pair(
+            'waiter1', 'waiter2')))
+        self.assertEqual(batch.summary['checks'], 6)
+
+    def test_refinement_order(self):
+        """Compute the refinement order of a contract chain and verify implied pairs are skipped"""
+        contracts = Contracts()
+        for name, guarantee in [('a', 'G(x)'), ('b', 'F(x)'), ('c', 'TRUE'), ('d', 'TRUE')]:
+            contracts.add_contract(_contract(name, [('x', 'FALSE')], ['TRUE'], [guarantee]))
+        matrix = RefinementMatrix(contracts.get_contracts().values())
+        smv_file = os.path.join(self.tmpdir, 'nusmv.smv')
+        self.assertRaises(ValueError, matrix.get_ltl)
+        self.assertIn('LTLSPEC', matrix.get_pair('a', 'b').get_ltl())
+
+        order = refinement_order(contracts, matrix, smv_file, engine=core.NATIVE_ENGINE,
+                                 witnesses=False)
+        self.assertEqual(order.classes(), [['a'], ['b'], ['c', 'd']])
+        self.assertEqual(order.hasse(), [('a', 'b'), ('b', 'c')])
+        self.assertTrue(order.refines[('a', 'd')])
+        self.assertFalse(order.refines[('d', 'a')])
+        self.assertEqual(order.checked + len(order.implied), 12)
+        self.assertLess(order.checked, 12)
+        for pair, refines in order.refines.items():
+            if not refines and pair not in order.implied:
+                self.assertTrue(pair in order.counterexamples)
+
+        # with witnesses every non-refining pair gets its own counterexample
+        order = refinement_order(contracts, matrix, smv_file, engine=core.NATIVE_ENGINE)
+        self.assertEqual(sorted(order.counterexamples.keys()),
+                         sorted([pair for pair, refines in order.refines.items() if not refines]))
+
+        # a variable only another contract declares is still declared by the models
+        contracts.add_contract(_contract('e', [('y', 'FALSE')], ['TRUE'], ['TRUE']))
+        contracts.add_contract(_contract('f', [('x', 'FALSE')], ['TRUE'], ['G(x | y)']))
+        matrix = RefinementMatrix([contracts.get_contracts()[name] for name in ['a', 'f']])
+        order = refinement_order(contracts, matrix, smv_file, engine=core.NATIVE_ENGINE)
+        self.assertTrue(order.refines[('a', 'f')])
+        with open(os.path.join(self.tmpdir, 'nusmv_matrix_0_0.smv')) as ifile:
+            self.assertIn('\ty: boolean;', ifile.read())
+
+    def test_sat_solver(self):
+        """Decide G and F state checks with the SAT solver and verify NuSMV is not run"""
+        solver = sat.Solver()
+        avar, bvar = solver.new_var(), solver.new_var()
+        for clause in [[avar, bvar], [-avar, bvar], [avar, -bvar]]:
+            solver.add_clause(clause)
+        self.assertEqual(solver.solve(), {avar: True, bvar: True})
+        self.assertIsNone(solver.solve([-bvar]))
+        solver.add_clause([-avar, -bvar])
+        self.assertIsNone(solver.solve())
+
+        smv_file = os.path.join(self.tmpdir, 'nusmv.smv')
+        write_model(smv_file, [('a', 'FALSE'), ('b', 'TRUE')],
+                    [formula.parse('G (a -> b)'), formula.parse('F a -> G b'),
+                     formula.parse('b | F !b')])
+        core.NUSMV = 'false' # any NuSMV run would now fail
+        results = list(core.iter_check(smv_file))
+        self.assertEqual([result for result, _, _ in results], [True, True, False])
+        self.assertEqual([decider for _, _, decider in results], [core.SAT_ENGINE] * 3)
+        trace = results[0][1]
+        self.assertEqual((trace.engine, trace.loop, trace.state(1)['a'], trace.state(1)['b']),
+                         (core.SAT_ENGINE, 1, True, False))
+        self.assertEqual(results[1][1].number, 2)
+
+    def test_scheduler(self):
+        """Run the checks of concurrent requests through one scheduler and cancel one of them"""
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        scheduler = Scheduler(jobs=2, cache=ResultCache(os.path.join(self.tmpdir, 'cache')))
+        first = scheduler.submit(contracts, checks, os.path.join(self.tmpdir, 'first.smv'), 1)
+        second = scheduler.submit(contracts, checks, os.path.join(self.tmpdir, 'second.smv'))
+        self.assertEqual(len(scheduler.handles()), 2) # the files are generated by a task each
+        self.assertFalse(first.done() or first.smvfiles)
+        while first.smvfiles is None or second.smvfiles is None:
+            scheduler.step()
+        self.assertEqual(len(scheduler.handles()), 2) # one process each, the first run is limited
+        results = sorted([(num, result) for num, _, result, _ in first])
+        self.assertEqual(results, [(0, True), (1, True), (2, False)])
+        self.assertTrue(first.done() and not first.cancelled)
+
+        second.cancel()
+        self.assertEqual((scheduler.handles(), scheduler.runs, second.cancelled), ([], [], True))
+        core.NUSMV = 'false' # every result is now cached
+        hits = scheduler.cache.hits
+        third = scheduler.submit(contracts, checks, os.path.join(self.tmpdir, 'third.smv'))
+        self.assertEqual([result for _, _, result, _ in third], [True, True, False])
+        self.assertEqual(scheduler.cache.hits, hits + 3) # looked up by the task
+        task = scheduler.spawn(parse, 'missing.txt')
+        while not task.done():
+            scheduler.step()
+        self.assertEqual((task.output, task.error.errno), (None, 2))
+
+    def test_check_server(self):
+        """Answer spec file, spec text and JSON requests from memory and refuse a full queue"""
+        def exchange(payloads):
+            """Sends every request at once and steps the server until all are answered"""
+            socks, responses = [], [''] * len(payloads)
+            for payload in payloads:
+                socks.append(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+                socks[-1].connect(path)
+                socks[-1].sendall(json.dumps(payload) + '\n')
+            pending = range(len(socks))
+            while pending:
+                server.step(0.05)
+                for num in list(pending):
+                    if select.select([socks[num]], [], [], 0)[0]:
+                        data = socks[num].recv(65536)
+                        responses[num] += data
+                        if not data:
+                            socks[num].close()
+                            pending.remove(num)
+            return [json.loads(response) for response in responses]
+
+        path = os.path.join(self.tmpdir, 'checker.sock')
+        server = Server(path, jobs=2, cache=ResultCache(None, memory=64),
+                        spec_cache=SpecCache(None, memory=64), active=1, queue_size=1)
+        server.listen()
+        self.assertTrue(running(path))
+        specfile = os.path.join(SPEC_DIR, 'waiter_customer.txt')
+        with open(specfile) as ifile:
+            text = ifile.read()
+        contract = {'name': 'a', 'variables': {'p': 'FALSE'}, 'guarantees': ['G !p']}
+        first, second, busy = exchange([{'spec': specfile}, {'spec': specfile, 'text': text},
+                                        {'contracts': [contract], 'checks': []}])
+        self.assertEqual([record['verdict'] for record in first['checks']], [True, True, True])
+        self.assertEqual(first['checks'][2]['check'], str(parse(specfile)[1].checks[2]))
+        self.assertEqual(second, first)
+        self.assertTrue(busy['error'].startswith('busy'))
+
+        core.NUSMV = 'false' # answered from the caches in memory
+        json_checks, broken, stats = exchange([{'contracts': [contract],
+                                                'checks': ['CONSISTENCY_COMP(a)']},
+                                               {'spec': 'x', 'text': 'x'}, {'command': 'stats'}])
+        self.assertEqual(json_checks['checks'][0]['verdict'], True)
+        self.assertEqual(broken['error'], 'x:1: unexpected file heading x')
+        self.assertEqual((stats['specs']['hits'], stats['results']['hits']), (1, 3))
+        matrix = exchange([{'contracts': [contract, dict(contract, name='b')],
+                            'checks': ['REFINEMENT_MATRIX(a, b)']}])[0]
+        self.assertEqual(matrix['error'], MATRICES_ERROR)
+        self.assertEqual(exchange([{'command': 'shutdown'}]), [{'stopped': True}])
+        server.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_trace_spill(self):
+        """Spill traces past the memory budget and read their states back on demand"""
+        trace = Trace(['v' + str(num) for num in range(20)])
+        for state in range(30):
+            trace.add_state(dict([('v' + str(num), (num + state) % 3 == 0) for num in range(20)]))
+        trace.loop, trace.number = 4, 2
+        store = TraceStore(os.path.join(self.tmpdir, 'nusmv.traces'), len(trace.rows))
+        self.assertIs(store.keep(0, trace), trace)
+        self.assertIs(store.keep(2, trace), trace) # kept again without counting it twice
+        spilled = store.keep(1, Trace.from_bytes(trace.to_bytes()))
+        self.assertTrue(isinstance(spilled, SpilledTrace))
+        self.assertIs(store.keep(3, spilled), spilled)
+        self.assertEqual(sorted(store.index.keys()), [1, 3])
+        self.assertEqual((len(spilled), spilled.loop, spilled.number), (30, 4, 2))
+        self.assertEqual(spilled.state(17), trace.state(17))
+        self.assertEqual(spilled.column('v5'), trace.column('v5'))
+        self.assertEqual(spilled.to_lines(), trace.to_lines())
+        self.assertEqual(len([line for line in spilled.to_lines(3) if 'State' in line]), 3)
+        with open(store.path, 'rb') as ifile:
+            ifile.seek(spilled.offset(7))
+            self.assertEqual(bytearray(ifile.read(spilled.width)), trace.rows[7 * 3:8 * 3])
+        store.close()
+        self.assertEqual(store.get(1).state(-1), trace.state(-1)) # the file is kept on disk
+        self.assertIsNone(store.get(0))
+        store.close()
+
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_files = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'), split=True)
+        store = TraceStore(os.path.join(self.tmpdir, 'run.traces'), 0)
+        (results, counterexamples), output = _captured(run, smv_files, checks, traces=store)
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(sorted(store.index.keys()), sorted(counterexamples.keys()))
+        self.assertEqual(counterexamples[1].state(0), {'request': False, 'service': False})
+        self.assertEqual(output, _captured(run, smv_files, checks)[1])
+        store.close()
+
+        # past the budget a counterexample is parsed straight to the file, widened as it grows
+        lines = ['-- specification G x  is false', 'Trace Type: Counterexample ',
+                 '  -> State: 1.1 <-', '    x = TRUE', '  -- Loop starts here',
+                 '  -> State: 1.2 <-'] + ['    w%d = TRUE' % num for num in range(9)] + \
+                ['  -> State: 1.3 <-', '    x = FALSE']
+        expected = core.iter_results(lines).next()[1]
+        store = TraceStore(os.path.join(self.tmpdir, 'parsed.traces'), 0)
+        result, writer = core.iter_results(lines, store).next()
+        self.assertFalse(isinstance(writer, SpilledTrace) or len(writer.rows) > writer.width)
+        spilled = store.keep(0, writer)
+        self.assertEqual((result, spilled.to_lines(), spilled.loop),
+                         (True, expected.to_lines(), 1))
+        store.close()
+
+        # a cache in memory holds the handles of spilled counterexamples
+        store = TraceStore(os.path.join(self.tmpdir, 'cached.traces'), 0)
+        cache = ResultCache(None, memory=8)
+        _captured(run, smv_files, checks, cache=cache, traces=store)
+        cached = [trace for _, traces, _ in cache._entries.values() for trace in traces.values()]
+        self.assertEqual(len(cached), 2)
+        self.assertTrue(all([isinstance(trace, SpilledTrace) for trace in cached]))
+        store.close()
+
+    def test_variable_order(self):
+        """Declare variables used together next to each other and pass the order file to NuSMV"""
+        contracts, checks = Contracts(), Checks()
+        first = _contract('first', [(var, 'FALSE') for var in 'abcd'], ['TRUE'],
+                          ['G(a -> X c)', 'G(c | d)'])
+        second = _contract('second', [('c', 'FALSE'), ('d', 'FALSE')], ['TRUE'], ['G(c -> d)'])
+        contracts.add_contract(first)
+        contracts.add_contract(second)
+        checks.add_check(Consistency('composition', [first, second]))
+        self.assertEqual([var for var, _ in variable_order(contracts.get_alphabet(),
+                                                           [first, second])], list('cdab'))
+
+        smv_file, = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'))
+        with open(smv_file) as ifile:
+            declared = [line.split(':')[0].strip() for line in ifile if ': boolean' in line]
+        with open(core.order_file(smv_file)) as ifile:
+            self.assertEqual(ifile.read().split(), declared)
+        self.assertEqual(declared, list('cdab'))
+        self.assertEqual(core.nusmv_command(smv_file),
+                         [NUSMV_STUB, '-i', core.order_file(smv_file), smv_file])
+        core.DYNAMIC_REORDERING = True
+        try:
+            self.assertEqual(core.nusmv_command(smv_file)[3], '-dynamic')
+        finally:
+            core.DYNAMIC_REORDERING = False
+        self.assertEqual(len(_captured(run, smv_file, checks)[0][0]), 1)
+
+        generate(contracts, checks, smv_file, order=False)
+        self.assertFalse(os.path.exists(core.order_file(smv_file)))
+        self.assertEqual(core.nusmv_command(smv_file), [NUSMV_STUB, smv_file])
+
+    def test_spec_dedupe(self):
+        """Check duplicate specifications once and report their verdict to every check"""
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        waiter, customer = checks.checks[1].contracts.values()
+        checks.add_check(Consistency('composition', [customer, waiter]))
+        checks.add_check(checks.checks[2])
+        smv_file = os.path.join(self.tmpdir, 'nusmv.smv')
+
+        serial = generate(contracts, checks, smv_file, simplify=False)
+        self.assertEqual((serial.specs, serial.duplicates), ([0, 1, 2, 1, 2], 2))
+        with open(smv_file) as ifile:
+            self.assertEqual(len([line for line in ifile if line.strip().startswith('LTLSPEC')]), 3)
+        (results, counterexamples), output = _captured(run, serial, checks)
+        self.assertEqual(results, [True, True, False, True, False])
+        self.assertEqual(counterexamples[3].state(0), counterexamples[1].state(0))
+        self.assertRaises(ValueError, run, smv_file, checks) # no mapping for the duplicates
+
+        split = generate(contracts, checks, smv_file, split=True, simplify=False)
+        self.assertEqual((split[3], split[4]), (split[1], split[2]))
+        metrics = Metrics()
+        self.assertEqual(_captured(run, split, checks, metrics=metrics)[1], output)
+        self.assertEqual([entry['duplicate'] for entry in metrics.files],
+                         [False, False, False, True, True])
+        self.assertEqual(len(generate(contracts, checks, smv_file, simplify=False,
+                                      dedupe=False).specs), 5)
+        self.assertEqual(_captured(run, smv_file, checks)[0][0], results)
+
+        spec_dir = os.path.join(self.tmpdir, 'specs')
+        os.mkdir(spec_dir)
+        for name in ('first.txt', 'second.txt'):
+            shutil.copy(os.path.join(SPEC_DIR, 'waiter_customer.txt'), os.path.join(spec_dir, name))
+        batch = Batch(find_specs([spec_dir]), os.path.join(self.tmpdir, 'work'))
+        batch.run(StringIO())
+        self.assertEqual((batch.summary['checks'], batch.summary['duplicates']), (6, 3))
+
+    def test_compositional_check(self):
+        """Check compositions of independent groups of contracts group by group"""
+        contracts, checks = Contracts(), Checks()
+        library = [_contract('c' + str(i), [('a' + str(i), 'FALSE'), ('b' + str(i), 'TRUE')],
+                             ['F a' + str(i)], ['G(a' + str(i) + ' -> X b' + str(i) + ')'])
+                   for i in range(2)]
+        library.append(_contract('c2', [('a0', 'FALSE'), ('d2', 'FALSE')], ['TRUE'], ['G d2']))
+        for num, guarantee in [(3, '!b3'), (4, 'b4')]: # c3 always holds, c4 fails at once
+            library.append(_contract('c' + str(num), [('b' + str(num), 'FALSE')], ['FALSE'], []))
+            library[-1].guarantees = [guarantee]
+        for contract in library:
+            contracts.add_contract(contract)
+        for check in [Consistency('composition', library[:3]),
+                      Compatibility('composition', library[:2]),
+                      Compatibility('conjunction', library[:2]),
+                      Compatibility('composition', [library[0], library[3]]),
+                      Compatibility('composition', [library[0], library[4]])]:
+            checks.add_check(check)
+        self.assertEqual([[contract.name for contract in group]
+                          for group in compose.components(checks.checks[0])],
+                         [['c0', 'c2'], ['c1']])
+        self.assertEqual([compose.decomposable(check) for check in checks.checks],
+                         [True, True, False, True, True])
+
+        smv_file = os.path.join(self.tmpdir, 'nusmv.smv')
+        monolithic = _captured(run, generate(contracts, checks, smv_file), checks)[0][0]
+        decided = compose.decompose(contracts, checks, smv_file, jobs=2)
+        self.assertEqual(sorted(decided), [0, 1, 3, 4])
+        self.assertEqual([decided[0][0], decided[1][0]], monolithic[:2])
+        self.assertEqual([decided[num][0] for num in sorted(decided)], [True, True, False, True])
+        self.assertIsNone(decided[3][1])
+        self.assertEqual(set([decided[num][2] for num in decided]), set([core.COMPOSE_ENGINE]))
+        with open(os.path.join(self.tmpdir, 'nusmv_0_comp_1.smv')) as ifile:
+            declared = [line.split(':')[0].strip() for line in ifile if ': boolean' in line]
+        self.assertEqual(sorted(declared), ['a1', 'b1'])
+        trace = decided[0][1]
+        self.assertEqual((len(trace), trace.loop), (2, 0))
+        self.assertEqual(trace.state(0), {'a0': False, 'b0': True, 'd2': False,
+                                          'a1': False, 'b1': True})
+        self.assertEqual(decided[4][1].state(0), {'a0': False, 'b0': True, 'b4': False})
+
+        smv_files = generate(contracts, checks, smv_file, split=True, exclude=decided)
+        self.assertEqual((len(smv_files), smv_files.specs), (1, [None, None, 0, None, None]))
+        results, output = _captured(run, smv_files, checks, decided=decided)
+        self.assertEqual(results[0], monolithic[:3] + [False, True])
+        self.assertEqual(output.count('Result of checking'), 5)
+
+        # lassos of different prefixes and loops run side by side until both loop together
+        first, second = Trace(['x']), Trace(['y'])
+        for value in (False, True, False, True):
+            first.add_state({'x': value})
+        for value in (True, False, False, True):
+            second.add_state({'y': value})
+        first.loop, second.loop = 1, 0
+        stitched = compose.stitch([(first, ['x']), (second, ['y'])])
+        self.assertEqual((len(stitched), stitched.loop), (8, 1))
+        self.assertEqual(stitched.column('x'), [False, True, False, True] * 2)
+        self.assertEqual(stitched.column('y'), [True, False, False] * 2 + [True, False])
+
+    def test_simplify(self):
+        """Simplify saturated checks and verify constant checks are decided without NuSMV"""
+        for text, expected in [('((TRUE) -> G(a))', 'G a'), ('!(TRUE & TRUE)', 'FALSE'),
+                               ('G G a & X TRUE', 'G a'), ('!!a | (b | a) | FALSE', '(a | b)'),
+                               ('!G !a', 'F a'), ('a & b & !a', 'FALSE'), ('a U FALSE', 'FALSE'),
+                               ('(a -> FALSE) <-> TRUE', '!a'), ('Y a ? b : c', '(Y a ? b : c)')]:
+            self.assertEqual(formula.to_str(formula.simplify(formula.parse(text))), expected)
+
+        contracts, checks = parse(os.path.join(SPEC_DIR, 'waiter_customer.txt'))
+        smv_files = generate(contracts, checks, os.path.join(self.tmpdir, 'nusmv.smv'), split=True)
+        with open(smv_files[0]) as ifile:
+            self.assertIn('LTLSPEC FALSE;', ifile.read())
+        core.NUSMV = 'false' # any NuSMV run would now fail
+        (first, trace, decider), = list(core.iter_check(smv_files[0]))
+        self.assertEqual((first, trace.loop, decider), (True, 0, core.SIMPLIFIER_ENGINE))
+        self.assertEqual(trace.state(0), {'request': False, 'service': False})
+        core.NUSMV = NUSMV_STUB
+        results = _captured(run, smv_files, checks)[0][0]
+        self.assertEqual(results, [True, True, False])
+        output = _captured(run, smv_files, checks, engine=core.PORTFOLIO_ENGINE)[1]
+        deciders = [line for line in output.splitlines() if line.startswith('Decided by')]
+        self.assertEqual(deciders[0], 'Decided by: simplifier')
+        # either NuSMV engine may win the race against the stub
+        self.assertEqual(len(deciders), 3)
+        for line in deciders[1:]:
+            self.assertIn(line, ['Decided by: bdd', 'Decided by: bmc'])